@@ -0,0 +1,216 @@
+# Copyright 2014 Max Sharples
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Run many jobs from one process, several at a time.
+
+The jobs are listed in a YAML manifest:
+
+    concurrency:
+      local: 2
+      emr: 4
+    jobs:
+      - job: reports.daily:DailyEmailCounts
+        input: s3://bucket/emails/
+        runner: emr
+        args: [--pool-clusters, --ec2-instance-type, m3.xlarge]
+      - job: jobs/busy_days.py
+        input: /data/emails.csv
+        name: busy-days
+
+`job` is a module and HiveJob class (`module:Class`), or a Python file
+and optionally the class in it. `args` are the job's command-line
+options. Each runner runs at most its `concurrency` jobs at once.
+"""
+import os
+import time
+import logging
+import threading
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+
+import six
+import yaml
+
+from apiarist.runner import get_runner_class
+
+logger = logging.getLogger(__name__)
+
+# jobs run at once for a runner with no concurrency given
+DEFAULT_CONCURRENCY = 1
+
+# job states, in the order they are reported
+STATES = ('QUEUED', 'RUNNING', 'COMPLETED', 'FAILED')
+
+
+class ManifestError(Exception):
+    pass
+
+
+def _load_module(path):
+    """Import a Python file as a module"""
+    name = os.path.splitext(os.path.basename(path))[0].replace('-', '_')
+    if six.PY2:
+        import imp
+        return imp.load_source(name, path)
+    import importlib.util
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_job_class(spec):
+    """The HiveJob class named by `module:Class`, `path.py:Class`
+    or `path.py` (if the file defines one HiveJob class)
+    """
+    from apiarist.job import HiveJob
+    location, _, class_name = spec.partition(':')
+    try:
+        if location.endswith('.py'):
+            module = _load_module(location)
+        else:
+            module = importlib.import_module(location)
+    except (ImportError, IOError, OSError) as e:
+        raise ManifestError("can't load job '{0}': {1}".format(spec, e))
+    if class_name:
+        try:
+            return getattr(module, class_name)
+        except AttributeError:
+            raise ManifestError("no class '{0}' in {1}".format(
+                class_name, location))
+    classes = [obj for obj in vars(module).values()
+               if isinstance(obj, type) and issubclass(obj, HiveJob) and
+               obj.__module__ == module.__name__]
+    if len(classes) != 1:
+        raise ManifestError("{0} defines {1} HiveJob classes; name one "
+                            "as {0}:Class".format(location, len(classes)))
+    return classes[0]
+
+
+class BatchJob(object):
+    """One job from the manifest, and how its run went"""
+
+    def __init__(self, job, input, runner='local', args=None, name=None):
+        self.job = job
+        self.input = input
+        self.runner = runner
+        self.args = [str(arg) for arg in args or []]
+        self.name = name or job
+        self.job_class = None
+        self.state = 'QUEUED'
+        self.job_id = None
+        self.seconds = None
+        self.error = None
+
+    def command_line(self):
+        """The job's arguments, as on the command line"""
+        return [self.input, '-r', self.runner] + self.args
+
+    def run(self):
+        runner = self.job_class(args=self.command_line()).launch()
+        self.job_id = runner.job_id
+
+
+def load_manifest(path):
+    """The jobs and the concurrency of each runner in a manifest
+    """
+    with open(path) as f:
+        manifest = yaml.safe_load(f) or {}
+    jobs = []
+    for i, entry in enumerate(manifest.get('jobs') or []):
+        if not isinstance(entry, dict) or 'job' not in entry or \
+                'input' not in entry:
+            raise ManifestError("job {0} in {1} needs a 'job' and an "
+                                "'input'".format(i + 1, path))
+        unknown = set(entry) - set(['job', 'input', 'runner', 'args',
+                                    'name'])
+        if unknown:
+            raise ManifestError("job {0} in {1} has unknown keys: "
+                                "{2}".format(i + 1, path,
+                                             ", ".join(sorted(unknown))))
+        jobs.append(BatchJob(**entry))
+    if not jobs:
+        raise ManifestError("{0} lists no jobs".format(path))
+    concurrency = dict((name, int(n)) for name, n in
+                       six.iteritems(manifest.get('concurrency') or {}))
+    return jobs, concurrency
+
+
+class Batch(object):
+    """Runs jobs with a thread pool for each runner. `on_change`
+    is called with the batch whenever a job changes state.
+    """
+
+    def __init__(self, jobs, concurrency=None, on_change=None):
+        self.jobs = jobs
+        self.concurrency = concurrency or {}
+        self.on_change = on_change
+        self._lock = threading.Lock()
+
+    def counts(self):
+        """Number of jobs in each state"""
+        counts = dict((state, 0) for state in STATES)
+        for job in self.jobs:
+            counts[job.state] += 1
+        return counts
+
+    def status_line(self):
+        counts = self.counts()
+        return ", ".join("{0} {1}".format(counts[state], state.lower())
+                         for state in STATES)
+
+    def _set_state(self, job, state):
+        with self._lock:
+            job.state = state
+            if self.on_change is not None:
+                self.on_change(self)
+
+    def _run_job(self, job):
+        self._set_state(job, 'RUNNING')
+        start = time.time()
+        state = 'FAILED'
+        try:
+            job.run()
+            state = 'COMPLETED'
+        except (Exception, SystemExit) as e:
+            # optparse exits on bad options
+            job.error = "{0}: {1}".format(e.__class__.__name__, e)
+            logger.error("Job {0} failed: {1}".format(job.name, job.error))
+        job.seconds = time.time() - start
+        self._set_state(job, state)
+
+    def run(self):
+        """Run all the jobs; returns True if they all completed"""
+        # find the jobs and runners first, so mistakes
+        # in the manifest are found before anything runs
+        classes = {}
+        for job in self.jobs:
+            if job.job not in classes:
+                classes[job.job] = load_job_class(job.job)
+            job.job_class = classes[job.job]
+            get_runner_class(job.runner)
+        runners = sorted(set(job.runner for job in self.jobs))
+        pools = dict(
+            (name, ThreadPoolExecutor(max_workers=self.concurrency.get(
+                name, DEFAULT_CONCURRENCY)))
+            for name in runners)
+        try:
+            futures = [pools[job.runner].submit(self._run_job, job)
+                       for job in self.jobs]
+            for future in futures:
+                future.result()
+        finally:
+            for pool in pools.values():
+                pool.shutdown()
+        return all(job.state == 'COMPLETED' for job in self.jobs)
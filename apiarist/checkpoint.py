@@ -0,0 +1,143 @@
+# Copyright 2014 Max Sharples
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Checkpoints let a failed job run be resumed, with `--resume JOB_ID`,
+without redoing the phases it had finished.
+
+A checkpoint records the phases a run has completed and what they left
+behind (the staged data, the uploaded script, the cluster and steps
+running the job), so the resumed run can pick up where it stopped. It
+is saved locally, in `checkpoints/` beside the scratch directories, and
+under the job's S3 scratch prefix, so a run can be resumed from another
+machine.
+"""
+import os
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointError(Exception):
+    pass
+
+
+def checkpoint_dir(temp_dir=None):
+    if temp_dir:
+        base = temp_dir
+    elif 'APIARIST_TMP_DIR' in os.environ:
+        base = os.environ['APIARIST_TMP_DIR']
+    else:
+        base = os.path.join(os.environ['HOME'], '.apiarist')
+    return os.path.join(base, 'checkpoints')
+
+
+class Checkpoint(object):
+    """The progress of one job run
+    """
+
+    def __init__(self, job_id, job_name, local_dir, s3_uri=None,
+                 aws_access_key_id=None, aws_secret_access_key=None):
+        self.job_id = job_id
+        self.job_name = job_name
+        self.path = os.path.join(local_dir, job_id + '.json')
+        self.s3_uri = s3_uri
+        self.aws_access_key_id = aws_access_key_id
+        self.aws_secret_access_key = aws_secret_access_key
+        self.completed_phases = []
+        self.artifacts = {}
+
+    def load(self):
+        """Read the checkpoint of the run being resumed, preferring
+        the local copy
+        """
+        data = self._read_local()
+        if data is None and self.s3_uri:
+            data = self._read_s3()
+        if data is None:
+            raise CheckpointError(
+                "no checkpoint for job {0}".format(self.job_id))
+        if data.get('job_name') != self.job_name:
+            raise CheckpointError(
+                "job {0} is a run of {1}, not {2}".format(
+                    self.job_id, data.get('job_name'), self.job_name))
+        self.completed_phases = data.get('completed_phases', [])
+        self.artifacts = data.get('artifacts', {})
+        logger.info("Resuming job {0}; completed phases: {1}".format(
+                    self.job_id, ", ".join(self.completed_phases) or "none"))
+
+    def is_complete(self, phase):
+        return phase in self.completed_phases
+
+    def complete_phase(self, phase, **artifacts):
+        if phase not in self.completed_phases:
+            self.completed_phases.append(phase)
+        self.update(**artifacts)
+
+    def redo_phase(self, phase):
+        """Forget that a phase was completed, e.g. because what it
+        left behind is gone
+        """
+        if phase in self.completed_phases:
+            self.completed_phases.remove(phase)
+            self.save()
+
+    def update(self, **artifacts):
+        self.artifacts.update(artifacts)
+        self.save()
+
+    def save(self):
+        data = json.dumps({
+            'job_id': self.job_id,
+            'job_name': self.job_name,
+            'completed_phases': self.completed_phases,
+            'artifacts': self.artifacts,
+            'updated': time.time(),
+            })
+        directory = os.path.dirname(self.path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(data)
+        os.rename(tmp, self.path)
+        if self.s3_uri:
+            # imported here so that checkpoints don't need boto
+            from apiarist.s3 import upload_string_to_s3
+            upload_string_to_s3(data, self.s3_uri, self.aws_access_key_id,
+                                self.aws_secret_access_key)
+
+    def remove_local(self):
+        """The run has finished; only the S3 copy is kept"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _read_local(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            return json.load(f)
+
+    def _read_s3(self):
+        from apiarist.s3 import get_conn, parse_s3_uri
+        bucket, key_name = parse_s3_uri(self.s3_uri)
+        conn = get_conn(self.aws_access_key_id, self.aws_secret_access_key)
+        key = conn.get_bucket(bucket).get_key(key_name)
+        if key is None:
+            return None
+        data = key.get_contents_as_string()
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data)
@@ -0,0 +1,242 @@
+# Copyright 2014 Max Sharples
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+The `apiarist` command, for looking after jobs rather than running them:
+
+    apiarist history [--job NAME] [--limit N]
+    apiarist trends [--window N]
+    apiarist regressions [--threshold X] [--window N]
+    apiarist gc [--s3-scratch-uri URI] [--older-than-days N] [--dry-run]
+    apiarist run MANIFEST [--concurrency RUNNER=N] [--quiet]
+
+The history commands take `--history-db` to read a database other than
+the default one.
+"""
+import os
+import sys
+import time
+from optparse import OptionParser
+
+from apiarist.history import JobHistory
+
+USAGE = """usage: apiarist COMMAND [options]
+
+commands:
+  history      list recent runs
+  trends       compare each job's recent runs with its first ones
+  regressions  jobs whose latest run was much slower than usual
+  gc           delete old job directories from the S3 scratch space
+  run          run the jobs in a manifest, several at a time"""
+
+
+def _format_bytes(n):
+    if n is None:
+        return '-'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(n) < 1024.0:
+            return '{0:.1f}{1}'.format(n, unit)
+        n /= 1024.0
+    return '{0:.1f}TB'.format(n)
+
+
+def _format_seconds(n):
+    if n is None:
+        return '-'
+    return '{0:.1f}s'.format(n)
+
+
+def _print_table(rows, out):
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        out.write('  '.join(cell.ljust(width)
+                            for cell, width in zip(row, widths)).rstrip())
+        out.write('\n')
+
+
+def _parser(usage):
+    parser = OptionParser(usage=usage)
+    parser.add_option('--history-db', dest='history_db', default=None)
+    return parser
+
+
+def history_command(args, out):
+    parser = _parser("usage: apiarist history [--job NAME] [--limit N]")
+    parser.add_option('--job', dest='job_name', default=None)
+    parser.add_option('--limit', dest='limit', default='20')
+    options, _ = parser.parse_args(args)
+    runs = JobHistory(options.history_db).runs(options.job_name,
+                                               limit=int(options.limit))
+    rows = [('STARTED', 'JOB', 'JOB ID', 'RUNNER', 'STATUS', 'INPUT',
+             'OUTPUT', 'SECONDS')]
+    for run in runs:
+        rows.append((
+            time.strftime('%Y-%m-%d %H:%M', time.localtime(run['started'])),
+            run['job_name'] or '-', run['job_id'], run['runner'] or '-',
+            run['status'] or '-', _format_bytes(run['input_bytes']),
+            _format_bytes(run['output_bytes']),
+            _format_seconds(run['total_seconds'])))
+    _print_table(rows, out)
+
+
+def trends_command(args, out):
+    parser = _parser("usage: apiarist trends [--window N]")
+    parser.add_option('--window', dest='window', default='5')
+    options, _ = parser.parse_args(args)
+    trends = JobHistory(options.history_db).trends(int(options.window))
+    rows = [('JOB', 'RUNS', 'FIRST INPUT', 'LAST INPUT', 'FIRST S/GB',
+             'LAST S/GB', 'LAST SECONDS')]
+    for t in trends:
+        rows.append((
+            t['job_name'], str(t['runs']),
+            _format_bytes(t['first_input_bytes']),
+            _format_bytes(t['last_input_bytes']),
+            _format_seconds(t['first_seconds_per_gb']),
+            _format_seconds(t['last_seconds_per_gb']),
+            _format_seconds(t['last_seconds'])))
+    _print_table(rows, out)
+
+
+def regressions_command(args, out):
+    parser = _parser(
+        "usage: apiarist regressions [--threshold X] [--window N]")
+    parser.add_option('--threshold', dest='threshold', default='1.5')
+    parser.add_option('--window', dest='window', default='5')
+    options, _ = parser.parse_args(args)
+    regressions = JobHistory(options.history_db).regressions(
+        float(options.threshold), int(options.window))
+    if not regressions:
+        out.write('No regressions\n')
+        return
+    rows = [('JOB', 'LATEST S/GB', 'USUAL S/GB', 'SLOWER BY')]
+    for job_name, latest, median in regressions:
+        rows.append((job_name, _format_seconds(latest),
+                     _format_seconds(median),
+                     '{0:.1f}x'.format(latest / median)))
+    _print_table(rows, out)
+
+
+def gc_command(args, out):
+    parser = OptionParser(usage="usage: apiarist gc [--s3-scratch-uri URI] "
+                          "[--older-than-days N] [--dry-run]")
+    parser.add_option('--s3-scratch-uri', dest='scratch_uri',
+                      default=os.environ.get('S3_SCRATCH_URI'))
+    parser.add_option('--older-than-days', dest='older_than_days',
+                      default='7')
+    parser.add_option('--dry-run', dest='dry_run', action='store_true',
+                      default=False)
+    parser.add_option('--aws-access-key-id', dest='aws_access_key_id',
+                      default=None)
+    parser.add_option('--aws-secret-access-key',
+                      dest='aws_secret_access_key', default=None)
+    options, _ = parser.parse_args(args)
+    if not options.scratch_uri:
+        parser.error('--s3-scratch-uri or S3_SCRATCH_URI is required')
+    # imported here so the history commands don't load boto
+    from apiarist.emr import gc_job_files
+    job_dirs = gc_job_files(
+        options.scratch_uri, float(options.older_than_days),
+        dry_run=options.dry_run,
+        aws_access_key_id=options.aws_access_key_id,
+        aws_secret_access_key=options.aws_secret_access_key)
+    verb = 'Would delete' if options.dry_run else 'Deleted'
+    for job_dir in job_dirs:
+        out.write('{0} {1}\n'.format(verb, job_dir))
+    if not job_dirs:
+        out.write('Nothing to delete\n')
+
+
+def run_command(args, out):
+    parser = OptionParser(usage="usage: apiarist run MANIFEST "
+                          "[--concurrency RUNNER=N] [--quiet] "
+                          "[--metrics-textfile PATH] [--metrics-port PORT]")
+    parser.add_option('--concurrency', dest='concurrency', action='append',
+                      default=[])
+    parser.add_option('-q', '--quiet', dest='quiet', action='store_true',
+                      default=False)
+    parser.add_option('-v', '--verbose', dest='verbose', action='store_true',
+                      default=False)
+    parser.add_option('--metrics-textfile', dest='metrics_textfile')
+    parser.add_option('--metrics-port', dest='metrics_port', type='int')
+    options, args = parser.parse_args(args)
+    if len(args) != 1:
+        parser.error('give one manifest')
+    # imported here so the other commands don't load the runners
+    from apiarist.batch import Batch, ManifestError, load_manifest
+    from apiarist.launch import HiveJobLauncher
+    from apiarist.runner import UnknownRunnerError
+    from apiarist.metrics import serve, write_textfile
+    try:
+        jobs, concurrency = load_manifest(args[0])
+    except (IOError, ManifestError) as e:
+        sys.stderr.write('{0}\n'.format(e))
+        return 1
+    for setting in options.concurrency:
+        runner, _, n = setting.partition('=')
+        concurrency[runner] = int(n)
+    HiveJobLauncher.set_up_logging(quiet=options.quiet,
+                                   verbose=options.verbose)
+    status = sys.stderr
+
+    def show_status(batch):
+        # overwrite the last status on a terminal
+        end = '\r' if status.isatty() else '\n'
+        status.write('[{0}]{1}'.format(batch.status_line(), end))
+        status.flush()
+        if options.metrics_textfile:
+            write_textfile(options.metrics_textfile)
+    if options.metrics_port:
+        serve(options.metrics_port)
+    try:
+        ok = Batch(jobs, concurrency, on_change=show_status).run()
+    except (ManifestError, UnknownRunnerError) as e:
+        sys.stderr.write('{0}\n'.format(e))
+        return 1
+    finally:
+        if options.metrics_textfile:
+            write_textfile(options.metrics_textfile)
+    if status.isatty():
+        status.write('\n')
+    rows = [('JOB', 'RUNNER', 'STATUS', 'SECONDS', 'JOB ID', 'ERROR')]
+    for job in jobs:
+        rows.append((job.name, job.runner, job.state,
+                     _format_seconds(job.seconds), job.job_id or '-',
+                     job.error or ''))
+    _print_table(rows, out)
+    return 0 if ok else 1
+
+
+# command name => function(args, output stream), returning
+# the exit status or None
+COMMANDS = {
+    'history': history_command,
+    'trends': trends_command,
+    'regressions': regressions_command,
+    'gc': gc_command,
+    'run': run_command,
+    }
+
+
+def main(args=None, out=None):
+    if args is None:
+        args = sys.argv[1:]
+    out = out or sys.stdout
+    if not args or args[0] not in COMMANDS:
+        sys.stderr.write(USAGE + '\n')
+        return 2
+    # commands may return an exit status
+    return COMMANDS[args[0]](args[1:], out) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -60,6 +60,8 @@ class YamlConfig():
 
         'hive_version': '--hive-version',
         'ami_version': '--ami-version',
+        'release_label': '--release-label',
+        'spark_submit': '--spark-submit',
 
         'iam_instance_profile': '--iam-instance-profile',  # default: EMR_EC2_DefaultRole
         'iam_service_role': '--iam-service-role',  # default: EMR_DefaultRole
@@ -72,6 +74,17 @@ class YamlConfig():
         's3_scratch_uri': '--s3-scratch-uri',
         's3_sync_wait_time': '--s3-sync-wait-time',
         'check_emr_status_every': '--check-emr-status-every',
+        'pool_name': '--pool-name',
+        'max_mins_idle': '--max-mins-idle',
+        'target_minutes': '--target-minutes',
+        'min_ec2_instances': '--min-ec2-instances',
+        'max_ec2_instances': '--max-ec2-instances',
+        'auto_size_instance_types': '--auto-size-instance-types',
+        'history_db': '--history-db',
+        'history_s3_uri': '--history-s3-uri',
+        'local_scratch_quota': '--local-scratch-quota',
+        'metrics_textfile': '--metrics-textfile',
+        'metrics_port': '--metrics-port',
         }
 
     def __init__(self, path):
@@ -86,11 +99,8 @@ class YamlConfig():
         options provided in the config file
         """
         try:
-            if runner == 'emr':
-                opts = self.conf['runners']['emr']
-            elif runner == 'local':
-                opts = self.conf['runners']['local']
-        except KeyError:
+            opts = self.conf['runners'][runner]
+        except (KeyError, TypeError):
             return args  # no extra options available
 
         append_opts = []
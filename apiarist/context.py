@@ -0,0 +1,68 @@
+# Copyright 2014 Max Sharples
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+What a run needs from the environment it runs in: AWS credentials, the
+S3 scratch location, and artifacts already put on S3 for it.
+
+The environment variables are read, never written, so runs with different
+credentials or scratch locations can share a process. Runs which share a
+context also share its artifacts, e.g. the serde jar is uploaded once.
+"""
+import os
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutionContext(object):
+    """Settings for runs, falling back to AWS_ACCESS_KEY_ID,
+    AWS_SECRET_ACCESS_KEY, S3_SCRATCH_URI and CSV_SERDE_JAR_S3
+    """
+
+    def __init__(self, aws_access_key_id=None, aws_secret_access_key=None,
+                 scratch_uri=None, serde_jar_uri=None):
+        self.aws_access_key_id = (aws_access_key_id or
+                                  os.environ.get('AWS_ACCESS_KEY_ID'))
+        self.aws_secret_access_key = (aws_secret_access_key or
+                                      os.environ.get('AWS_SECRET_ACCESS_KEY'))
+        self.scratch_uri = scratch_uri or os.environ.get('S3_SCRATCH_URI')
+        # where the serde jar is on S3, once it is there
+        self.serde_jar_uri = (serde_jar_uri or
+                              os.environ.get('CSV_SERDE_JAR_S3'))
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'ExecutionContext({0})'.format(self.scratch_uri)
+
+    @property
+    def credentials(self):
+        """(access key, secret key), for the `apiarist.s3` helpers"""
+        return self.aws_access_key_id, self.aws_secret_access_key
+
+    def serde_jar(self, local_jar):
+        """The location of the serde jar on S3, uploading
+        it to the scratch space the first time
+        """
+        with self._lock:
+            if self.serde_jar_uri is None:
+                if self.scratch_uri is None:
+                    raise ValueError("must specify the S3 scratch URI")
+                # boto is only imported when it is really needed
+                from apiarist.s3 import upload_file_to_s3
+                jar_uri = self.scratch_uri + 'jars/csv-serde.jar'
+                logger.info("Uploading the serde jar to {0}".format(jar_uri))
+                upload_file_to_s3(local_jar, jar_uri, *self.credentials)
+                self.serde_jar_uri = jar_uri
+            return self.serde_jar_uri
@@ -21,49 +21,139 @@ import re
 import time
 import datetime
 import logging
-import six
+import threading
 
 import boto
+import boto.exception
+import six
 from boto.emr.step import HiveStep
 from boto.emr.step import InstallHiveStep
+from boto.emr.step import JarStep
 from boto.emr.connection import EmrConnection
+from apiarist.runner import HiveJobRunner
+from apiarist.context import ExecutionContext
+from apiarist.logs import StepLogTailer
+from apiarist.validate import validate_input
 from apiarist.s3 import copy_s3_file, is_dir, upload_file_to_s3
+from apiarist.s3 import s3_key_exists, upload_string_to_s3, s3_fingerprint
+from apiarist.s3 import s3_size, delete_prefix, list_keys, list_prefixes
+from apiarist.s3 import parse_s3_uri
+from apiarist.upload import upload_local_input
+from apiarist.metrics import EMR_POLL_CALLS, EMR_THROTTLES
+from apiarist.registry import local_fingerprint
+from apiarist.util import local_input_files
+from apiarist.checkpoint import Checkpoint, checkpoint_dir
+from apiarist.history import JobHistory, default_history_path
+from apiarist.sizing import HISTORY_RUNS, estimate_size
+from apiarist.registry import S3JobRegistry, job_key
 from apiarist.script import generate_hive_script_file, get_script_file_location
 
 logger = logging.getLogger(__name__)
 
+# Hive scripts already uploaded by this process, so batches
+# of runs don't have to check S3 for them again
+_uploaded_scripts = set()
+
+
+# names of the job directories in the S3 scratch space
+JOB_DIR_RE = re.compile(r'.*/(hj-[0-9a-f]{32})/$')
+
+# EMR releases from which clusters can terminate themselves when idle
+AUTO_TERMINATION_RE = re.compile(r'^emr-(\d+)\.(\d+)\.')
+
+
+def supports_auto_termination(release_label):
+    """Does the EMR release accept an auto-termination policy?
+    (5.30.0 and later 5.x releases, and 6.1.0 and later)
+    """
+    m = AUTO_TERMINATION_RE.match(release_label or '')
+    if not m:
+        return False
+    version = (int(m.group(1)), int(m.group(2)))
+    if version[0] == 5:
+        return version >= (5, 30)
+    return version >= (6, 1)
+
+
+# how long the Install Hive step takes, for runs with no history of it
+TYPICAL_HIVE_INSTALL_SECONDS = 120
+
+# error codes EMR answers with when it throttles requests
+THROTTLING_ERRORS = ('Throttling', 'ThrottlingException')
+
+
+class ClusterNotReadyError(Exception):
+    pass
+
 
-class EMRRunner():
+class JobFailedError(Exception):
+    """A job's steps failed; `hive_error` is the error
+    found in the step logs, if any.
+    """
+
+    def __init__(self, msg, hive_error=None):
+        super(JobFailedError, self).__init__(msg)
+        self.hive_error = hive_error
+
+
+class EMRRunner(HiveJobRunner):
+
+    # tags which identify the clusters in a pool
+    POOL_NAME_TAG = 'apiarist:pool-name'
+    POOL_HASH_TAG = 'apiarist:pool-hash'
+
+    # cluster states in which steps can be added
+    STARTING_STATES = ('STARTING', 'BOOTSTRAPPING', 'RUNNING', 'WAITING')
+
+    # the locations which change with every run are left as variables
+    # in the Hive script, and given to Hive as step arguments
+    SCRIPT_VARIABLES = ('data_path', 'output_path', 'table_path')
 
     def __init__(self, job_name=None, input_path=None, hive_query=None,
                  output_dir=None, scratch_uri=None, log_path=None,
-                 ami_version=None, hive_version=None, num_instances=None,
+                 ami_version=None, hive_version=None, release_label=None,
+                 num_instances=None,
                  master_instance_type=None, slave_instance_type=None,
                  iam_instance_profile=None, iam_service_role=None,
                  aws_access_key_id=None, aws_secret_access_key=None,
                  visible_to_all_users=None,
                  s3_sync_wait_time=5, check_emr_status_every=30,
-                 label=None, owner=None, temp_dir=None):
-
-        self.job_name = job_name
-        self.job_id = self._generate_job_id()
-        self.start_time = time.time()
-
-        # AWS credentials can come from arguments or environment
-        # set AWS credentials if supplied (override ENV)
-        if aws_access_key_id:
-            os.environ['AWS_ACCESS_KEY_ID'] = aws_access_key_id
-            self.aws_access_key_id = aws_access_key_id
-        else:
-            logger.debug("Getting AWS access key from ENV")
-            self.aws_access_key_id = os.environ['AWS_ACCESS_KEY_ID']
-
-        if aws_secret_access_key:
-            os.environ['AWS_SECRET_ACCESS_KEY'] = aws_secret_access_key
-            self.aws_secret_access_key = aws_secret_access_key
-        else:
-            logger.debug("Getting AWS secret key from ENV")
-            self.aws_secret_access_key = os.environ['AWS_SECRET_ACCESS_KEY']
+                 label=None, owner=None, temp_dir=None,
+                 pool_clusters=False, pool_name=None, max_mins_idle=None,
+                 validate_input=False, prune_columns=False, dedupe=False,
+                 auto_size=False, target_minutes=30, min_instances=2,
+                 max_instances=20, auto_size_instance_types=None,
+                 history_db=None, compress_input=False, resume=None,
+                 retain_job_files=False, cleanup_in_background=False,
+                 context=None):
+
+        super(EMRRunner, self).__init__(job_name=job_name,
+                                        input_path=input_path,
+                                        hive_query=hive_query,
+                                        job_id=resume)
+        # carry on from the checkpoint of an earlier run
+        self.resume = bool(resume)
+        self.temp_dir = temp_dir
+        # keep the job's files on S3 after the run
+        self.retain_job_files = retain_job_files
+        # delete them in a thread, without holding up the caller
+        self.cleanup_in_background = cleanup_in_background
+        self.cleanup_thread = None
+
+        # AWS credentials and the S3 scratch space can come from
+        # arguments or the environment; the environment isn't changed,
+        # so runs with different settings can share a process
+        if context is None:
+            context = ExecutionContext(aws_access_key_id,
+                                       aws_secret_access_key, scratch_uri)
+        self.context = context
+        if not context.aws_access_key_id or \
+                not context.aws_secret_access_key:
+            raise ValueError("AWS credentials must be given as arguments "
+                             "or in AWS_ACCESS_KEY_ID and "
+                             "AWS_SECRET_ACCESS_KEY")
+        self.aws_access_key_id = context.aws_access_key_id
+        self.aws_secret_access_key = context.aws_secret_access_key
 
         # Set visibility of job flow to all users if visible_to_all_users is None
         if visible_to_all_users is None:
@@ -72,42 +162,74 @@ class EMRRunner():
             self.visible_to_all_users = visible_to_all_users
 
         self.s3_sync_wait_time = s3_sync_wait_time
+        # check the input against the input columns before launching
+        self.validate_input = validate_input
+        # only give the queries the input columns they use
+        self.prune_columns = prune_columns
+        # share a run with identical jobs started at the same time
+        self.dedupe = dedupe
         self.check_emr_status_every = check_emr_status_every
 
         # I/O for job data
-        self.input_path = input_path
         self.output_dir = output_dir
 
-        # is the input multiple files in a 'directory'?
-        try:
-            self.input_is_dir = is_dir(input_path)
-        except TypeError:
-            self.input_is_dir = False
+        # local input (a file, directory or glob) is uploaded first
+        self.local_input = bool(input_path) and \
+            not input_path.startswith('s3://')
+        # gzip local input as it is uploaded
+        self.compress_input = compress_input
 
-        # the Hive script object
-        self.hive_query = hive_query
+        # is the input multiple files in a 'directory'?
+        if self.local_input:
+            self.input_is_dir = True
+        else:
+            try:
+                self.input_is_dir = is_dir(input_path)
+            except TypeError:
+                self.input_is_dir = False
 
         #  EMR options
         self.master_instance_type = master_instance_type
         self.slave_instance_type = slave_instance_type
         self.ami_version = ami_version
         self.hive_version = hive_version
+        # with an EMR release, applications come preinstalled
+        self.release_label = release_label
         self.num_instances = num_instances
         self.iam_instance_profile = iam_instance_profile
         self.iam_service_role = iam_service_role
         self.label = label
         self.owner = owner
 
+        # choose the instance type and count from the input size
+        # and the job's history, instead of the options
+        self.auto_size = auto_size
+        self.target_minutes = float(target_minutes)
+        self.min_instances = int(min_instances)
+        self.max_instances = int(max_instances)
+        self.auto_size_instance_types = (auto_size_instance_types or
+                                         [slave_instance_type])
+        self.history_db = history_db
+
+        # re-use WAITING clusters with the same configuration
+        self.pool_clusters = pool_clusters
+        self.pool_name = pool_name or 'default'
+        self.max_mins_idle = max_mins_idle
+        if max_mins_idle and not supports_auto_termination(release_label):
+            raise ValueError(
+                "--max-mins-idle needs an EMR release with auto-termination "
+                "(--release-label emr-5.30.0 or later, or emr-6.1.0 or "
+                "later); AMI version clusters can't shut down when idle")
+
         # give this job a unique name
         self.job_key = self._make_unique_job_key(
             label=self.label, owner=self.owner)
 
         # S3 'scratch' directory
-        if scratch_uri:
-            self.base_path = scratch_uri
-            os.environ['S3_SCRATCH_URI'] = scratch_uri
-        else:
-            self.base_path = os.environ['S3_SCRATCH_URI']
+        if not context.scratch_uri:
+            raise ValueError("the S3 scratch URI must be given as an "
+                             "argument or in S3_SCRATCH_URI")
+        self.base_path = context.scratch_uri
 
         # allow alternate logging path
         self.log_path = log_path or self.base_path + 'logs/'
@@ -117,7 +239,15 @@ class EMRRunner():
         if self.input_is_dir:
             self.data_path += '/'
         self.table_path = self.job_files + 'tables/'
+        # scripts are stored by content hash, so unchanged
+        # scripts are reused; set when the job is staged
+        self.scripts_path = self.base_path + 'scripts/'
+        # local input is stored by content hash, so unchanged
+        # files aren't uploaded again
+        self.uploads_path = self.base_path + 'uploads/'
         self.script_path = self.job_files + 'script.hql'
+        # markers of the jobs in progress
+        self.registry_path = self.base_path + 'registry/'
         self.output_path = self.output_dir or self.job_files + 'output/'
 
         # a local temp dir is used to write the script
@@ -127,19 +257,190 @@ class EMRRunner():
         logger.info("JobID {0}, started at {1}".format(self.job_id,
                                                        self.start_time))
 
-    def _generate_hive_script(self, data_source):
-        """Write the HQL to a local (temp) file
+    def _validate_input(self):
+        """Check a sample of the input before a cluster is started for it
         """
-        hq = self.hive_query.emr_hive_script(data_source, self.output_path,
-                                             self.table_path)
-        generate_hive_script_file(hq, self.local_script_file)
+        validate_input(self.input_path, self.hive_query,
+                       aws_access_key_id=self.aws_access_key_id,
+                       aws_secret_access_key=self.aws_secret_access_key)
+
+    def _checkpoint(self):
+        checkpoint = Checkpoint(
+            self.job_id, self.job_name, checkpoint_dir(self.temp_dir),
+            self.job_files + 'checkpoint.json',
+            aws_access_key_id=self.aws_access_key_id,
+            aws_secret_access_key=self.aws_secret_access_key)
+        if self.resume:
+            checkpoint.load()
+        return checkpoint
+
+    def _checkpoint_artifacts(self):
+        return {'script_path': self.script_path,
+                'output_path': self.output_path}
+
+    def _restore_checkpoint(self, artifacts):
+        self.script_path = artifacts.get('script_path', self.script_path)
+        self.output_path = artifacts.get('output_path', self.output_path)
+        if self.checkpoint.is_complete('stage'):
+            missing = [path for path in self._staged_paths()
+                       if not s3_size(path, self.aws_access_key_id,
+                                      self.aws_secret_access_key)[1]]
+            if missing:
+                # e.g. Hive has already moved the input into its table
+                logger.info("Staging again; {0} no longer there".format(
+                            ", ".join(missing)))
+                self.checkpoint.redo_phase('stage')
+
+    def _staged_paths(self):
+        """What `stage()` puts on S3 for the job's steps"""
+        return [self.data_path, self.script_path]
+
+    def _save_progress(self, **artifacts):
+        if self.checkpoint is not None:
+            self.checkpoint.update(**artifacts)
+
+    def _resumable_steps(self, conn):
+        """The cluster and steps of the run being resumed, if
+        they are still running
+        """
+        if self.checkpoint is None:
+            return None
+        cluster_id = self.checkpoint.artifacts.get('cluster_id')
+        step_ids = self.checkpoint.artifacts.get('step_ids')
+        if not (cluster_id and step_ids):
+            return None
+        cluster = conn.describe_cluster(cluster_id)
+        if not self._cluster_is_ready(cluster, self.STARTING_STATES):
+            logger.info("Cluster {0} has stopped ({1}); starting again".format(
+                        cluster_id, cluster.status.state))
+            return None
+        return cluster_id, step_ids
+
+    def _stage_input(self):
+        """Put a copy of the input at `data_path`
+        (Hive deletes/moves the original)
+        """
+        if self.local_input:
+            upload_local_input(
+                self.input_path, self.uploads_path, self.data_path,
+                compress=self.compress_input,
+                aws_access_key_id=self.aws_access_key_id,
+                aws_secret_access_key=self.aws_secret_access_key)
+        else:
+            copy_s3_file(self.input_path, self.data_path,
+                         self.aws_access_key_id, self.aws_secret_access_key)
 
-    def _generate_job_id(self):
-        """Create a unique job run identifier
+    def _compile_hive_script(self):
+        """The Hive script, with `${hivevar:...}` placeholders
+        for the paths specific to this run
+        """
+        placeholders = dict((name, '${{hivevar:{0}}}'.format(name))
+                            for name in self.SCRIPT_VARIABLES)
+        return self.hive_query.emr_hive_script(placeholders['data_path'],
+                                               placeholders['output_path'],
+                                               placeholders['table_path'],
+                                               context=self.context)
+
+    def _dedupe_script(self):
+        """The script, without the paths specific to this run"""
+        return self._compile_hive_script()
+
+    def _job_registry(self):
+        if not self.dedupe:
+            return None
+        if self.local_input:
+            fingerprint = "\n".join(
+                local_fingerprint(f)
+                for f in local_input_files(self.input_path))
+        else:
+            fingerprint = s3_fingerprint(self.input_path,
+                                         self.aws_access_key_id,
+                                         self.aws_secret_access_key)
+        key = job_key(self._dedupe_script(), fingerprint)
+        return S3JobRegistry(self.registry_path, key,
+                             aws_access_key_id=self.aws_access_key_id,
+                             aws_secret_access_key=self.aws_secret_access_key,
+                             poll_seconds=self.check_emr_status_every)
+
+    def _registry_record(self):
+        return {'job_id': self.job_id, 'output_path': self.output_path}
+
+    def attach(self, result):
+        """Report where the identical run's output is"""
+        self.output_path = result['output_path']
+        self.fetch()
+
+    def history_record(self):
+        record = super(EMRRunner, self).history_record()
+        record.update({
+            'master_instance_type': self.master_instance_type,
+            'slave_instance_type': self.slave_instance_type,
+            'num_instances': self.num_instances and int(self.num_instances),
+            'predicted_seconds': self.metrics.get(
+                'predicted_query_seconds'),
+            'query_seconds': self._query_seconds(),
+            'hive_install_seconds': self.metrics.get('hive_install_seconds'),
+            })
+        return record
+
+    def _hive_install_estimate(self):
+        """How long the Install Hive step usually takes: the median of
+        the last runs in the job history which installed Hive, or
+        `TYPICAL_HIVE_INSTALL_SECONDS` if there aren't any
+        """
+        path = self.history_db or default_history_path()
+        seconds = []
+        if os.path.exists(path):
+            try:
+                seconds = [run['hive_install_seconds'] for run in
+                           JobHistory(path).runs(status='COMPLETED')
+                           if run.get('hive_install_seconds')]
+            except Exception as e:
+                # only an estimate, so the run doesn't depend on it
+                logger.debug("Couldn't read the job history: {0}".format(e))
+        if not seconds:
+            return TYPICAL_HIVE_INSTALL_SECONDS
+        seconds = sorted(seconds[-HISTORY_RUNS:])
+        return seconds[len(seconds) // 2]
+
+    def _query_seconds(self):
+        """How long the job's own steps ran, leaving out cluster
+        startup and setup steps; None if it isn't known
+        """
+        step_seconds = self.metrics.get('step_seconds') or {}
+        seconds = [s for name, s in step_seconds.items()
+                   if name != InstallHiveStep.InstallHiveName]
+        return sum(seconds) if seconds else None
+
+    def _input_size(self):
+        if self.local_input:
+            files = local_input_files(self.input_path)
+            return sum(os.path.getsize(f) for f in files), len(files)
+        return s3_size(self.input_path, self.aws_access_key_id,
+                       self.aws_secret_access_key)
+
+    def _output_size(self):
+        return s3_size(self.output_path, self.aws_access_key_id,
+                       self.aws_secret_access_key)[0]
+
+    def _script_variables(self):
+        """Values of the script's variables for this run
+        """
+        return {
+            'data_path': self.data_path,
+            # output locations are built by appending to this
+            'output_path': self.output_path.rstrip('/'),
+            'table_path': self.table_path,
+            }
+
+    def _hive_args(self):
+        """Hive arguments defining the script's variables
         """
-        run_id = self.job_name + str(time.time())
-        digest = hashlib.md5(six.b(run_id)).hexdigest()
-        return 'hj-' + digest
+        args = []
+        variables = self._script_variables()
+        for name in self.SCRIPT_VARIABLES:
+            args += ['-d', '{0}={1}'.format(name, variables[name])]
+        return args
 
     def _make_unique_job_key(self, label=None, owner=None):
         """Come up with a useful unique ID for this job
@@ -160,72 +461,335 @@ class EMRRunner():
             label, owner,
             now.strftime('%Y%m%d.%H%M%S'), now.microsecond)
 
-    def _generate_and_upload_hive_script(self):
-        self._generate_hive_script(self.data_path)
-        upload_file_to_s3(self.local_script_file, self.script_path)
-
-    #  hooks for the with statement ###
-
-    def __enter__(self):
-        """Don't do anything special at start of with block"""
-        return self
-
-    def __exit__(self, type, value, traceback):
-        """Call self.cleanup() at end of with block."""
-        self.cleanup()
-
-    def run(self):
-        """Run the Hive job on EMR cluster
+    def _upload_hive_script(self):
+        """Upload the Hive script under its content hash,
+        unless it is already there
+        """
+        script = self._compile_hive_script()
+        data = script
+        if isinstance(data, six.text_type):
+            data = data.encode('utf-8')
+        digest = hashlib.md5(data).hexdigest()
+        self.script_path = '{0}{1}.hql'.format(self.scripts_path, digest)
+        if self.script_path in _uploaded_scripts:
+            logger.debug("Hive script already uploaded")
+        elif s3_key_exists(self.script_path, self.aws_access_key_id,
+                           self.aws_secret_access_key):
+            logger.info("Reusing Hive script {0}".format(self.script_path))
+            _uploaded_scripts.add(self.script_path)
+        else:
+            logger.info("Uploading Hive script to {0}".format(
+                        self.script_path))
+            upload_string_to_s3(script, self.script_path,
+                                self.aws_access_key_id,
+                                self.aws_secret_access_key)
+            _uploaded_scripts.add(self.script_path)
+
+    def stage(self):
+        """Copy the input data and upload the Hive script
         """
-        #  copy the data source to a new object
-        #  (Hive deletes/moves the original)
-        copy_s3_file(self.input_path, self.data_path)
+        if self.validate_input:
+            self._validate_input()
+
+        self._stage_input()
 
-        # and create the hive script
-        self._generate_and_upload_hive_script()
+        # and make sure the hive script is there
+        if self.prune_columns:
+            self.hive_query.prune_input_columns()
+        self._upload_hive_script()
 
         logger.info("Waiting {} seconds for S3 eventual consistency".format(
                     self.s3_sync_wait_time))
         time.sleep(self.s3_sync_wait_time)
 
+    def execute(self):
+        """Run the Hive job on EMR cluster
+        """
         # TODO more options like setting aws region
         conn = EmrConnection(self.aws_access_key_id,
                              self.aws_secret_access_key)
 
-        setup_step = InstallHiveStep(self.hive_version)
-        run_step = HiveStep(self.job_name, self.script_path)
+        if self.auto_size:
+            self._auto_size()
+
+        resumable = self._resumable_steps(conn)
+        if resumable:
+            cluster_id, step_ids = resumable
+            logger.info("Rejoining the job's steps on cluster {0}".format(
+                        cluster_id))
+        else:
+            cluster_id, step_ids = self._start_steps(conn)
+            # so a resumed run can wait for these steps
+            self._save_progress(cluster_id=cluster_id, step_ids=step_ids)
+
+        try:
+            self._wait_for_job_to_complete(conn, cluster_id, step_ids)
+        except Exception:
+            # the steps can't be rejoined
+            self._save_progress(cluster_id=None, step_ids=None)
+            raise
+
+        if self.metrics.get('hive_install_skipped'):
+            saved = self._hive_install_estimate()
+            self.metrics['hive_install_seconds_saved'] = saved
+            logger.info("Hive was already installed, saving about {0:.0f} "
+                        "seconds of the Install Hive step".format(saved))
+        elif 'hive_install_seconds' in self.metrics:
+            logger.info("Installing Hive took {0} seconds".format(
+                        self.metrics['hive_install_seconds']))
+
+    def _start_steps(self, conn):
+        """Add the job's steps to a pooled or new cluster; returns
+        the cluster's ID and the steps' IDs
+        """
+        cluster_id = None
+        if self.pool_clusters:
+            cluster_id = self._find_pooled_cluster(conn)
+
+        if cluster_id:
+            # the cluster has already been set up
+            logger.info("Using pooled cluster {0}".format(cluster_id))
+            steps = self._run_steps()
+        else:
+            cluster_id = conn.run_jobflow(self.job_key, self.log_path,
+                                          **self._jobflow_kwargs())
+            if self.pool_clusters:
+                conn.add_tags(cluster_id, self._pool_tags())
+            cluster = conn.describe_cluster(cluster_id)
+            if not self._cluster_is_ready(cluster, self.STARTING_STATES):
+                raise ClusterNotReadyError(
+                    "Cluster {0} can't run the job ({1})".format(
+                        cluster_id, cluster.status.state))
+            steps = self._job_steps()
 
-        cluster_id = conn.run_jobflow(
-            self.job_key,
-            self.log_path,
-            action_on_failure='CANCEL_AND_WAIT',
-            master_instance_type=self.master_instance_type,
-            slave_instance_type=self.slave_instance_type,
-            ami_version=self.ami_version,
-            num_instances=self.num_instances,
-            job_flow_role=self.iam_instance_profile,
-            service_role=self.iam_service_role,
-            visible_to_all_users=self.visible_to_all_users)
+        self.metrics['hive_install_skipped'] = not any(
+            isinstance(step, InstallHiveStep) for step in steps)
 
-        conn.add_jobflow_steps(cluster_id, [setup_step, run_step])
+        step_list = conn.add_jobflow_steps(cluster_id, steps)
+        step_ids = [step_id.value for step_id in step_list.stepids]
 
         logger.info("Job started on cluster {0}".format(cluster_id))
+        return cluster_id, step_ids
+
+    def _jobflow_kwargs(self):
+        """Arguments for `EmrConnection.run_jobflow`
+        """
+        kwargs = {
+            'action_on_failure': 'CANCEL_AND_WAIT',
+            'master_instance_type': self.master_instance_type,
+            'slave_instance_type': self.slave_instance_type,
+            'ami_version': self.ami_version,
+            'num_instances': self.num_instances,
+            'job_flow_role': self.iam_instance_profile,
+            'service_role': self.iam_service_role,
+            'visible_to_all_users': self.visible_to_all_users,
+            'api_params': {},
+            }
+        if self.release_label:
+            # releases replace AMI versions
+            kwargs['ami_version'] = None
+            kwargs['api_params']['ReleaseLabel'] = self.release_label
+            for i, name in enumerate(self._applications()):
+                key = 'Applications.member.{0}.Name'.format(i + 1)
+                kwargs['api_params'][key] = name
+        if self.pool_clusters:
+            # keep the cluster running for the next job
+            kwargs['keep_alive'] = True
+            if self.max_mins_idle:
+                idle_timeout = int(self.max_mins_idle) * 60
+                kwargs['api_params']['AutoTerminationPolicy.IdleTimeout'] = \
+                    idle_timeout
+        return kwargs
+
+    def _applications(self):
+        """Applications to install from the EMR release
+        """
+        return ['Hive']
+
+    def _job_steps(self):
+        """The steps to add to a new job flow
+        """
+        return self._setup_steps() + self._run_steps()
 
-        self._wait_for_job_to_complete(conn, cluster_id)
+    def _setup_steps(self):
+        """Steps which prepare a new cluster
+        """
+        if self.release_label:
+            # Hive is installed as part of the release
+            return []
+        return [InstallHiveStep(self.hive_version)]
 
+    def _run_steps(self):
+        """Steps which run this job
+        """
+        if self.release_label:
+            step_args = ['hive-script', '--run-hive-script', '--args',
+                         '-f', self.script_path] + self._hive_args()
+            return [JarStep(self.job_name, 'command-runner.jar',
+                            action_on_failure='CANCEL_AND_WAIT',
+                            step_args=step_args)]
+        step = HiveStep(self.job_name, self.script_path,
+                        hive_args=self._hive_args())
+        # HiveStep takes no action_on_failure; its default, terminating
+        # the cluster, would take down a pooled cluster and the steps
+        # of every other job queued on it
+        step.action_on_failure = 'CANCEL_AND_WAIT'
+        return [step]
+
+    def _cluster_is_ready(self, cluster, states):
+        """Is the cluster in one of `states`, with
+        the applications we need from the release?
+        """
+        if cluster.status.state not in states:
+            return False
+        if self.release_label:
+            installed = set(app.name.lower()
+                            for app in cluster.applications or [])
+            missing = [name for name in self._applications()
+                       if name.lower() not in installed]
+            if missing:
+                logger.info("Cluster {0} doesn't have {1}".format(
+                            cluster.id, ", ".join(missing)))
+                return False
+        return True
+
+    def _pool_tags(self):
+        """Tags identifying clusters this job can run on
+        """
+        return {
+            self.POOL_NAME_TAG: self.pool_name,
+            self.POOL_HASH_TAG: self._pool_hash(),
+            }
+
+    def _pool_hash(self):
+        """Hash of the cluster configuration
+        (instance types and counts, AMI, release, Hive version etc.)
+        """
+        kwargs = self._jobflow_kwargs()
+        api_params = kwargs.pop('api_params')
+        # the idle timeout doesn't change what the cluster can run
+        api_params.pop('AutoTerminationPolicy.IdleTimeout', None)
+        kwargs.update(api_params)
+        kwargs['hive_version'] = self.hive_version
+        kwargs['applications'] = ",".join(self._applications())
+        config = ";".join("{0}={1}".format(k, kwargs[k])
+                          for k in sorted(kwargs))
+        return hashlib.md5(config.encode('utf-8')).hexdigest()
+
+    def _find_pooled_cluster(self, conn):
+        """Find a WAITING cluster in our pool with the same configuration
+        """
+        tags = self._pool_tags()
+        waiting = conn.list_clusters(cluster_states=['WAITING'])
+        for summary in waiting.clusters or []:
+            # describe it now, in case it has just started shutting down
+            cluster = conn.describe_cluster(summary.id)
+            cluster_tags = dict((t.key, t.value) for t in cluster.tags or [])
+            if all(cluster_tags.get(k) == v for k, v in tags.items()) and \
+               self._cluster_is_ready(cluster, ('WAITING',)):
+                return cluster.id
+        logger.info("No WAITING cluster in pool '{0}'".format(self.pool_name))
+        return None
+
+    def _auto_size(self):
+        """Size the cluster to run the job in about `target_minutes`
+        """
+        input_bytes, _ = self._input_size()
+        runs = JobHistory(self.history_db).runs(
+            self.job_name, status='COMPLETED', limit=HISTORY_RUNS)
+        size = estimate_size(input_bytes, runs,
+                             self.auto_size_instance_types,
+                             self.target_minutes * 60,
+                             self.min_instances, self.max_instances)
+        if size.runs_used:
+            basis = "{0} previous runs".format(size.runs_used)
+        else:
+            basis = "no previous runs"
+        logger.info("Auto-sized to {0} x {1} for {2} bytes of input ({3}); "
+                    "expecting the query to take {4:.0f} seconds".format(
+                        size.num_instances, size.instance_type, input_bytes,
+                        basis, size.predicted_seconds))
+        self.slave_instance_type = size.instance_type
+        self.num_instances = size.num_instances
+        self.metrics['predicted_query_seconds'] = size.predicted_seconds
+
+    def fetch(self):
+        """The output stays on S3; report where it is
+        """
+        predicted = self.metrics.get('predicted_query_seconds')
+        actual = self._query_seconds()
+        if predicted is not None and actual is not None:
+            logger.info("The query took {0:.0f} seconds; auto-sizing "
+                        "expected {1:.0f}".format(actual, predicted))
         logger.info("Output file is in: {0}".format(self.output_path))
 
     def cleanup(self):
-        # TODO _ remove scratch dirs?
-        logger.info("cleaning up ... ")
+        """Delete the job's files from the S3 scratch space, except
+        the output if it is there. The files of runs which didn't
+        finish are kept, so that they can be resumed.
+        """
+        if os.path.exists(self.local_script_file):
+            os.remove(self.local_script_file)
+        if self.retain_job_files:
+            logger.info("Keeping the job's files in {0}".format(
+                        self.job_files))
+            return
+        if not self.completed:
+            logger.info("Keeping the job's files in {0} so the run can be "
+                        "resumed".format(self.job_files))
+            return
+        if self.cleanup_in_background:
+            self.cleanup_thread = threading.Thread(
+                target=self._delete_job_files,
+                name='cleanup-{0}'.format(self.job_id))
+            self.cleanup_thread.start()
+        else:
+            self._delete_job_files()
+
+    def _delete_job_files(self):
+        keep = []
+        if self.output_path.startswith(self.job_files):
+            keep.append(self.output_path)
+        try:
+            deleted = delete_prefix(
+                self.job_files, keep,
+                aws_access_key_id=self.aws_access_key_id,
+                aws_secret_access_key=self.aws_secret_access_key)
+        except Exception as e:
+            # the job itself has finished
+            logger.warning("Couldn't delete the job's files in {0}: "
+                           "{1}".format(self.job_files, e))
+            return
+        logger.info("Deleted {0} files from {1}".format(deleted,
+                                                        self.job_files))
 
     # wait for job and log status
     # this method extracted from mrjob.job
-    def _wait_for_job_to_complete(self, conn, cluster_id):
+    def _poll_cluster(self, conn, cluster_id):
+        """The cluster and its steps, or None if EMR throttled the
+        requests (the next poll tries again)
+        """
+        try:
+            EMR_POLL_CALLS.inc(operation='describe_cluster')
+            cluster = conn.describe_cluster(cluster_id)
+            EMR_POLL_CALLS.inc(operation='list_steps')
+            steps = conn.list_steps(cluster.id).steps or []
+        except boto.exception.BotoServerError as e:
+            if e.error_code not in THROTTLING_ERRORS:
+                raise
+            EMR_THROTTLES.inc()
+            logger.info("EMR is throttling requests; trying again later")
+            return None
+        return cluster, steps
+
+    def _wait_for_job_to_complete(self, conn, cluster_id, step_ids=None):
         """
         Wait for the job to complete, and raise an exception if
         the job failed.
 
+        Our steps are identified by `step_ids` if given, otherwise
+        by the job name.
+
         Also grab log URI from the job status (since we may not know it)
         """
         success = False
@@ -233,13 +797,21 @@ class EMRRunner():
         # opts = {'check_emr_status_every': 30}
         # s3_logs = self.log_path
         emr_job_start = self.start_time
+        tailer = None
+        if step_ids:
+            tailer = StepLogTailer(self.log_path, cluster_id, step_ids,
+                                   self.aws_access_key_id,
+                                   self.aws_secret_access_key)
 
         while True:
             # don't antagonize EMR's throttling
             logger.debug('Waiting {0} seconds'.format(chk_status_freq))
             time.sleep(chk_status_freq)
 
-            cluster = conn.describe_cluster(cluster_id)
+            polled = self._poll_cluster(conn, cluster_id)
+            if polled is None:
+                continue
+            cluster, steps = polled
 
             job_state = cluster.status.state
             reason = getattr(
@@ -250,18 +822,24 @@ class EMRRunner():
             step_states = []
             running_step_name = ''
             total_step_time = 0.0
+            step_seconds = {}
             step_nums = []  # step numbers belonging to us. 1-indexed
+            failed_step_ids = []
 
-            steps = conn.list_steps(cluster.id).steps or []
             for i, step in enumerate(steps):
 
                 # ignore steps belonging to other jobs
-                if not step.name.startswith(self.job_name):
+                if step_ids is not None:
+                    if step.id not in step_ids:
+                        continue
+                elif not step.name.startswith(self.job_name):
                     continue
 
                 step_nums.append(i + 1)
 
                 step_states.append(step.status.state)
+                if step.status.state in ('FAILED', 'CANCELLED'):
+                    failed_step_ids.append(step.id)
                 if step.status.state == 'RUNNING':
                     running_step_name = step.name
 
@@ -271,10 +849,14 @@ class EMRRunner():
                     start_time = iso8601_to_timestamp(step.startdatetime)
                     end_time = iso8601_to_timestamp(step.enddatetime)
                     total_step_time += end_time - start_time
+                    step_seconds[step.name] = end_time - start_time
 
             if not step_states:
                 raise AssertionError("Can't find our steps in the job flow!")
 
+            if tailer:
+                self._tail_step_logs(tailer)
+
             # if all our steps have completed, we're done!
             if all(state == 'COMPLETED' for state in step_states):
                 success = True
@@ -306,6 +888,11 @@ class EMRRunner():
                 logger.info("Job launched {0} ago. "
                             "Status {1}".format(*loginfo))
 
+        self.metrics['step_seconds'] = step_seconds
+        if InstallHiveStep.InstallHiveName in step_seconds:
+            self.metrics['hive_install_seconds'] = \
+                step_seconds[InstallHiveStep.InstallHiveName]
+
         if success:
             logger.info("Job completed on cluster {}.".format(cluster.id))
             logger.info("Running time was {0} "
@@ -314,9 +901,127 @@ class EMRRunner():
         else:
             msg = "Job on cluster {0} failed with status {1}: {2}".format(
                   cluster.id, job_state, reason)
+            hive_error = None
+            if tailer:
+                hive_error = self._find_hive_error(tailer, failed_step_ids)
+            if hive_error:
+                msg += "\nHive error: {0}".format(hive_error)
+            logs = tailer.steps_uri if tailer else self.log_path
+            msg += "\nStep logs are in {0}".format(logs)
             logger.info(msg)
 
-            raise Exception(msg)
+            raise JobFailedError(msg, hive_error=hive_error)
+
+    def _tail_step_logs(self, tailer):
+        """Log what's new in the step logs. The logs are only
+        informative, so a failure to read them doesn't stop the job.
+        """
+        try:
+            tailer.poll()
+        except Exception as e:
+            logger.debug("couldn't read step logs: {0}".format(e))
+
+    def _find_hive_error(self, tailer, step_ids):
+        """The Hive error from the logs of the failed steps, or None
+        """
+        try:
+            return tailer.hive_error(step_ids)
+        except Exception as e:
+            logger.debug("couldn't read step logs: {0}".format(e))
+            return None
+
+
+class SparkEMRRunner(EMRRunner):
+    """Runs the job's query through Spark SQL on EMR, as a spark-submit
+    step on a cluster with Spark installed from an EMR release.
+    """
+
+    DEFAULT_RELEASE_LABEL = 'emr-5.36.0'
+
+    def __init__(self, job_name=None, release_label=None, **kwargs):
+        release_label = release_label or self.DEFAULT_RELEASE_LABEL
+        super(SparkEMRRunner, self).__init__(job_name,
+                                             release_label=release_label,
+                                             **kwargs)
+        self.script_path = self.job_files + 'script.py'
+        self.local_script_file = self.local_script_file[:-4] + '.py'
+
+    def _dedupe_script(self):
+        return self.hive_query.spark_script('${data_path}', '${output_path}')
+
+    def _staged_paths(self):
+        # Spark reads input on S3 where it is
+        if self.local_input:
+            return [self.data_path, self.script_path]
+        return [self.script_path]
+
+    def stage(self):
+        """Upload the PySpark script. Spark reads input on S3 where it
+        is, so only local input needs to be copied first.
+        """
+        if self.validate_input:
+            self._validate_input()
+        data_source = self.input_path
+        if self.local_input:
+            self._stage_input()
+            data_source = self.data_path
+        script = self.hive_query.spark_script(data_source,
+                                              self.output_path)
+        generate_hive_script_file(script, self.local_script_file)
+        upload_file_to_s3(self.local_script_file, self.script_path,
+                          self.aws_access_key_id, self.aws_secret_access_key)
+
+        logger.info("Waiting {} seconds for S3 eventual consistency".format(
+                    self.s3_sync_wait_time))
+        time.sleep(self.s3_sync_wait_time)
+
+    def _applications(self):
+        return ['Spark']
+
+    def _run_steps(self):
+        step_args = ['spark-submit', '--deploy-mode', 'cluster',
+                     self.script_path]
+        return [JarStep(self.job_name, 'command-runner.jar',
+                        action_on_failure='CANCEL_AND_WAIT',
+                        step_args=step_args)]
+
+
+def gc_job_files(scratch_uri, max_age_days, dry_run=False,
+                 aws_access_key_id=None, aws_secret_access_key=None):
+    """
+    Delete the job directories in the S3 scratch space in which nothing
+    has changed for `max_age_days`. Returns the job directories deleted
+    (or, with `dry_run`, which would have been).
+
+    Output written to a job directory is kept, as `cleanup()` keeps it.
+    """
+    if not scratch_uri.endswith('/'):
+        scratch_uri += '/'
+    creds = (aws_access_key_id, aws_secret_access_key)
+    cutoff = time.time() - float(max_age_days) * 24 * 60 * 60
+    old = []
+    for job_dir in list_prefixes(scratch_uri, *creds):
+        if not JOB_DIR_RE.match(job_dir):
+            continue
+        keys = list_keys(job_dir, *creds)
+        if keys and max(iso8601_to_timestamp(k.last_modified)
+                        for k in keys) > cutoff:
+            continue
+        output_dir = job_dir + 'output/'
+        _, output_prefix = parse_s3_uri(output_dir)
+        if keys and all(k.name.startswith(output_prefix) for k in keys):
+            # only the output is left
+            continue
+        old.append(job_dir)
+        if dry_run:
+            logger.info("Would delete {0}".format(job_dir))
+        else:
+            deleted = delete_prefix(job_dir, [output_dir],
+                                    aws_access_key_id=creds[0],
+                                    aws_secret_access_key=creds[1])
+            logger.info("Deleted {0} files from {1}".format(deleted,
+                                                            job_dir))
+    return old
 
 
 #  AWS Date-time parsing
@@ -0,0 +1,252 @@
+# Copyright 2014 Max Sharples
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+A record of every job run, kept in a SQLite database, so that jobs
+which get slower as their data grows can be found.
+
+The database is `~/.apiarist/history.db` unless `APIARIST_HISTORY_DB`
+or `--history-db` say otherwise. With `--history-s3-uri` a copy is kept
+on S3 as well: the copy is merged in before each run is recorded, and
+uploaded again afterwards, so several machines can share a history.
+"""
+import os
+import time
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+# column name => SQLite type, in table order
+HISTORY_COLUMNS = [
+    ('job_id', 'TEXT PRIMARY KEY'),
+    ('job_name', 'TEXT'),
+    ('runner', 'TEXT'),
+    ('status', 'TEXT'),
+    ('started', 'REAL'),
+    ('master_instance_type', 'TEXT'),
+    ('slave_instance_type', 'TEXT'),
+    ('num_instances', 'INTEGER'),
+    ('input_bytes', 'INTEGER'),
+    ('input_objects', 'INTEGER'),
+    ('output_bytes', 'INTEGER'),
+    ('stage_seconds', 'REAL'),
+    ('execute_seconds', 'REAL'),
+    ('fetch_seconds', 'REAL'),
+    ('total_seconds', 'REAL'),
+    ('predicted_seconds', 'REAL'),
+    # time spent running the job's query, without cluster startup
+    ('query_seconds', 'REAL'),
+    ('hive_install_seconds', 'REAL'),
+    ]
+
+COLUMN_NAMES = [name for name, _ in HISTORY_COLUMNS]
+
+
+def default_history_path():
+    if 'APIARIST_HISTORY_DB' in os.environ:
+        return os.environ['APIARIST_HISTORY_DB']
+    return os.path.join(os.environ['HOME'], '.apiarist', 'history.db')
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def seconds_per_gb(run):
+    """How long a run took for its input size, or None if either
+    isn't known
+    """
+    if not run.get('input_bytes') or run.get('total_seconds') is None:
+        return None
+    return run['total_seconds'] / (run['input_bytes'] / 1e9)
+
+
+class JobHistory(object):
+    """The runs recorded in the SQLite database at `path`
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_history_path()
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._create_table()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _create_table(self):
+        columns = ", ".join("{0} {1}".format(name, kind)
+                            for name, kind in HISTORY_COLUMNS)
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS runs ({0})".format(columns))
+                conn.execute("CREATE INDEX IF NOT EXISTS runs_by_job "
+                             "ON runs (job_name, started)")
+                # add the columns which are newer than the database
+                existing = [row[1] for row in
+                            conn.execute("PRAGMA table_info(runs)")]
+                for name, kind in HISTORY_COLUMNS:
+                    if name not in existing:
+                        conn.execute("ALTER TABLE runs ADD COLUMN "
+                                     "{0} {1}".format(name, kind))
+        finally:
+            conn.close()
+
+    def record(self, run):
+        """Add a run; `run` is a dict with (some of) the `HISTORY_COLUMNS`
+        """
+        run = dict((name, run.get(name)) for name in COLUMN_NAMES)
+        if run['started'] is None:
+            run['started'] = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO runs ({0}) VALUES ({1})".format(
+                        ", ".join(COLUMN_NAMES),
+                        ", ".join('?' for _ in COLUMN_NAMES)),
+                    [run[name] for name in COLUMN_NAMES])
+        finally:
+            conn.close()
+
+    def merge(self, other_path):
+        """Add the runs from another history database, e.g. a copy
+        downloaded from S3
+        """
+        conn = self._connect()
+        try:
+            conn.execute("ATTACH DATABASE ? AS other", (other_path,))
+            with conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO runs ({0}) "
+                    "SELECT {0} FROM other.runs".format(
+                        ", ".join(COLUMN_NAMES)))
+            conn.execute("DETACH DATABASE other")
+        finally:
+            conn.close()
+
+    def runs(self, job_name=None, status=None, limit=None):
+        """Recorded runs as dicts, oldest first; the most recent
+        `limit` runs if it is given
+        """
+        where, args = [], []
+        if job_name:
+            where.append("job_name = ?")
+            args.append(job_name)
+        if status:
+            where.append("status = ?")
+            args.append(status)
+        sql = "SELECT * FROM runs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY started DESC"
+        if limit:
+            sql += " LIMIT {0:d}".format(int(limit))
+        conn = self._connect()
+        try:
+            rows = [dict(row) for row in conn.execute(sql, args)]
+        finally:
+            conn.close()
+        return list(reversed(rows))
+
+    def job_names(self):
+        conn = self._connect()
+        try:
+            return [row[0] for row in conn.execute(
+                "SELECT DISTINCT job_name FROM runs ORDER BY job_name")]
+        finally:
+            conn.close()
+
+    def trends(self, window=5):
+        """For each job, how its recent completed runs compare to its
+        earliest: a list of dicts with the run count, and the median
+        input size and time per GB of the first and last `window` runs
+        """
+        trends = []
+        for job_name in self.job_names():
+            runs = self.runs(job_name, status='COMPLETED')
+            if not runs:
+                continue
+            first, last = runs[:window], runs[-window:]
+            trends.append({
+                'job_name': job_name,
+                'runs': len(runs),
+                'first_input_bytes': self._median_of(first, 'input_bytes'),
+                'last_input_bytes': self._median_of(last, 'input_bytes'),
+                'first_seconds_per_gb': self._median_of(first, seconds_per_gb),
+                'last_seconds_per_gb': self._median_of(last, seconds_per_gb),
+                'last_seconds': last[-1]['total_seconds'],
+                })
+        return trends
+
+    def regressions(self, threshold=1.5, window=5):
+        """Jobs whose latest completed run took more than `threshold`
+        times as long per GB as the median of the `window` runs before
+        it; a list of (job name, latest, median) seconds per GB
+        """
+        regressions = []
+        for job_name in self.job_names():
+            runs = self.runs(job_name, status='COMPLETED', limit=window + 1)
+            if len(runs) < 2:
+                continue
+            latest = seconds_per_gb(runs[-1])
+            median = self._median_of(runs[:-1], seconds_per_gb)
+            if latest is None or not median:
+                continue
+            if latest > median * threshold:
+                regressions.append((job_name, latest, median))
+        return regressions
+
+    def _median_of(self, runs, field):
+        if callable(field):
+            values = [field(run) for run in runs]
+        else:
+            values = [run.get(field) for run in runs]
+        values = [v for v in values if v is not None]
+        if not values:
+            return None
+        return _median(values)
+
+
+def record_run(run, path=None, s3_uri=None,
+               aws_access_key_id=None, aws_secret_access_key=None):
+    """Record a run in the local history, and in the S3 copy if
+    `s3_uri` is given
+    """
+    history = JobHistory(path)
+    if s3_uri:
+        # imported here so local runs without an S3 copy don't load boto
+        from apiarist.s3 import s3_key_exists, download_s3_file
+        from apiarist.s3 import upload_file_to_s3
+        creds = (aws_access_key_id, aws_secret_access_key)
+        if s3_key_exists(s3_uri, *creds):
+            copy_path = history.path + '.s3'
+            download_s3_file(s3_uri, copy_path, *creds)
+            try:
+                history.merge(copy_path)
+            finally:
+                os.remove(copy_path)
+    history.record(run)
+    if s3_uri:
+        upload_file_to_s3(history.path, s3_uri, *creds)
+    return history
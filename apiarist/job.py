@@ -14,10 +14,12 @@
 """Class to inherit your HiveJobs from. See README for more info
 """
 import logging
+import itertools
 import re
 
 from apiarist.launch import HiveJobLauncher
 from apiarist.script import HiveQuery
+from apiarist.script import SweepQuery
 from apiarist.conf import _READ_ARGS_FROM_SYS_ARGV
 from apiarist import InvalidHiveJobException
 
@@ -42,8 +44,30 @@ class HiveJob(HiveJobLauncher):
     def hive_query(self):
         """Get the Hive script object based on provided params
         """
+        param_sets = self.sweep_params()
+        if param_sets:
+            return SweepQuery(self, param_sets)
         return HiveQuery(self)
 
+    def sweep_params(self):
+        """The parameter sets to run the query with, from the `--sweep`
+        options: every combination of the values given for each option,
+        as lists of (option dest, value) pairs
+        """
+        sweeps = getattr(getattr(self, 'options', None), 'sweep', None)
+        if not sweeps:
+            return []
+        passthrough = [opt.dest for opt in self._passthrough_options]
+        values = []
+        for sweep in sweeps:
+            dest, _, vals = sweep.partition('=')
+            if dest not in passthrough:
+                raise InvalidHiveJobException(
+                    "can only sweep passthrough options, not '{0}'".format(
+                        dest))
+            values.append([(dest, v) for v in vals.split(',')])
+        return [list(params) for params in itertools.product(*values)]
+
     def plain_query(self):
         """Condense spaces"""
         try:
@@ -81,3 +105,24 @@ class HiveJob(HiveJobLauncher):
     def query(self):
         """Create this in your HiveJob subclass"""
         raise NotImplementedError
+
+    def predicates(self):
+        """Override this in your HiveJob subclass to drop input rows the
+        query doesn't need before they are loaded, on local runs.
+
+        Return a list of (column, operator, value) tuples, which must all
+        be true for a row to be kept. The operators are =, !=, <, <=, >,
+        >= and `in` (with a list of values). The query should filter on
+        the same conditions.
+        """
+        return None
+
+    def outputs(self):
+        """Override this in your HiveJob subclass to write several
+        outputs from one scan of the input, instead of
+        `output_columns` and `query`.
+
+        Return a list of (name, output columns, select) tuples. The select
+        statements have no FROM clause; they all read from `table`.
+        """
+        return None
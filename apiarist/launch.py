@@ -21,11 +21,13 @@ from optparse import Option
 # from optparse import OptionError
 # from optparse import OptionGroup
 from optparse import OptionParser
-from apiarist.emr import EMRRunner
-from apiarist.local import LocalRunner
+from optparse import OptionValueError
+from apiarist.runner import get_runner_class
 from apiarist.util import log_to_null
 from apiarist.util import log_to_stream
 from apiarist.conf import process_args
+from apiarist.history import record_run
+from apiarist.metrics import serve as serve_metrics, write_textfile
 
 logger = logging.getLogger(__name__)
 
@@ -97,48 +99,120 @@ class HiveJobLauncher(object):
         self.set_up_logging(quiet=self.options.quiet,
                             verbose=self.options.verbose,
                             stream=self.stderr)
+        if self.options.metrics_port:
+            serve_metrics(self.options.metrics_port)
+        try:
+            self.launch()
+        finally:
+            if self.options.metrics_textfile:
+                write_textfile(self.options.metrics_textfile)
+
+    def launch(self):
+        """
+        Run the job with the runner the options choose, without
+        setting up logging; returns the runner
+        """
         #  log the options being used
         logger.info("Launching job {0}".format(self.job_name))
         with self.make_runner() as runner:
-            runner.run()
+            status = 'FAILED'
+            try:
+                runner.run()
+                status = 'COMPLETED'
+            finally:
+                self.record_history(runner, status)
+        return runner
 
-    def make_runner(self):
+    def record_history(self, runner, status):
         """
-        Make a runner based on arguments provided
+        Add the run to the job history, unless `--no-history`.
+        The job's outcome doesn't depend on this, so problems
+        are only logged.
         """
-        if self.options.runner == 'emr':
-            kwargs = self.emr_job_runner_kwargs()
-            logger.info("Initating EMR runner: {}".format(kwargs))
-            return EMRRunner(**kwargs)
-        else:
-            kwargs = self.local_job_runner_kwargs()
-            logger.info("Initiating local runner: {}".format(kwargs))
-            return LocalRunner(**kwargs)
+        if self.options.no_history:
+            return
+        record = runner.history_record()
+        if status == 'COMPLETED' and 'deduplicated_into' in runner.metrics:
+            # it didn't do the work, so its timings mean nothing
+            status = 'DEDUPLICATED'
+        record.update({'runner': self.options.runner, 'status': status})
+        try:
+            record_run(record, self.options.history_db,
+                       self.options.history_s3_uri,
+                       self.options.aws_access_key_id,
+                       self.options.aws_secret_access_key)
+        except Exception as e:
+            logger.warning("Couldn't record the run in the job history: "
+                           "{0}".format(e))
 
-    def local_job_runner_kwargs(self):
+    def make_runner(self):
+        """
+        Make a runner based on arguments provided.
+        The runner's module is only imported here, when it is needed.
+        """
+        runner_name = self.options.runner
+        runner_class = get_runner_class(runner_name)
+        if self.options.resume and not runner_class.checkpoints():
+            # it would silently start the job again from the beginning
+            raise OptionValueError(
+                "--resume only works with runners which checkpoint their "
+                "runs, such as emr; the {0} runner doesn't".format(
+                    runner_name))
+        kwargs = self.job_runner_kwargs(runner_name, runner_class)
+        logger.info("Initiating {0} runner: {1}".format(runner_name, kwargs))
+        return runner_class(**kwargs)
+
+    def job_runner_kwargs(self, runner_name, runner_class):
+        """
+        Arguments for the runner. Uses the `<name>_job_runner_kwargs`
+        method if this class has one, otherwise the arguments common to
+        all runners plus whatever the runner class takes from the options.
+        """
+        method_name = '{0}_job_runner_kwargs'.format(
+            runner_name.replace('-', '_'))
+        if hasattr(self, method_name):
+            return getattr(self, method_name)()
+        kwargs = self.default_job_runner_kwargs()
+        kwargs.update(runner_class.options_to_kwargs(self.options))
+        return kwargs
+
+    def default_job_runner_kwargs(self):
         return {
             'input_path': self.input_data,
-            'output_dir': self.options.output_dir,
             'hive_query': self.hive_query(),
             'job_name': self.job_name,
+            }
+
+    def local_job_runner_kwargs(self):
+        kwargs = self.default_job_runner_kwargs()
+        kwargs.update({
+            'output_dir': self.options.output_dir,
             'temp_dir': self.options.scratch_dir,
             'no_output': self.options.no_output,
             'retain_hive_table': self.options.retain_hive_table,
-            }
+            'scratch_quota': self.options.local_scratch_quota,
+            'cache_tables': self.options.cache_tables,
+            'validate_input': self.options.validate_input,
+            'prune_columns': self.options.prune_columns,
+            'dedupe': self.options.dedupe,
+            })
+        return kwargs
 
     def emr_job_runner_kwargs(self):
         slave_instance_type = self.options.slave_instance_type
         master_instance_type = (self.options.master_instance_type or
                                 slave_instance_type)
-        return {
+        auto_size_instance_types = None
+        if self.options.auto_size_instance_types:
+            auto_size_instance_types = \
+                self.options.auto_size_instance_types.split(',')
+        kwargs = self.default_job_runner_kwargs()
+        kwargs.update({
             'aws_access_key_id': self.options.aws_access_key_id,
             'aws_secret_access_key': self.options.aws_secret_access_key,
-            'input_path': self.input_data,
             'output_dir': self.options.output_dir,
-            'hive_query': self.hive_query(),
             'scratch_uri': self.options.scratch_uri,
             'log_path': self.options.log_uri,
-            'job_name': self.job_name,
             'label': self.options.label,
             'owner': self.options.owner,
             'master_instance_type': master_instance_type,
@@ -146,13 +220,39 @@ class HiveJobLauncher(object):
             'num_instances': self.options.num_instances,
             'ami_version': self.options.ami_version,
             'hive_version': self.options.hive_version,
+            'release_label': self.options.release_label,
             'iam_instance_profile': self.options.iam_instance_profile,
             'iam_service_role': self.options.iam_service_role,
             'visible_to_all_users': self.options.visible_to_all_users,
             's3_sync_wait_time': self.options.s3_sync_wait_time,
             'check_emr_status_every': self.options.check_emr_status_every,
-            'temp_dir': self.options.scratch_dir
-            }
+            'temp_dir': self.options.scratch_dir,
+            'pool_clusters': self.options.pool_clusters,
+            'pool_name': self.options.pool_name,
+            'max_mins_idle': self.options.max_mins_idle,
+            'auto_size': self.options.auto_size,
+            'target_minutes': self.options.target_minutes,
+            'min_instances': self.options.min_instances,
+            'max_instances': self.options.max_instances,
+            'auto_size_instance_types': auto_size_instance_types,
+            'history_db': self.options.history_db,
+            'compress_input': self.options.compress_input,
+            'resume': self.options.resume,
+            'retain_job_files': self.options.retain_job_files,
+            'cleanup_in_background': self.options.cleanup_in_background,
+            'validate_input': self.options.validate_input,
+            'prune_columns': self.options.prune_columns,
+            'dedupe': self.options.dedupe,
+            })
+        return kwargs
+
+    def spark_job_runner_kwargs(self):
+        kwargs = self.local_job_runner_kwargs()
+        kwargs['spark_submit'] = self.options.spark_submit
+        return kwargs
+
+    def spark_emr_job_runner_kwargs(self):
+        return self.emr_job_runner_kwargs()
 
     def hive_query(self):
         # implemented in subclass HiveJob
@@ -162,7 +262,7 @@ class HiveJobLauncher(object):
         """
         Define the arguments for this script
         """
-        # the running mode - local or EMR
+        # the runner - local, EMR or one provided by another package
         self.option_parser.add_option(
             '-r', dest='runner', action='store', default='local'
             )
@@ -233,6 +333,10 @@ class HiveJobLauncher(object):
             '--hive-version', dest='hive_version',
             action='store', default='latest'
             )
+        self.option_parser.add_option(
+            '--release-label', dest='release_label',
+            action='store', default=None
+            )
         self.option_parser.add_option(
             '--iam-instance-profile', dest='iam_instance_profile',
             action='store', default='EMR_EC2_DefaultRole'
@@ -263,6 +367,90 @@ class HiveJobLauncher(object):
             '--no-output', dest='no_output',
             action='store_true', default=False
         )
+        self.option_parser.add_option(
+            '--validate-input', dest='validate_input',
+            action='store_true', default=False
+        )
+        self.option_parser.add_option(
+            '--prune-columns', dest='prune_columns',
+            action='store_true', default=False
+        )
+        self.option_parser.add_option(
+            '--dedupe', dest='dedupe',
+            action='store_true', default=False
+        )
+
+        # run jobs on WAITING clusters from a pool
+        self.option_parser.add_option(
+            '--pool-clusters', dest='pool_clusters',
+            action='store_true', default=False
+        )
+        self.option_parser.add_option(
+            '--pool-name', dest='pool_name',
+            action='store', default='default'
+        )
+        self.option_parser.add_option(
+            '--max-mins-idle', dest='max_mins_idle',
+            action='store', default=None
+        )
+
+        # carry on with a run which failed part way through
+        # (only for runners which checkpoint, like emr)
+        self.option_parser.add_option(
+            '--resume', dest='resume',
+            action='store', default=None
+        )
+
+        # keep the job's files in the S3 scratch space
+        self.option_parser.add_option(
+            '--retain-job-files', dest='retain_job_files',
+            action='store_true', default=False
+        )
+
+        # delete the job's files without waiting for it
+        self.option_parser.add_option(
+            '--cleanup-in-background', dest='cleanup_in_background',
+            action='store_true', default=False
+        )
+
+        # gzip local input as it is uploaded to S3
+        self.option_parser.add_option(
+            '--compress-input', dest='compress_input',
+            action='store_true', default=False
+        )
+
+        # size the cluster from the input and the job's history
+        self.option_parser.add_option(
+            '--auto-size', dest='auto_size',
+            action='store_true', default=False
+        )
+        self.option_parser.add_option(
+            '--target-minutes', dest='target_minutes',
+            action='store', default=30
+        )
+        self.option_parser.add_option(
+            '--min-ec2-instances', dest='min_instances',
+            action='store', default=2
+        )
+        self.option_parser.add_option(
+            '--max-ec2-instances', dest='max_instances',
+            action='store', default=20
+        )
+        self.option_parser.add_option(
+            '--auto-size-instance-types', dest='auto_size_instance_types',
+            action='store', default=None
+        )
+
+        # run the query for each combination of passthrough option values
+        self.option_parser.add_option(
+            '--sweep', dest='sweep', action='append', default=None
+        )
+
+        # path to spark-submit for the local Spark runner
+        self.option_parser.add_option(
+            '--spark-submit', dest='spark_submit',
+            action='store', default='spark-submit'
+        )
 
         # logging options
         self.option_parser.add_option(
@@ -274,6 +462,20 @@ class HiveJobLauncher(object):
             action='store_true', default=False
             )
 
+        # the job history
+        self.option_parser.add_option(
+            '--history-db', dest='history_db',
+            action='store', default=None
+            )
+        self.option_parser.add_option(
+            '--history-s3-uri', dest='history_s3_uri',
+            action='store', default=None
+            )
+        self.option_parser.add_option(
+            '--no-history', dest='no_history',
+            action='store_true', default=False
+            )
+
         # retain the Hive table (don't delete scratch directory)
         # this is useful for running some ad-hoc stuff
         self.option_parser.add_option(
@@ -281,6 +483,30 @@ class HiveJobLauncher(object):
             action='store_true', default=False
             )
 
+        # keep loaded input tables for later local runs on the same input
+        self.option_parser.add_option(
+            '--cache-tables', dest='cache_tables',
+            action='store_true', default=False
+            )
+
+        # evict old retained scratch dirs beyond this size (e.g. 20G)
+        self.option_parser.add_option(
+            '--local-scratch-quota', dest='local_scratch_quota',
+            action='store', default=None
+            )
+
+        # write metrics for node_exporter's textfile collector when done
+        self.option_parser.add_option(
+            '--metrics-textfile', dest='metrics_textfile',
+            action='store', default=None
+            )
+
+        # serve metrics for Prometheus on this port while the job runs
+        self.option_parser.add_option(
+            '--metrics-port', dest='metrics_port',
+            action='store', type='int', default=None
+            )
+
     def add_passthrough_option(self, *args, **kwargs):
         """
         Add a section in the Job to specify options passed to
@@ -16,17 +16,38 @@ Class to manage local job execution
 """
 import os
 import subprocess
-import hashlib
-import time
 import shutil
 import logging
-import six
+from apiarist.runner import HiveJobRunner
 from apiarist.script import generate_hive_script_file, get_script_file_location
+from apiarist.validate import validate_input
+from apiarist.staging import stage_csv, RowFilter
+from apiarist.registry import LocalJobRegistry, job_key, local_fingerprint
+from apiarist.metrics import STAGED_BYTES
+from apiarist.scratch import clear_active, enforce_quota, is_active
+from apiarist.scratch import mark_active
+from apiarist.scratch import parse_size, remove_dir, table_cache_dir
+
+# marks a cached input table as completely loaded
+CACHED_TABLE_MARKER = '.loaded'
 
 logger = logging.getLogger(__name__)
 
 
-class LocalRunner():
+def local_size(path):
+    """Total bytes and number of the files at or under `path`
+    """
+    if not os.path.isdir(path):
+        return os.path.getsize(path), 1
+    total = count = 0
+    for directory, _, names in os.walk(path):
+        for name in names:
+            total += os.path.getsize(os.path.join(directory, name))
+            count += 1
+    return total, count
+
+
+class LocalRunner(HiveJobRunner):
     """
     Handles running the Hive script on
     a local Hive installation.
@@ -34,13 +55,15 @@ class LocalRunner():
 
     def __init__(self, job_name=None,
                  input_path=None, hive_query=None, output_dir=None,
-                 temp_dir=None, no_output=False, retain_hive_table=False):
+                 temp_dir=None, no_output=False, retain_hive_table=False,
+                 validate_input=False, prune_columns=False, dedupe=False,
+                 scratch_quota=None, cache_tables=False):
 
         #  TODO test for Hive installation
 
-        self.job_name = job_name
-        self.job_id = self._generate_job_id()
-        self.start_time = time.time()
+        super(LocalRunner, self).__init__(
+            job_name=job_name, input_path=os.path.abspath(input_path),
+            hive_query=hive_query)
 
         # I/O for job data
         self.scratch_dir = self.get_local_scratch_dir(temp_dir)
@@ -48,17 +71,29 @@ class LocalRunner():
 
         self.data_path = self.scratch_dir + 'data'
         self.table_path = self.scratch_dir + 'table'
-        self.input_path = os.path.abspath(input_path)
         if output_dir:
             self.output_dir = os.path.abspath(output_dir) + '/' + self.job_id
         else:
             self.output_dir = self.scratch_dir + 'output'
 
-        # the Hive script object
-        self.hive_query = hive_query
         self.local_script_file = get_script_file_location(self.job_id,
                                                           self.scratch_dir)
         self.retain_hive_table = retain_hive_table
+        # check the input against the input columns before running
+        self.validate_input = validate_input
+        # only stage the input columns the query uses
+        self.prune_columns = prune_columns
+        # share a run with identical jobs started at the same time
+        self.dedupe = dedupe
+        # output kept in the registry for identical runs to read
+        self.shared_output = dedupe and not output_dir
+        # most bytes the retained scratch dirs may take up
+        self.scratch_quota = parse_size(scratch_quota)
+        # removing the scratch dir, after the run
+        self.cleanup_thread = None
+        # keep loaded input tables for later runs on the same input
+        self.cache_tables = cache_tables
+        self.table_cached = False
 
     def get_local_scratch_dir(self, temp_dir=None):
         if temp_dir:
@@ -70,78 +105,214 @@ class LocalRunner():
                                                    self.job_id)
         return tmp_path
 
+    def _scratch_root(self):
+        """Where the scratch dirs of the runs are"""
+        return os.path.dirname(self.scratch_dir.rstrip('/'))
+
+    def _registry_dir(self):
+        """Beside the scratch dirs of the runs"""
+        return os.path.join(self._scratch_root(), 'registry')
+
+    def _dedupe_script(self):
+        """The script, without the paths specific to this run"""
+        return self.hive_query.local_hive_script('${data_path}',
+                                                 '${output_dir}',
+                                                 '${table_path}')
+
+    def _job_registry(self):
+        if not self.dedupe:
+            return None
+        key = job_key(self._dedupe_script(),
+                      local_fingerprint(self.input_path))
+        if self.shared_output:
+            # the scratch dir is removed after the run,
+            # so the output has to be somewhere else
+            self.output_dir = os.path.join(self._registry_dir(),
+                                           key + '.output')
+        return LocalJobRegistry(self._registry_dir(), key)
+
+    def _registry_record(self):
+        return {'job_id': self.job_id, 'output_dir': self.output_dir}
+
+    def attach(self, result):
+        """Show the output of the identical run"""
+        self.output_dir = result['output_dir']
+        if not os.path.exists(self.output_dir):
+            logger.warning("The output of job {0} has been removed".format(
+                           result['job_id']))
+            return
+        self.fetch()
+
+    def _input_size(self):
+        return local_size(self.input_path)
+
+    def _output_size(self):
+        return local_size(self.output_dir)[0]
+
     def _ensure_local_scratch_dir_exists(self):
         if not os.path.exists(self.scratch_dir):
             os.makedirs(self.scratch_dir)
+        # so it isn't evicted while the job runs
+        mark_active(self.scratch_dir)
 
-    def run(self):
+    def stage(self):
         """
-        Run the hive query against a local hive installation (*nix only)
+        Copy the input data to the scratch dir and write the script
         """
-        # prepare files
+        if self.validate_input:
+            self._validate_input()
         self._ensure_local_scratch_dir_exists()
-        self._copy_input_data()
+        self._clear_shared_output()
+        if self.prune_columns:
+            self.hive_query.prune_input_columns()
+        if self.cache_tables:
+            self._use_table_cache()
+        if not self.table_cached:
+            self._copy_input_data()
         self._generate_hive_script()
-        # execute against local hive server
+
+    def execute(self):
+        """
+        Run the hive query against a local hive installation (*nix only)
+        """
         cmd = ["hive -f {}".format(self.local_script_file)]
         logger.info("running HIVE script with: {}".format(cmd))
         hql = subprocess.Popen(cmd, stdout=subprocess.PIPE, shell=True)
         stdout = hql.communicate()
         if stdout[1] is not None:
             logger.info(stdout)
-        # observe and report
+        if hql.returncode != 0:
+            raise subprocess.CalledProcessError(hql.returncode, cmd)
+        if self.cache_tables:
+            # the table can be used by later runs
+            open(os.path.join(self.table_path, CACHED_TABLE_MARKER),
+                 'w').close()
+
+    def fetch(self):
+        """
+        Observe and report
+        """
         self._wait_for_job_to_complete()
 
-    def _copy_input_data(self):
-        shutil.copyfile(self.input_path, self.data_path)
+    def _clear_shared_output(self):
+        """Output is appended, so remove the last run's"""
+        if self.shared_output and os.path.exists(self.output_dir):
+            shutil.rmtree(self.output_dir)
 
-    def _wait_for_job_to_complete(self):
-        # TODO - wait until there are files in this dir
-        cmd = ["cat {}/*".format(self.output_dir)]
-        cat = subprocess.Popen(cmd, stdout=subprocess.PIPE,
-                               stderr=subprocess.STDOUT, shell=True)
-        stdout, stderr = cat.communicate()
-        if self.stream_output:
-            logger.info("\nQuery output ------->\n")
-            print(stdout)  # query results to STDOUT
+    def _validate_input(self):
+        validate_input(self.input_path, self.hive_query)
 
-    def _generate_hive_script(self):
-        """
-        Write the HQL to a local (temp) file
+    def _input_table_key(self):
+        """Identify the input table by its definition, the rows
+        staged into it and the input
         """
-        hq = self.hive_query.local_hive_script(self.data_path,
-                                               self.output_dir,
-                                               self.table_path)
-        generate_hive_script_file(hq, self.local_script_file)
+        ddl = self.hive_query.local_input_table_ddl('${table_path}')
+        predicates = getattr(self.hive_query, 'predicates', None)
+        return job_key("\n".join(ddl) + repr(predicates),
+                       local_fingerprint(self.input_path))
 
-    def _generate_job_id(self):
+    def _use_table_cache(self):
+        """Put the input table in the cache, and find out whether
+        an earlier run has already loaded it
         """
-        Create a unique job run identifier
+        table_path = os.path.join(table_cache_dir(self._scratch_root()),
+                                  self._input_table_key())
+        if os.path.exists(os.path.join(table_path, CACHED_TABLE_MARKER)):
+            logger.info("Using the input table cached in {0}".format(
+                        table_path))
+            self.table_cached = True
+        elif is_active(table_path):
+            # another run is loading it; use our own table
+            self.cache_tables = False
+            return
+        else:
+            # loading appends, so start from nothing
+            remove_dir(table_path)
+            os.makedirs(table_path)
+        self.table_path = table_path
+        mark_active(self.table_path)
+
+    def _copy_input_data(self):
+        """Copy the input, leaving out the rows and columns
+        the query doesn't need
         """
-        run_id = self.job_name + str(time.time())
-        digest = hashlib.md5(six.b(run_id)).hexdigest()
-        return 'hj-' + digest
+        load_columns = getattr(self.hive_query, 'load_columns', None)
+        predicates = getattr(self.hive_query, 'predicates', None)
+        if not (load_columns or predicates):
+            shutil.copyfile(self.input_path, self.data_path)
+        else:
+            self._stage_input_rows(load_columns, predicates)
+        STAGED_BYTES.inc(os.path.getsize(self.data_path),
+                         runner=self.runner_label())
 
-    #  hooks for the with statement ###
+    def _stage_input_rows(self, load_columns, predicates):
+        columns = self.hive_query.input_columns
+        indexes = None
+        if load_columns:
+            names = [col[0] for col in columns]
+            indexes = [names.index(col[0]) for col in load_columns]
+        row_filter = None
+        if predicates:
+            row_filter = RowFilter(predicates, columns)
+        stage_csv(self.input_path, self.data_path,
+                  self.hive_query.input_control_chars, indexes=indexes,
+                  row_filter=row_filter)
 
-    def __enter__(self):
-        """
-        Don't do anything special at start of with block
+    def _output_dirs(self):
+        """(output name, directory) for each of the job's outputs
         """
-        s = self
-        return s
+        if self.hive_query is None:
+            return [(None, self.output_dir)]
+        dirs = []
+        for name in self.hive_query.output_names():
+            if name:
+                dirs.append((name, self.hive_query.output_location(
+                    self.output_dir, name)))
+            else:
+                dirs.append((name, self.output_dir))
+        return dirs
+
+    def _wait_for_job_to_complete(self):
+        # TODO - wait until there are files in this dir
+        for name, output_dir in self._output_dirs():
+            cmd = ["cat {}/*".format(output_dir.rstrip('/'))]
+            cat = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT, shell=True)
+            stdout, stderr = cat.communicate()
+            if self.stream_output:
+                if name:
+                    logger.info("\nQuery output ({0}) ------->\n".format(
+                        name))
+                else:
+                    logger.info("\nQuery output ------->\n")
+                print(stdout)  # query results to STDOUT
 
-    def __exit__(self, type, value, traceback):
+    def _generate_hive_script(self):
         """
-        Call self.cleanup() at end of with block.
+        Write the HQL to a local (temp) file
         """
-        self.cleanup()
+        hq = self.hive_query.local_hive_script(
+            self.data_path, self.output_dir, self.table_path,
+            load_data=not self.table_cached)
+        generate_hive_script_file(hq, self.local_script_file)
 
     def cleanup(self):
         """
         cleanup the temp/scratch files that are
-        used to set up the hive tables
+        used to set up the hive tables. They are
+        removed in a thread, so this returns straight away.
         """
-        if not self.retain_hive_table:
-            os.remove(self.local_script_file)
-            shutil.rmtree(self.scratch_dir)
+        if self.cache_tables and os.path.exists(self.table_path):
+            clear_active(self.table_path)
+        if self.retain_hive_table:
+            # runs which attached to another never wrote one
+            if os.path.exists(self.scratch_dir):
+                clear_active(self.scratch_dir)
+        else:
+            # the script is in the scratch dir
+            self.cleanup_thread = remove_dir(self.scratch_dir,
+                                             background=True)
+        if self.scratch_quota is not None and \
+                os.path.exists(self._scratch_root()):
+            enforce_quota(self._scratch_root(), self.scratch_quota,
+                          background=True)
@@ -0,0 +1,168 @@
+# Copyright 2014 Max Sharples
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Follow the step logs that EMR writes to S3, and dig
+the Hive error out of them when a step fails.
+
+EMR writes the logs for each step to
+`<log uri><cluster id>/steps/<step id>/` as `controller`, `stderr`,
+`stdout` and `syslog` objects, usually gzipped.
+"""
+import gzip
+import io
+import re
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from apiarist.s3 import get_conn, parse_s3_uri
+
+logger = logging.getLogger(__name__)
+
+# the logs which explain why a step failed
+FAILURE_LOGS = ('stderr', 'syslog')
+
+# lines which describe a Hive error, best first
+HIVE_ERROR_PATTERNS = [
+    re.compile(r'^FAILED: .*'),
+    re.compile(r'^Caused by: .*'),
+    re.compile(r'.*(Exception|Error): .*'),
+    ]
+
+
+def _log_name(key_name):
+    """'logs/j-1/steps/s-1/stderr.gz' => 'stderr'"""
+    name = key_name.rsplit('/', 1)[-1]
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return name
+
+
+def _decode(data):
+    return data.decode('utf-8', 'replace')
+
+
+def _gunzip(data):
+    return gzip.GzipFile(fileobj=io.BytesIO(data)).read()
+
+
+def find_hive_error(text):
+    """Find the line of a log which best explains a Hive failure
+    """
+    lines = text.splitlines()
+    for pattern in HIVE_ERROR_PATTERNS:
+        for line in lines:
+            if pattern.match(line):
+                return line.strip()
+    return None
+
+
+class StepLogTailer(object):
+    """Reads only the parts of the step logs which are new since
+    the last poll.
+
+    Plain log objects are read with a byte range starting where the last
+    read ended. Gzipped objects can't be read from the middle, so they
+    are read again when their size changes and only the new lines logged.
+    """
+
+    def __init__(self, log_uri, cluster_id, step_ids,
+                 aws_access_key_id=None, aws_secret_access_key=None):
+        if not log_uri.endswith('/'):
+            log_uri += '/'
+        self.steps_uri = '{0}{1}/steps/'.format(log_uri, cluster_id)
+        self.step_ids = step_ids
+        self.aws_access_key_id = aws_access_key_id
+        self.aws_secret_access_key = aws_secret_access_key
+        # key name => size of the object when we last read it
+        self._sizes = {}
+        # key name => length of the (uncompressed) log we have seen
+        self._offsets = {}
+
+    def _bucket(self):
+        bucket, prefix = parse_s3_uri(self.steps_uri)
+        conn = get_conn(self.aws_access_key_id, self.aws_secret_access_key)
+        return conn.get_bucket(bucket), prefix
+
+    def poll(self):
+        """Log, and return, the lines added to the step logs since the
+        last poll, as a list of (step id, log name, text) tuples
+        """
+        bkt, prefix = self._bucket()
+        new = []
+        for step_id in self.step_ids:
+            for key in bkt.list(prefix + step_id + '/'):
+                if key.size == self._sizes.get(key.name):
+                    continue
+                text = self._read_new(key)
+                self._sizes[key.name] = key.size
+                if text:
+                    new.append((step_id, _log_name(key.name), text))
+        for step_id, name, text in new:
+            # stderr has the Hive console output; the rest is mostly noise
+            level = logging.INFO if name == 'stderr' else logging.DEBUG
+            for line in text.splitlines():
+                logger.log(level, "[{0} {1}] {2}".format(step_id, name, line))
+        return new
+
+    def _read_new(self, key):
+        offset = self._offsets.get(key.name, 0)
+        if key.name.endswith('.gz'):
+            text = _decode(_gunzip(key.get_contents_as_string()))
+            if len(text) < offset:
+                # rewritten from scratch
+                offset = 0
+            self._offsets[key.name] = len(text)
+            return text[offset:]
+        headers = {'Range': 'bytes={0}-'.format(offset)} if offset else None
+        data = key.get_contents_as_string(headers=headers)
+        self._offsets[key.name] = offset + len(data)
+        return _decode(data)
+
+    def failure_logs(self, step_ids):
+        """Read the stderr and syslog of the failed steps concurrently.
+        Returns a dict of (step id, log name) => text.
+        """
+        bkt, prefix = self._bucket()
+        keys = []
+        for step_id in step_ids:
+            for key in bkt.list(prefix + step_id + '/'):
+                if _log_name(key.name) in FAILURE_LOGS:
+                    keys.append((step_id, key.name))
+        if not keys:
+            return {}
+
+        def fetch(item):
+            step_id, key_name = item
+            # boto connections shouldn't be shared between threads
+            bkt, _ = self._bucket()
+            data = bkt.get_key(key_name).get_contents_as_string()
+            if key_name.endswith('.gz'):
+                data = _gunzip(data)
+            return (step_id, _log_name(key_name)), _decode(data)
+
+        with ThreadPoolExecutor(max_workers=len(keys)) as pool:
+            return dict(pool.map(fetch, keys))
+
+    def hive_error(self, step_ids):
+        """The Hive error from the failed steps' logs, or None
+        """
+        logs = self.failure_logs(step_ids)
+        # prefer stderr, where Hive reports errors
+        for name in FAILURE_LOGS:
+            for (step_id, log_name), text in sorted(logs.items()):
+                if log_name == name:
+                    error = find_hive_error(text)
+                    if error:
+                        return error
+        return None
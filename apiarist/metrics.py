@@ -0,0 +1,245 @@
+# Copyright 2014 Max Sharples
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Counters and histograms of what apiarist does, for Prometheus.
+
+The runners and the `apiarist.s3` helpers update the metrics below as
+they go. They can be written to a file for node_exporter's textfile
+collector (`--metrics-textfile`), or served over HTTP while jobs run
+(`--metrics-port`). Both use the Prometheus text format; the HTTP
+endpoint gives OpenMetrics to scrapers which ask for it.
+
+The metrics are kept in memory and start from zero in each process.
+"""
+import os
+import math
+import functools
+import threading
+
+OPENMETRICS_TYPE = 'application/openmetrics-text; version=1.0.0; ' \
+    'charset=utf-8'
+PROMETHEUS_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# seconds; phases range from a few seconds locally to hours on EMR
+PHASE_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace(
+        '"', r'\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(name, _escape(value))
+                          for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric(object):
+    """A family of samples, one for each set of label values"""
+
+    TYPE = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError("{0} needs the labels {1}".format(
+                self.name, ", ".join(self.labels) or "(none)"))
+        return tuple((name, labels[name]) for name in self.labels)
+
+    def samples(self):
+        """(name suffix, labels, value) for each sample"""
+        raise NotImplementedError
+
+    def exposition(self, openmetrics=False):
+        family = self.name
+        if self.TYPE == 'counter' and not openmetrics:
+            family += '_total'
+        lines = ['# HELP {0} {1}'.format(family, self.documentation),
+                 '# TYPE {0} {1}'.format(family, self.TYPE)]
+        for suffix, labels, value in self.samples():
+            lines.append('{0}{1}{2} {3}'.format(
+                self.name, suffix, _format_labels(labels),
+                _format_value(value)))
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+
+    TYPE = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("counters only go up")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [('_total', key, value)
+                    for key, value in sorted(self._values.items())]
+
+
+class Histogram(Metric):
+
+    TYPE = 'histogram'
+
+    def __init__(self, name, documentation, labels=(),
+                 buckets=PHASE_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(
+                key, ([0] * len(self.buckets), 0.0))
+            counts = [c + 1 if value <= bound else c
+                      for c, bound in zip(counts, self.buckets)]
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+        return counts[-1]
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    le = '+Inf' if math.isinf(bound) else repr(float(bound))
+                    samples.append(('_bucket', key + (('le', le),), count))
+                samples.append(('_count', key, counts[-1]))
+                samples.append(('_sum', key, total))
+        return samples
+
+
+JOBS_STARTED = Counter('apiarist_jobs_started', 'Jobs started.',
+                       ['runner'])
+JOBS_SUCCEEDED = Counter('apiarist_jobs_succeeded', 'Jobs which succeeded.',
+                         ['runner'])
+JOBS_FAILED = Counter('apiarist_jobs_failed', 'Jobs which failed.',
+                      ['runner'])
+PHASE_SECONDS = Histogram('apiarist_phase_seconds',
+                          'Time taken by each phase of a run.',
+                          ['runner', 'phase'])
+STAGED_BYTES = Counter('apiarist_staged_bytes',
+                       'Bytes of input staged for local runs.', ['runner'])
+S3_COPIED_BYTES = Counter('apiarist_s3_copied_bytes',
+                          'Bytes copied within S3.')
+S3_UPLOADED_BYTES = Counter('apiarist_s3_uploaded_bytes',
+                            'Bytes uploaded to S3.')
+S3_CALLS = Counter('apiarist_s3_calls', 'Calls to the S3 helpers.',
+                   ['operation'])
+EMR_POLL_CALLS = Counter('apiarist_emr_poll_calls',
+                         'EMR API calls made while waiting for jobs.',
+                         ['operation'])
+EMR_THROTTLES = Counter('apiarist_emr_throttles',
+                        'EMR API calls refused by throttling.')
+
+METRICS = [JOBS_STARTED, JOBS_SUCCEEDED, JOBS_FAILED, PHASE_SECONDS,
+           STAGED_BYTES, S3_COPIED_BYTES, S3_UPLOADED_BYTES, S3_CALLS,
+           EMR_POLL_CALLS, EMR_THROTTLES]
+
+
+def exposition(openmetrics=False):
+    """All the metrics, in the Prometheus text format or OpenMetrics"""
+    lines = []
+    for metric in METRICS:
+        lines += metric.exposition(openmetrics)
+    if openmetrics:
+        lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(path):
+    """Write the metrics for node_exporter's textfile collector;
+    the file is replaced in one go, so it is never read half written
+    """
+    tmp = '{0}.{1}'.format(path, os.getpid())
+    with open(tmp, 'w') as f:
+        f.write(exposition())
+    os.rename(tmp, path)
+
+
+def s3_call(operation):
+    """Decorator counting calls to an S3 helper"""
+    def decorator(func):
+        @functools.wraps(func)
+        def counted(*args, **kwargs):
+            S3_CALLS.inc(operation=operation)
+            return func(*args, **kwargs)
+        return counted
+    return decorator
+
+
+def _handle_get(handler):
+    """Answer a scrape"""
+    if handler.path.split('?')[0] not in ('/', '/metrics'):
+        handler.send_error(404)
+        return
+    openmetrics = 'application/openmetrics-text' in \
+        handler.headers.get('Accept', '')
+    body = exposition(openmetrics).encode('utf-8')
+    handler.send_response(200)
+    handler.send_header('Content-Type', OPENMETRICS_TYPE if openmetrics
+                        else PROMETHEUS_TYPE)
+    handler.send_header('Content-Length', str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+def serve(port, address=''):
+    """Serve the metrics at /metrics from a thread; returns the server,
+    which stops when the process does or is shut down
+    """
+    # only imported when metrics are served
+    from six.moves import BaseHTTPServer
+
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            _handle_get(self)
+
+        def log_message(self, *args):
+            # scrapes aren't worth logging
+            pass
+
+    server = BaseHTTPServer.HTTPServer((address, int(port)), Handler)
+    thread = threading.Thread(target=server.serve_forever,
+                              name='metrics-server')
+    thread.daemon = True
+    thread.start()
+    return server
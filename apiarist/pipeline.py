@@ -0,0 +1,68 @@
+# Copyright 2014 Max Sharples
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Class to inherit your HiveJob pipelines from. See README for more info
+"""
+import logging
+
+from apiarist.job import HiveJob
+from apiarist.script import PipelineQuery
+from apiarist import InvalidHiveJobException
+
+logger = logging.getLogger(__name__)
+
+
+class HiveJobPipeline(HiveJob):
+    """
+    Runs several HiveJobs, in order, as one job. Each job's results
+    become the input table of the next job, and the whole pipeline runs
+    as a single script on the same Hive installation or cluster.
+
+    The input is read as described by the first job and the output is
+    written as described by the last job.
+    """
+
+    def steps(self):
+        """Create this in your pipeline subclass; the HiveJob
+        classes to run, in order
+        """
+        raise NotImplementedError
+
+    def step_jobs(self):
+        """Instances of the step jobs, sharing the pipeline's options
+        """
+        jobs = []
+        for job_class in self.steps():
+            job = job_class()
+            job.options = getattr(self, 'options', None)
+            jobs.append(job)
+        return jobs
+
+    def hive_query(self):
+        if self.sweep_params():
+            raise InvalidHiveJobException("pipelines can't be swept")
+        return PipelineQuery(self.step_jobs())
+
+    #  the pipeline's I/O is that of its first and last steps
+
+    def input_columns(self):
+        return self.step_jobs()[0].input_columns()
+
+    def output_columns(self):
+        return self.step_jobs()[-1].output_columns()
+
+    def table(self):
+        return self.step_jobs()[0].table()
+
+    def query(self):
+        return self.step_jobs()[-1].query()
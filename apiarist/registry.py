@@ -0,0 +1,288 @@
+# Copyright 2014 Max Sharples
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+A registry of running jobs, so that identical jobs started at the same
+time only run once.
+
+Jobs are identified by a hash of their script and their input. The first
+run of a job creates a marker for it, which fails if the marker already
+exists; later runs of the same job find the marker and wait for the first
+run to finish, then use its output. When the first run finishes it writes
+a record of its result and removes the marker.
+
+Local runs keep the markers in a directory, and create them with an
+exclusive open. EMR runs keep them under the S3 scratch URI, and create
+them with a conditional put.
+"""
+import os
+import json
+import time
+import errno
+import socket
+import hashlib
+import logging
+import six
+
+logger = logging.getLogger(__name__)
+
+# markers older than this belong to runs which died without removing them
+STALE_MARKER_SECONDS = 12 * 60 * 60
+
+
+class AttachedJobFailedError(Exception):
+    """The run this job was waiting on failed"""
+    pass
+
+
+def job_key(script, input_fingerprint):
+    """Identify a job by its script and its input
+    """
+    digest = hashlib.md5()
+    for part in (script, input_fingerprint):
+        if isinstance(part, six.text_type):
+            part = part.encode('utf-8')
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def local_fingerprint(path):
+    """Path, size and modification time of a local file or of
+    the files in a local directory
+    """
+    if os.path.isdir(path):
+        paths = sorted(os.path.join(path, name) for name in os.listdir(path))
+    else:
+        paths = [path]
+    parts = []
+    for p in paths:
+        stat = os.stat(p)
+        parts.append("{0}:{1}:{2}".format(os.path.abspath(p), stat.st_size,
+                                          stat.st_mtime))
+    return "\n".join(parts)
+
+
+class JobRegistry(object):
+    """Where runs of a job find each other. Subclasses store the
+    marker (the run in progress) and the result of the last run.
+    """
+
+    def __init__(self, key, poll_seconds=30):
+        self.key = key
+        self.poll_seconds = poll_seconds
+
+    def acquire(self, record):
+        """Register this run of the job. Returns None if this run should
+        go ahead, otherwise the record of the run already in progress.
+        """
+        record = dict(record, started=time.time(),
+                      host=socket.gethostname(), pid=os.getpid())
+        unreadable_since = None
+        while True:
+            if self._create_marker(record):
+                self.record = record
+                return None
+            owner = self._read_marker()
+            if owner is None:
+                # finished between our create and read; try again
+                continue
+            if 'job_id' not in owner:
+                # created but not written yet; wait for its owner to
+                # write it, unless the owner died before it could
+                if unreadable_since is None:
+                    unreadable_since = time.time()
+                elif time.time() - unreadable_since > STALE_MARKER_SECONDS:
+                    logger.info("Replacing unreadable marker")
+                    self._remove_marker()
+                    continue
+                time.sleep(self.poll_seconds)
+                continue
+            if not self._is_stale(owner):
+                return owner
+            logger.info("Replacing stale marker of run {0}".format(
+                        owner.get('job_id')))
+            self._remove_marker()
+
+    def wait(self, owner):
+        """Wait for the run in progress to finish; returns its result
+        """
+        logger.info("Identical job {0} is already running; waiting for it "
+                    "to finish".format(owner.get('job_id')))
+        while True:
+            marker = self._read_marker()
+            if marker is None or marker.get('job_id') != owner['job_id']:
+                break
+            if self._is_stale(marker):
+                raise AttachedJobFailedError(
+                    "run {0} stopped without finishing".format(
+                        owner['job_id']))
+            time.sleep(self.poll_seconds)
+        result = self._read_result()
+        if result is None or result.get('job_id') != owner['job_id']:
+            raise AttachedJobFailedError(
+                "run {0} finished without a result".format(owner['job_id']))
+        if result.get('status') != 'COMPLETED':
+            raise AttachedJobFailedError(
+                "run {0} failed".format(owner['job_id']))
+        return result
+
+    def release(self, status):
+        """Record this run's result and remove its marker
+        """
+        result = dict(self.record, status=status, finished=time.time())
+        self._write_result(result)
+        self._remove_marker()
+
+    def _is_stale(self, record):
+        if time.time() - record.get('started', 0) > STALE_MARKER_SECONDS:
+            return True
+        if record.get('host') == socket.gethostname():
+            # a run on this machine is stale if its process is gone
+            try:
+                os.kill(record['pid'], 0)
+            except OSError as e:
+                return e.errno == errno.ESRCH
+        return False
+
+    #  storage, implemented in subclasses
+
+    def _create_marker(self, record):
+        """Create the marker if there isn't one; returns success"""
+        raise NotImplementedError
+
+    def _read_marker(self):
+        raise NotImplementedError
+
+    def _remove_marker(self):
+        raise NotImplementedError
+
+    def _read_result(self):
+        raise NotImplementedError
+
+    def _write_result(self, result):
+        raise NotImplementedError
+
+
+class LocalJobRegistry(JobRegistry):
+    """Markers are files in `registry_dir`, created with O_EXCL
+    """
+
+    def __init__(self, registry_dir, key, **kwargs):
+        super(LocalJobRegistry, self).__init__(key, **kwargs)
+        if not os.path.exists(registry_dir):
+            try:
+                os.makedirs(registry_dir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        self.marker_path = os.path.join(registry_dir, key + '.running')
+        self.result_path = os.path.join(registry_dir, key + '.result')
+
+    def _create_marker(self, record):
+        try:
+            fd = os.open(self.marker_path,
+                         os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as e:
+            if e.errno == errno.EEXIST:
+                return False
+            raise
+        with os.fdopen(fd, 'w') as f:
+            json.dump(record, f)
+        return True
+
+    def _read_json(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (IOError, OSError):
+            return None
+        except ValueError:
+            # still being written
+            return {}
+
+    def _read_marker(self):
+        return self._read_json(self.marker_path)
+
+    def _remove_marker(self):
+        try:
+            os.remove(self.marker_path)
+        except OSError:
+            pass
+
+    def _read_result(self):
+        return self._read_json(self.result_path)
+
+    def _write_result(self, result):
+        tmp = '{0}.{1}'.format(self.result_path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(result, f)
+        os.rename(tmp, self.result_path)
+
+
+class S3JobRegistry(JobRegistry):
+    """Markers are objects under `registry_uri`, created with a
+    conditional put (If-None-Match: *) so only one run can create one
+    """
+
+    def __init__(self, registry_uri, key, aws_access_key_id=None,
+                 aws_secret_access_key=None, **kwargs):
+        super(S3JobRegistry, self).__init__(key, **kwargs)
+        self.marker_uri = '{0}{1}.running'.format(registry_uri, key)
+        self.result_uri = '{0}{1}.result'.format(registry_uri, key)
+        self.aws_access_key_id = aws_access_key_id
+        self.aws_secret_access_key = aws_secret_access_key
+
+    def _key(self, uri):
+        # imported here so local runs don't load boto
+        from apiarist.s3 import get_conn, parse_s3_uri
+        bucket, key_name = parse_s3_uri(uri)
+        conn = get_conn(self.aws_access_key_id, self.aws_secret_access_key)
+        return conn.get_bucket(bucket).new_key(key_name)
+
+    def _create_marker(self, record):
+        from boto.exception import S3ResponseError
+        try:
+            self._key(self.marker_uri).set_contents_from_string(
+                json.dumps(record), headers={'If-None-Match': '*'})
+        except S3ResponseError as e:
+            # 412 Precondition Failed: the marker exists;
+            # 409 Conflict: another conditional put is in progress
+            if e.status in (409, 412):
+                return False
+            raise
+        return True
+
+    def _read_json(self, uri):
+        from boto.exception import S3ResponseError
+        try:
+            data = self._key(uri).get_contents_as_string()
+        except S3ResponseError as e:
+            if e.status == 404:
+                return None
+            raise
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+    def _read_marker(self):
+        return self._read_json(self.marker_uri)
+
+    def _remove_marker(self):
+        self._key(self.marker_uri).delete()
+
+    def _read_result(self):
+        return self._read_json(self.result_uri)
+
+    def _write_result(self, result):
+        self._key(self.result_uri).set_contents_from_string(
+            json.dumps(result))
@@ -0,0 +1,325 @@
+# Copyright 2014 Max Sharples
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Job runners: the base class they share, and the registry used to
+look them up by name.
+
+Runners are referenced by module path and only imported when a job
+asks for them, so a local run never has to import boto.
+
+Other packages can provide runners by declaring an entry point in the
+`apiarist.runners` group of their setup.py:
+
+    entry_points={
+        'apiarist.runners': ['myrunner = mypackage.runner:MyRunner']
+    }
+
+and the runner is then selected with `-r myrunner`.
+"""
+import time
+import hashlib
+import importlib
+import logging
+import six
+
+from apiarist.metrics import JOBS_FAILED, JOBS_STARTED, JOBS_SUCCEEDED
+from apiarist.metrics import PHASE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownRunnerError(Exception):
+    pass
+
+
+# entry point group that runners are discovered from
+ENTRY_POINT_GROUP = 'apiarist.runners'
+
+# runners built in to apiarist; name (the `-r` option) => 'module:ClassName'
+RUNNERS = {
+    'local': 'apiarist.local:LocalRunner',
+    'emr': 'apiarist.emr:EMRRunner',
+    'spark': 'apiarist.spark:SparkLocalRunner',
+    'spark-emr': 'apiarist.emr:SparkEMRRunner',
+    }
+
+
+def _entry_point_runners():
+    """Runner entry points declared by installed packages
+    """
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        try:
+            import pkg_resources
+        except ImportError:
+            return {}
+        eps = pkg_resources.iter_entry_points(ENTRY_POINT_GROUP)
+        return dict((ep.name, ep) for ep in eps)
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        eps = eps.select(group=ENTRY_POINT_GROUP)
+    else:
+        eps = eps.get(ENTRY_POINT_GROUP, [])
+    return dict((ep.name, ep) for ep in eps)
+
+
+def _registry():
+    """All available runners; entry points take precedence
+    over the built-in runners
+    """
+    runners = dict(RUNNERS)
+    runners.update(_entry_point_runners())
+    return runners
+
+
+def runner_names():
+    """Names of all the available runners"""
+    return sorted(_registry())
+
+
+def get_runner_class(name):
+    """Import and return the runner class registered as `name`
+    """
+    runners = _registry()
+    try:
+        runner = runners[name]
+    except KeyError:
+        raise UnknownRunnerError(
+            "unknown runner '{0}'; choose from: {1}".format(
+                name, ", ".join(sorted(runners))))
+    if isinstance(runner, six.string_types):
+        module_name, class_name = runner.split(':')
+        module = importlib.import_module(module_name)
+        return getattr(module, class_name)
+    return runner.load()
+
+
+class HiveJobRunner(object):
+    """
+    Base class for the job runners.
+
+    `run()` calls the hooks in order:
+
+      - `stage()` get the input data and script in place
+      - `execute()` run the query and wait for it to finish
+      - `fetch()` make the output available
+
+    and `cleanup()` is called at the end of a with block.
+
+    The time taken by each hook is recorded in `metrics['phase_seconds']`.
+    Runners can add their own measurements to `metrics`.
+
+    Runners which return a checkpoint (`apiarist.checkpoint.Checkpoint`)
+    from `_checkpoint()` record each phase as it finishes, and skip the
+    phases a resumed run has already finished.
+
+    Runners which return a registry from `_job_registry()` only run a
+    job if an identical one isn't already running; otherwise they wait
+    for it and `attach()` to its result.
+    """
+
+    PHASES = ('stage', 'execute', 'fetch')
+
+    def __init__(self, job_name=None, input_path=None, hive_query=None,
+                 job_id=None):
+        self.job_name = job_name
+        # resumed runs keep the ID of the run they resume
+        self.job_id = job_id or self._generate_job_id()
+        self.start_time = time.time()
+        self.input_path = input_path
+        # the Hive script object
+        self.hive_query = hive_query
+        self.metrics = {'phase_seconds': {}}
+        # set when the job is run
+        self.checkpoint = None
+        # did the run finish, so that cleanup can remove everything?
+        self.completed = False
+
+    @classmethod
+    def options_to_kwargs(cls, options):
+        """
+        Extra constructor arguments for this runner, taken from the
+        parsed job options. Override this in runners which need more
+        than the arguments common to all runners.
+        """
+        return {}
+
+    def run(self):
+        """
+        Run the Hive job
+        """
+        JOBS_STARTED.inc(runner=self.runner_label())
+        try:
+            self._run()
+        except Exception:
+            JOBS_FAILED.inc(runner=self.runner_label())
+            raise
+        JOBS_SUCCEEDED.inc(runner=self.runner_label())
+
+    def runner_label(self):
+        """Identifies the runner in metrics"""
+        return self.__class__.__name__
+
+    def _run(self):
+        registry = self._job_registry()
+        if registry is None:
+            self._run_phases()
+            self.completed = True
+            return
+        owner = registry.acquire(self._registry_record())
+        if owner is not None:
+            result = registry.wait(owner)
+            logger.info("Using the output of identical job {0}".format(
+                        result['job_id']))
+            self.metrics['deduplicated_into'] = result['job_id']
+            self.attach(result)
+            self.completed = True
+            return
+        status = 'FAILED'
+        try:
+            self._run_phases()
+            status = 'COMPLETED'
+        finally:
+            registry.release(status)
+        self.completed = True
+
+    def _run_phases(self):
+        self.checkpoint = self._checkpoint()
+        if self.checkpoint is not None and self.checkpoint.completed_phases:
+            self._restore_checkpoint(self.checkpoint.artifacts)
+        try:
+            for phase in self.PHASES:
+                if (self.checkpoint is not None and
+                        self.checkpoint.is_complete(phase)):
+                    logger.info("Skipping {0}; it was already done".format(
+                                phase))
+                    continue
+                phase_start = time.time()
+                getattr(self, phase)()
+                self.metrics['phase_seconds'][phase] = \
+                    time.time() - phase_start
+                PHASE_SECONDS.observe(
+                    self.metrics['phase_seconds'][phase],
+                    runner=self.runner_label(), phase=phase)
+                if self.checkpoint is not None:
+                    self.checkpoint.complete_phase(
+                        phase, **self._checkpoint_artifacts())
+        except Exception:
+            if self.checkpoint is not None:
+                logger.info("To carry on from where this run stopped, "
+                            "run the job again with --resume {0}".format(
+                                self.job_id))
+            raise
+        if self.checkpoint is not None:
+            self.checkpoint.remove_local()
+
+    @classmethod
+    def checkpoints(cls):
+        """Does this runner record its runs, so that they can be resumed?
+        """
+        return (six.get_unbound_function(cls._checkpoint) is not
+                six.get_unbound_function(HiveJobRunner._checkpoint))
+
+    def _checkpoint(self):
+        """The `apiarist.checkpoint.Checkpoint` recording this run's
+        progress, or None to not record it
+        """
+        return None
+
+    def _checkpoint_artifacts(self):
+        """What the phases so far have left behind, for a resumed run"""
+        return {}
+
+    def _restore_checkpoint(self, artifacts):
+        """Pick up the artifacts of the run being resumed"""
+        pass
+
+    def _job_registry(self):
+        """The `apiarist.registry.JobRegistry` identical runs of this
+        job meet in, or None to always run the job
+        """
+        return None
+
+    def _registry_record(self):
+        """What a run attaching to this one needs to know"""
+        return {'job_id': self.job_id}
+
+    def attach(self, result):
+        """Use the result of an identical run instead of running"""
+        raise NotImplementedError
+
+    def stage(self):
+        """Prepare input data and the script"""
+        raise NotImplementedError
+
+    def execute(self):
+        """Run the script"""
+        raise NotImplementedError
+
+    def fetch(self):
+        """Make the results available"""
+        pass
+
+    def cleanup(self):
+        """Remove any temporary files"""
+        pass
+
+    def history_record(self):
+        """What the job history (`apiarist.history`) keeps about this run
+        """
+        phases = self.metrics['phase_seconds']
+        record = {
+            'job_id': self.job_id,
+            'job_name': self.job_name,
+            'started': self.start_time,
+            'stage_seconds': phases.get('stage'),
+            'execute_seconds': phases.get('execute'),
+            'fetch_seconds': phases.get('fetch'),
+            'total_seconds': time.time() - self.start_time,
+            }
+        # sizes are only for statistics, so missing data isn't an error
+        try:
+            record['input_bytes'], record['input_objects'] = \
+                self._input_size()
+            record['output_bytes'] = self._output_size()
+        except Exception as e:
+            logger.debug("Couldn't measure the job's data: {0}".format(e))
+        return record
+
+    def _input_size(self):
+        """Bytes and number of files of input"""
+        return None, None
+
+    def _output_size(self):
+        """Bytes of output"""
+        return None
+
+    def _generate_job_id(self):
+        """
+        Create a unique job run identifier
+        """
+        run_id = self.job_name + str(time.time())
+        digest = hashlib.md5(six.b(run_id)).hexdigest()
+        return 'hj-' + digest
+
+    #  hooks for the with statement ###
+
+    def __enter__(self):
+        """Don't do anything special at start of with block"""
+        return self
+
+    def __exit__(self, type, value, traceback):
+        """Call self.cleanup() at end of with block."""
+        self.cleanup()
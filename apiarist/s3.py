@@ -16,11 +16,19 @@
 import os
 import re
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from boto.s3.connection import S3Connection
 from boto.s3.key import Key
+from apiarist.metrics import S3_COPIED_BYTES, S3_UPLOADED_BYTES, s3_call
 
 logger = logging.getLogger(__name__)
 
+# the most keys S3 deletes in one request
+DELETE_BATCH_SIZE = 1000
+
+# delete requests sent at once
+DELETE_THREADS = 4
+
 
 class MissingDataException(Exception):
     pass
@@ -32,6 +40,7 @@ def get_conn(aws_access_key_id=None, aws_secret_access_key=None):
     return S3Connection(k, s)
 
 
+@s3_call('copy')
 def copy_s3_file(source, destination,
                  aws_access_key_id=None, aws_secret_access_key=None):
     """ Copy an S3 object from one location to another
@@ -53,6 +62,7 @@ def copy_s3_file(source, destination,
                                                              dest_bucket,
                                                              new_key))
             d_bkt.copy_key(new_key, source_bucket, k.key)
+            S3_COPIED_BYTES.inc(k.size)
         return destination + '/'
     else:
         bkt = conn.get_bucket(dest_bucket)
@@ -60,9 +70,15 @@ def copy_s3_file(source, destination,
                                                          source_key,
                                                          dest_bucket,
                                                          dest_key))
-        return bkt.copy_key(dest_key, source_bucket, source_key)
+        copied = bkt.copy_key(dest_key, source_bucket, source_key)
+        # S3's copy response may not give the size; it isn't
+        # worth a HEAD request just for the metrics
+        if getattr(copied, 'size', None):
+            S3_COPIED_BYTES.inc(copied.size)
+        return copied
 
 
+@s3_call('upload')
 def upload_file_to_s3(file_path, s3_path,
                       aws_access_key_id=None, aws_secret_access_key=None):
     """Create an S3 object from the contents of a local file
@@ -72,7 +88,136 @@ def upload_file_to_s3(file_path, s3_path,
     bkt = conn.get_bucket(s3_bucket)
     k = Key(bkt)
     k.key = s3_key
-    return k.set_contents_from_filename(file_path)
+    written = k.set_contents_from_filename(file_path)
+    S3_UPLOADED_BYTES.inc(os.path.getsize(file_path))
+    return written
+
+
+@s3_call('upload')
+def upload_string_to_s3(contents, s3_path,
+                        aws_access_key_id=None, aws_secret_access_key=None):
+    """Create an S3 object from a string
+    """
+    s3_bucket, s3_key = parse_s3_uri(s3_path)
+    conn = get_conn(aws_access_key_id, aws_secret_access_key)
+    bkt = conn.get_bucket(s3_bucket)
+    k = Key(bkt)
+    k.key = s3_key
+    written = k.set_contents_from_string(contents)
+    S3_UPLOADED_BYTES.inc(len(contents))
+    return written
+
+
+@s3_call('download')
+def download_s3_file(s3_path, file_path,
+                     aws_access_key_id=None, aws_secret_access_key=None):
+    """Write the contents of an S3 object to a local file
+    """
+    s3_bucket, s3_key = parse_s3_uri(s3_path)
+    conn = get_conn(aws_access_key_id, aws_secret_access_key)
+    key = conn.get_bucket(s3_bucket).get_key(s3_key)
+    if key is None:
+        raise MissingDataException("{0} does not exist".format(s3_path))
+    key.get_contents_to_filename(file_path)
+
+
+@s3_call('list')
+def s3_size(s3_path, aws_access_key_id=None, aws_secret_access_key=None):
+    """Total bytes and number of the objects at or under `s3_path`
+    """
+    s3_bucket, s3_key = parse_s3_uri(s3_path)
+    conn = get_conn(aws_access_key_id, aws_secret_access_key)
+    keys = get_bucket_list(conn.get_bucket(s3_bucket), s3_key)
+    return sum(k.size for k in keys), len(keys)
+
+
+@s3_call('head')
+def s3_key_exists(s3_path, aws_access_key_id=None, aws_secret_access_key=None):
+    """Is there an object at `s3_path`?
+    """
+    s3_bucket, s3_key = parse_s3_uri(s3_path)
+    conn = get_conn(aws_access_key_id, aws_secret_access_key)
+    return conn.get_bucket(s3_bucket).get_key(s3_key) is not None
+
+
+@s3_call('list')
+def s3_fingerprint(s3_path,
+                   aws_access_key_id=None, aws_secret_access_key=None):
+    """Name, size and ETag of the object at `s3_path`, or of
+    each object under it if it is a 'directory'
+    """
+    s3_bucket, s3_key = parse_s3_uri(s3_path)
+    conn = get_conn(aws_access_key_id, aws_secret_access_key)
+    bkt = conn.get_bucket(s3_bucket)
+    if is_dir(s3_path):
+        keys = get_bucket_list(bkt, s3_key)
+    else:
+        key = bkt.get_key(s3_key)
+        if key is None:
+            raise MissingDataException("{0} does not exist".format(s3_path))
+        keys = [key]
+    return "\n".join("{0}:{1}:{2}".format(k.name, k.size, k.etag)
+                     for k in keys)
+
+
+@s3_call('list')
+def list_prefixes(s3_path,
+                  aws_access_key_id=None, aws_secret_access_key=None):
+    """The 'directories' directly under `s3_path`, as S3 URIs
+    """
+    s3_bucket, s3_key = parse_s3_uri(s3_path)
+    conn = get_conn(aws_access_key_id, aws_secret_access_key)
+    bkt = conn.get_bucket(s3_bucket)
+    return ['s3://{0}/{1}'.format(s3_bucket, p.name)
+            for p in bkt.list(s3_key, delimiter='/')
+            if p.name.endswith('/')]
+
+
+@s3_call('list')
+def list_keys(s3_path, aws_access_key_id=None, aws_secret_access_key=None):
+    """The objects under `s3_path`"""
+    s3_bucket, s3_key = parse_s3_uri(s3_path)
+    conn = get_conn(aws_access_key_id, aws_secret_access_key)
+    return list(conn.get_bucket(s3_bucket).list(s3_key))
+
+
+@s3_call('delete')
+def delete_keys(bucket_name, key_names, aws_access_key_id=None,
+                aws_secret_access_key=None, threads=DELETE_THREADS):
+    """Delete objects with multi-object delete requests of up to
+    `DELETE_BATCH_SIZE` keys, several at once. Returns the number
+    of objects deleted; failures are logged.
+    """
+    batches = [key_names[i:i + DELETE_BATCH_SIZE]
+               for i in range(0, len(key_names), DELETE_BATCH_SIZE)]
+    if not batches:
+        return 0
+
+    def delete(batch):
+        # boto connections shouldn't be shared between threads
+        conn = get_conn(aws_access_key_id, aws_secret_access_key)
+        result = conn.get_bucket(bucket_name).delete_keys(batch, quiet=True)
+        for error in result.errors:
+            logger.warning("Couldn't delete s3://{0}/{1}: {2}".format(
+                           bucket_name, error.key, error.message))
+        return len(batch) - len(result.errors)
+
+    with ThreadPoolExecutor(max_workers=min(threads, len(batches))) as pool:
+        return sum(pool.map(delete, batches))
+
+
+def delete_prefix(s3_path, keep=(),
+                  aws_access_key_id=None, aws_secret_access_key=None):
+    """Delete the objects under `s3_path`, except those under any
+    of the `keep` URIs. Returns the number of objects deleted.
+    """
+    s3_bucket, _ = parse_s3_uri(s3_path)
+    keep = [parse_s3_uri(uri)[1] for uri in keep]
+    names = [k.name for k in list_keys(s3_path, aws_access_key_id,
+                                       aws_secret_access_key)
+             if not any(k.name.startswith(prefix) for prefix in keep)]
+    return delete_keys(s3_bucket, names, aws_access_key_id,
+                       aws_secret_access_key)
 
 
 def parse_s3_uri(uri):
@@ -102,6 +247,7 @@ def is_dir(key):
     return obj_type(key) == 'directory'
 
 
+@s3_call('concatenate')
 def concatenate_keys(source_dir, destination_key,
                      aws_access_key_id=None, aws_secret_access_key=None):
     """Concatenate all the files in a bucket
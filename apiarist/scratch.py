@@ -0,0 +1,191 @@
+# Copyright 2014 Max Sharples
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Local scratch directories: removing them without holding up the run,
+and keeping the ones retained for ad-hoc queries under a quota.
+
+A directory is removed by renaming it, so that its name is free straight
+away, and deleting the renamed copy in a thread. Retained job directories
+are evicted least recently used first, going by the newest modification
+time of anything in them, along with the input tables cached for later
+runs. The directory of a run in progress is marked with the run's
+process ID and never evicted.
+"""
+import os
+import re
+import shutil
+import errno
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# renamed directories waiting to be deleted
+TRASH_SUFFIX = '.deleting'
+
+# names of job scratch directories
+JOB_DIR_RE = re.compile(r'^hj-[0-9a-f]{32}$')
+
+# names of cached input tables
+TABLE_DIR_RE = re.compile(r'^[0-9a-f]{32}$')
+
+# holds the process ID of the run using the directory
+ACTIVE_MARKER = '.active'
+
+SIZE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_size(size):
+    """Bytes in a size such as `500M` or `20G`; plain numbers are bytes
+    """
+    if size is None:
+        return None
+    size = str(size).strip().upper()
+    if size.endswith('B'):
+        size = size[:-1]
+    multiplier = 1
+    if size[-1:] in SIZE_UNITS:
+        multiplier = SIZE_UNITS[size[-1]]
+        size = size[:-1]
+    try:
+        return int(float(size) * multiplier)
+    except ValueError:
+        raise ValueError("can't understand the size '{0}'".format(size))
+
+
+def dir_usage(path):
+    """Total bytes of the files under `path`, and the newest
+    modification time of it or anything in it
+    """
+    total = 0
+    newest = os.path.getmtime(path)
+    for directory, _, names in os.walk(path):
+        newest = max(newest, os.path.getmtime(directory))
+        for name in names:
+            try:
+                stat = os.stat(os.path.join(directory, name))
+            except OSError:
+                # removed while we were looking
+                continue
+            total += stat.st_size
+            newest = max(newest, stat.st_mtime)
+    return total, newest
+
+
+def _rmtree(path, background):
+    if not background:
+        shutil.rmtree(path, ignore_errors=True)
+        return None
+    thread = threading.Thread(target=shutil.rmtree, args=(path,),
+                              kwargs={'ignore_errors': True},
+                              name='remove-{0}'.format(os.path.basename(path)))
+    thread.start()
+    return thread
+
+
+def remove_dir(path, background=False):
+    """Remove a directory. In the background, returns the thread
+    deleting it (or None if there was nothing to delete).
+    """
+    path = path.rstrip('/')
+    if not background:
+        return _rmtree(path, False)
+    trash = path + TRASH_SUFFIX
+    try:
+        os.rename(path, trash)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return None
+        raise
+    return _rmtree(trash, True)
+
+
+def mark_active(path):
+    """Mark a scratch directory as in use by this process"""
+    with open(os.path.join(path, ACTIVE_MARKER), 'w') as f:
+        f.write(str(os.getpid()))
+
+
+def clear_active(path):
+    try:
+        os.remove(os.path.join(path, ACTIVE_MARKER))
+    except OSError:
+        pass
+
+
+def is_active(path):
+    """Is a run using this directory?"""
+    try:
+        with open(os.path.join(path, ACTIVE_MARKER)) as f:
+            pid = int(f.read())
+    except (IOError, OSError, ValueError):
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno != errno.ESRCH
+    return True
+
+
+def table_cache_dir(root):
+    """Where input tables are cached, beside the scratch dirs"""
+    return os.path.join(root, 'tables')
+
+
+def _evictable_dirs(root):
+    """Job directories and cached tables under `root`; removes
+    directories left behind by runs which stopped while removing them
+    """
+    for parent, name_re in ((root, JOB_DIR_RE),
+                            (table_cache_dir(root), TABLE_DIR_RE)):
+        if not os.path.isdir(parent):
+            continue
+        for name in os.listdir(parent):
+            path = os.path.join(parent, name)
+            if not os.path.isdir(path):
+                continue
+            if name.endswith(TRASH_SUFFIX):
+                yield path, True
+            elif name_re.match(name):
+                yield path, False
+
+
+def enforce_quota(root, quota, background=False):
+    """Evict the least recently used job directories and cached tables
+    under `root` until they take up at most `quota` bytes. Returns the
+    directories evicted.
+    """
+    dirs = []
+    for path, is_trash in list(_evictable_dirs(root)):
+        if is_trash:
+            _rmtree(path, background)
+        else:
+            size, last_used = dir_usage(path)
+            dirs.append((last_used, path, size))
+    total = sum(size for _, _, size in dirs)
+    evicted = []
+    for _, path, size in sorted(dirs):
+        if total <= quota:
+            break
+        if is_active(path):
+            continue
+        logger.info("Evicting {0} from the scratch directory".format(path))
+        remove_dir(path, background)
+        total -= size
+        evicted.append(path)
+    if total > quota:
+        logger.warning("Scratch directories in {0} take up {1} bytes, over "
+                       "the quota of {2}, but are in use".format(
+                           root, total, quota))
+    return evicted
@@ -13,11 +13,27 @@
 # limitations under the License.
 from apiarist.serde import Serde
 from apiarist import InvalidHiveJobException
+from apiarist.util import unescape_control_char
 import os
+import re
+import copy
 import logging
 
 logger = logging.getLogger(__name__)
 
+# quoted strings in HiveQL, which can't reference columns
+STRING_LITERAL_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+
+# names in HiveQL, plain or in backticks
+IDENTIFIER_RE = re.compile(r"`([^`]+)`|([A-Za-z_][A-Za-z0-9_]*)")
+
+# operators allowed in a job's predicates
+PREDICATE_OPERATORS = ('=', '!=', '<', '<=', '>', '>=', 'in')
+
+# SELECT *, SELECT t.* and the like, which use every column
+SELECT_ALL_RE = re.compile(r"(\bSELECT|,)\s*(DISTINCT\s+)?(\w+\.)?\*",
+                           re.IGNORECASE)
+
 
 def generate_hive_script_file(script, local_script_file):
     f = open(local_script_file, 'w')
@@ -65,8 +81,15 @@ class HiveQuery(object):
             self.results_table_name = self.table_name + "_results"
             logger.debug("setting input columns")
             self.input_columns = hive_job.input_columns()
-            logger.debug("setting output columns")
-            self.output_columns = hive_job.output_columns()
+            logger.debug("setting input predicates")
+            self.predicates = self._check_predicates(hive_job.predicates())
+            logger.debug("setting outputs")
+            self.outputs = self._check_outputs(hive_job.outputs())
+            if not self.outputs:
+                logger.debug("setting output columns")
+                self.output_columns = hive_job.output_columns()
+            else:
+                self.output_columns = None
             logger.debug("setting input control characters")
             self.input_control_chars = (hive_job.INFILE_DELIMITER_CHAR,
                                         hive_job.INFILE_QUOTE_CHAR,
@@ -78,7 +101,10 @@ class HiveQuery(object):
                                          hive_job.OUTFILE_ESCAPE_CHAR
                                          )
             logger.debug("setting plain qeury content")
-            self.query = hive_job.plain_query()
+            if not self.outputs:
+                self.query = hive_job.plain_query()
+            else:
+                self.query = self._multi_insert_query()
 
         except AttributeError as e:
             logger.error("Error encoutered setting query attributes")
@@ -98,77 +124,275 @@ class HiveQuery(object):
         #  TODO validate the input/output columns for
         #  proper data types and reserved keywords
 
+        # the input columns to load, when not all of them
+        self.load_columns = None
+
     def __repr__(self):
         return "HiveQuery:{}...".format(self.query[:80])
 
-    def _csv_serde_jar(self, s3_scratch_uri):
+    def _check_outputs(self, outputs):
+        """Output names become table and directory names
+        """
+        outputs = list(outputs or [])
+        names = [output[0] for output in outputs]
+        for name in names:
+            if not re.match(r'^[A-Za-z0-9_]+$', name):
+                raise InvalidHiveJobException(
+                    "invalid output name '{0}'; use letters, numbers "
+                    "and underscores".format(name))
+        if len(set(names)) != len(names):
+            raise InvalidHiveJobException(
+                "output names must be unique: {0}".format(names))
+        return outputs
+
+    def _check_predicates(self, predicates):
+        """Predicates must be on input columns, with known operators
+        """
+        predicates = list(predicates or [])
+        names = [col[0] for col in self.input_columns]
+        for column, op, value in predicates:
+            if column not in names:
+                raise InvalidHiveJobException(
+                    "predicate on unknown column '{0}'".format(column))
+            if op not in PREDICATE_OPERATORS:
+                raise InvalidHiveJobException(
+                    "unknown predicate operator '{0}'; use one of {1}".format(
+                        op, ", ".join(PREDICATE_OPERATORS)))
+        return predicates
+
+    def output_table(self, name):
+        """Name of the results table for the output `name`
+        """
+        return "{0}_{1}".format(self.table_name, name)
+
+    def output_location(self, output_dir, name):
+        """Where the output `name` is written, under `output_dir`
+        """
+        return "{0}/{1}/".format(output_dir.rstrip('/'), name)
+
+    def output_names(self):
+        """Names of the outputs, which are written to directories under
+        the output directory; [None] when the results go straight into
+        the output directory
+        """
+        return [table[2] for table in self._results_tables()]
+
+    def _input_queries(self):
+        """The queries which read the input table
+        """
+        return [self.query]
+
+    def referenced_columns(self):
+        """The input columns the queries use, in table order.
+        All of them if a query selects `*`.
+        """
+        names = set()
+        for query in self._input_queries():
+            query = STRING_LITERAL_RE.sub("''", query)
+            if SELECT_ALL_RE.search(query):
+                return list(self.input_columns)
+            for quoted, plain in IDENTIFIER_RE.findall(query):
+                names.add((quoted or plain).lower())
+        return [col for col in self.input_columns if col[0].lower() in names]
+
+    def prune_input_columns(self):
+        """Only load the input columns the queries use. Returns the
+        columns to load, or None if they are all needed.
+        """
+        columns = self.referenced_columns()
+        if columns and len(columns) < len(self.input_columns):
+            self.load_columns = columns
+            logger.info("Loading {0} of {1} input columns: {2}".format(
+                len(columns), len(self.input_columns),
+                ", ".join(col[0] for col in columns)))
+        else:
+            self.load_columns = None
+        return self.load_columns
+
+    def source_table_name(self):
+        """The table holding all the input columns, when the
+        input table is a narrow copy of it
+        """
+        return self.table_name + "_source"
+
+    def _multi_insert_query(self):
+        """One statement which scans the input table once and
+        inserts into the results table of each output
+        """
+        lines = ["FROM {0}".format(self.table_name)]
+        for name, columns, select in self.outputs:
+            select = re.sub(r"\s+", " ", select).strip().rstrip(';')
+            lines.append("INSERT INTO TABLE {0} {1}".format(
+                self.output_table(name), select))
+        return "\n".join(lines) + ';'
+
+    def _results_tables(self):
+        """(table, columns, output name) for each results table
+        """
+        if not self.outputs:
+            return [(self.results_table_name, self.output_columns, None)]
+        return [(self.output_table(name), columns, name)
+                for name, columns, select in self.outputs]
+
+    def _results_tables_ddl(self, output_dir):
+        """Tables to select the results into (for CSV formatting)
+        """
+        parts = []
+        for table, columns, name in self._results_tables():
+            location = output_dir
+            if name:
+                location = self.output_location(output_dir, name)
+            parts += self.create_table_ddl(table, columns, location,
+                                           self.output_control_chars)
+        return parts
+
+    def _csv_serde_jar(self, s3_scratch_uri, context=None):
         """Using a JAR for serialisation/deserialisation in the Hive tables
         """
-        serde = Serde('csv', s3_scratch_uri)
+        serde = Serde('csv', s3_scratch_uri, context)
         return serde.s3_path()
 
-    def local_hive_script(self, data_source, output_dir, temp_table_dir):
+    def local_input_table_ddl(self, temp_table_dir):
+        """The table the source data is loaded into for a local run
+        (already narrowed to the load columns, if there are any)
+        """
+        return self.create_table_ddl(self.table_name,
+                                     self.load_columns or self.input_columns,
+                                     temp_table_dir,
+                                     self.input_control_chars)
+
+    def local_hive_script(self, data_source, output_dir, temp_table_dir,
+                          load_data=True):
         """generate a hive script to execute on the local hive server
-        generates a CSV file via a hive textfile table
+        generates a CSV file via a hive textfile table.
+        Without `load_data` the input table is defined over the data
+        already in `temp_table_dir`, which is not loaded again.
         """
         # boilerplate
         parts = [
             #  serde required before attempting drop tables
             "ADD JAR {0};".format(Serde('csv').jar),
             "DROP TABLE {0};".format(self.table_name),
-            "DROP TABLE {0};".format(self.results_table_name),
             ]
+        parts += ["DROP TABLE {0};".format(table[0])
+                  for table in self._results_tables()]
         #  add the table in which we'll load the source data
-        parts += self.create_table_ddl(self.table_name,
-                                       self.input_columns,
-                                       temp_table_dir,
-                                       self.input_control_chars)
+        #  (dropping an external table leaves its data where it is)
+        parts += self.local_input_table_ddl(temp_table_dir)
         #  add statement to load the source data into this table
-        parts.append("LOAD DATA LOCAL INPATH '{0}' INTO TABLE {1};".format(
-            data_source, self.table_name))
-        #  add a table to select the results into (for CSV formatting)
-        parts += self.create_table_ddl(self.results_table_name,
-                                       self.output_columns,
-                                       output_dir,
-                                       self.output_control_chars)
-        #  insert the results of the supplied query into this table
-        parts.append("INSERT INTO TABLE {0}".format(
-            self.results_table_name, self.query))
-        #  and finally, the query
-        parts.append(self.query)
+        if load_data:
+            parts.append(
+                "LOAD DATA LOCAL INPATH '{0}' INTO TABLE {1};".format(
+                    data_source, self.table_name))
+        #  add the tables to select the results into (for CSV formatting)
+        parts += self._results_tables_ddl(output_dir)
+        #  and finally, insert the results of the query into this table
+        parts += self._insert_results()
         #  return a string that can be written to a file and run on Hive
         return "\n".join(parts)
 
     def emr_hive_script(self, data_source, output_dir, temp_table_dir,
-                        s3_scratch_uri=None):
+                        s3_scratch_uri=None, context=None):
         """Generate the complete Hive script for EMR
-        igenerates a set of comma-delimited files via a hive textfile table
+        igenerates a set of comma-delimited files via a hive textfile table.
+        The serde jar is found or put on S3 with the run's `context`.
         """
         # boilerplate
         parts = [
-            "ADD JAR {0};".format(self._csv_serde_jar(s3_scratch_uri)),
+            "ADD JAR {0};".format(self._csv_serde_jar(s3_scratch_uri,
+                                                      context)),
             "SET hive.exec.compress.output=false;"
             ]
+        # the tables may be left from an earlier run on a pooled cluster
+        # (dropping an external table leaves its data where it is)
+        load_table = self.table_name
+        if self.load_columns:
+            load_table = self.source_table_name()
+        parts.append("DROP TABLE IF EXISTS {0};".format(load_table))
+        parts += ["DROP TABLE IF EXISTS {0};".format(table[0])
+                  for table in self._results_tables()]
         # add the table in which we'll load the source data
-        parts += self.create_table_ddl(self.table_name,
+        parts += self.create_table_ddl(load_table,
                                        self.input_columns,
                                        temp_table_dir,
                                        self.input_control_chars)
         # add statement to load the source data into this table
         parts.append("LOAD DATA INPATH '{0}' INTO TABLE {1};".format(
-            data_source, self.table_name))
-        # add a table to select the results into (for CSV formatting)
-        parts += self.create_table_ddl(self.results_table_name,
-                                       self.output_columns,
-                                       output_dir,
-                                       self.output_control_chars)
-        # insert the results of the supplied query into this table
-        parts.append("INSERT INTO TABLE {0}".format(self.results_table_name))
-        # and finally, the query
-        parts.append(self.query)
+            data_source, load_table))
+        if self.load_columns:
+            # a narrow copy of the input, in HDFS, for the queries to scan
+            cols = ", ".join("`{0}`".format(col[0])
+                             for col in self.load_columns)
+            parts += [
+                "DROP TABLE IF EXISTS {0};".format(self.table_name),
+                "CREATE TABLE {0} AS SELECT {1} FROM {2};".format(
+                    self.table_name, cols, load_table),
+                ]
+        # add the tables to select the results into (for CSV formatting)
+        parts += self._results_tables_ddl(output_dir)
+        # and finally, insert the results of the query into this table
+        parts += self._insert_results()
+        if self.load_columns:
+            # the narrow copy is managed, so this frees its HDFS space
+            parts.append("DROP TABLE {0};".format(self.table_name))
         # return a string that can be written to a file and run on Hive
         return "\n".join(parts)
 
+    def spark_script(self, data_source, output_dir):
+        """Generate a PySpark script which runs the query with Spark SQL.
+        The input is read directly with Spark's CSV reader, so there is
+        no table to load first.
+        """
+        if self.outputs:
+            raise InvalidHiveJobException(
+                "jobs with several outputs can't be run with Spark")
+        in_chars = [unescape_control_char(c) for c in self.input_control_chars]
+        parts = [
+            "from pyspark.sql import SparkSession",
+            "spark = SparkSession.builder.appName({0!r}).getOrCreate()".format(
+                self.table_name),
+            # register the input under the table name used in the query
+            "spark.read.csv({0!r}, schema={1!r}, "
+            "sep={2!r}, quote={3!r}, escape={4!r})"
+            ".createOrReplaceTempView({5!r})".format(
+                data_source, self._column_ddl(self.input_columns),
+                in_chars[0], in_chars[1], in_chars[2], self.table_name),
+            ]
+        parts += self._spark_outputs(output_dir)
+        parts.append("spark.stop()")
+        return "\n".join(parts) + "\n"
+
+    def _spark_outputs(self, output_dir):
+        """Statements which run the query and write the results
+        """
+        return self._spark_results() + [self._spark_write(output_dir)]
+
+    def _spark_write(self, output_dir):
+        """Statement which writes the `results` DataFrame to `output_dir`
+        """
+        out_chars = [unescape_control_char(c)
+                     for c in self.output_control_chars]
+        output_names = [col[0] for col in self.output_columns]
+        # append, like Hive's INSERT INTO, and quote like the CSV serde
+        return ("results.toDF(*{0!r}).write.csv({1!r}, mode='append', "
+                "sep={2!r}, quote={3!r}, escape={4!r}, quoteAll=True)".format(
+                    output_names, output_dir,
+                    out_chars[0], out_chars[1], out_chars[2]))
+
+    def _insert_results(self):
+        """Statements which run the query into the results table
+        """
+        if self.outputs:
+            # the multi-insert names its results tables
+            return [self.query]
+        return ["INSERT INTO TABLE {0}".format(self.results_table_name),
+                self.query]
+
+    def _spark_results(self):
+        """Statements which set `results` to the query's DataFrame
+        """
+        return ["results = spark.sql({0!r})".format(self.query.rstrip(';'))]
+
     def create_table_ddl(self, name, columns, location, control_chars):
         """Create a Hive table to store CSV data
         """
@@ -190,3 +414,154 @@ class HiveQuery(object):
         """
         cols = ["`{0}` {1}".format(col[0], col[1]) for col in columns]
         return ", ".join(cols)
+
+
+class PipelineQuery(HiveQuery):
+    """Runs the queries of a list of HiveJobs in one script.
+
+    The results of each query but the last are inserted into a managed
+    table, kept in HDFS, named after the next job's input table. Only the
+    first job's input is loaded and only the last job's results are
+    written to the output directory.
+    """
+
+    def __init__(self, hive_jobs):
+        if not hive_jobs:
+            raise InvalidHiveJobException("a pipeline needs at least one job")
+        # the input is the first job's; only the output differs
+        super(PipelineQuery, self).__init__(hive_jobs[0])
+        self.steps = [HiveQuery(job) for job in hive_jobs]
+        last = self.steps[-1]
+        self.results_table_name = last.results_table_name
+        self.output_columns = last.output_columns
+        self.output_control_chars = last.output_control_chars
+        self.outputs = last.outputs
+        self.query = last.query
+        self._check_steps()
+
+    def __repr__(self):
+        return "PipelineQuery:{0}".format(
+            " > ".join(step.table_name for step in self.steps))
+
+    def output_table(self, name):
+        return self.steps[-1].output_table(name)
+
+    def _input_queries(self):
+        return self.steps[0]._input_queries()
+
+    def intermediate_tables(self):
+        """The tables passing results from one step to the next
+        """
+        return [step.table_name for step in self.steps[1:]]
+
+    def _check_steps(self):
+        """Each step's output must fit the next step's input table
+        """
+        names = [step.table_name for step in self.steps]
+        if len(set(names)) != len(names):
+            raise InvalidHiveJobException(
+                "pipeline steps must use different tables: {0}".format(names))
+        if any(step.outputs for step in self.steps[:-1]):
+            raise InvalidHiveJobException(
+                "only the last step of a pipeline can have several outputs")
+        for i, (step, nxt) in enumerate(zip(self.steps, self.steps[1:])):
+            output_cols = [(c[0].lower(), c[1].upper())
+                           for c in step.output_columns]
+            input_cols = [(c[0].lower(), c[1].upper())
+                          for c in nxt.input_columns]
+            if output_cols != input_cols:
+                raise InvalidHiveJobException(
+                    "output columns of step {0} ({1}) don't match the input "
+                    "columns of step {2} ({3})".format(
+                        i + 1, step.table_name, i + 2, nxt.table_name))
+
+    def _insert_results(self):
+        parts = []
+        for step, nxt in zip(self.steps, self.steps[1:]):
+            parts += [
+                "DROP TABLE IF EXISTS {0};".format(nxt.table_name),
+                "CREATE TABLE {0} ({1});".format(
+                    nxt.table_name, self._column_ddl(nxt.input_columns)),
+                "INSERT INTO TABLE {0}".format(nxt.table_name),
+                step.query,
+                ]
+        parts += super(PipelineQuery, self)._insert_results()
+        # the intermediate results are no use once the last query has run
+        parts += ["DROP TABLE {0};".format(table)
+                  for table in self.intermediate_tables()]
+        return parts
+
+    def _spark_results(self):
+        parts = []
+        for step, nxt in zip(self.steps, self.steps[1:]):
+            parts.append(
+                "spark.sql({0!r}).createOrReplaceTempView({1!r})".format(
+                    step.query.rstrip(';'), nxt.table_name))
+        return parts + super(PipelineQuery, self)._spark_results()
+
+
+class SweepQuery(HiveQuery):
+    """Runs a job's query once for each of a list of parameter sets,
+    from one load of the input.
+
+    Each parameter set is a list of (option dest, value) pairs; the job's
+    query is built with its options set to those values. The results of
+    each variant are written under the output directory in Hive's
+    partition layout, e.g. `<output dir>/startdate=2014-01-01/`.
+    """
+
+    def __init__(self, hive_job, param_sets):
+        super(SweepQuery, self).__init__(hive_job)
+        if self.outputs:
+            raise InvalidHiveJobException(
+                "a sweep can't be combined with several outputs")
+        if not param_sets:
+            raise InvalidHiveJobException("a sweep needs parameter sets")
+        # predicates may depend on the swept options, and
+        # every variant reads the same input
+        self.predicates = []
+        self.variants = []  # (tag, query)
+        options = hive_job.options
+        try:
+            for params in param_sets:
+                hive_job.options = copy.copy(options)
+                for dest, value in params:
+                    setattr(hive_job.options, dest, value)
+                self.variants.append((self.sweep_tag(params),
+                                      HiveQuery(hive_job).query))
+        finally:
+            hive_job.options = options
+
+    def __repr__(self):
+        return "SweepQuery:{0} variants of {1}...".format(
+            len(self.variants), self.query[:80])
+
+    @staticmethod
+    def sweep_tag(params):
+        """'dest=value' for each parameter, as nested directories
+        """
+        return "/".join("{0}={1}".format(dest, value)
+                        for dest, value in params)
+
+    def _input_queries(self):
+        return [query for tag, query in self.variants]
+
+    def _results_tables(self):
+        return [("{0}_{1}".format(self.results_table_name, i),
+                 self.output_columns, tag)
+                for i, (tag, query) in enumerate(self.variants)]
+
+    def _insert_results(self):
+        parts = []
+        for table, (tag, query) in zip(self._results_tables(), self.variants):
+            parts += ["INSERT INTO TABLE {0}".format(table[0]), query]
+        return parts
+
+    def _spark_outputs(self, output_dir):
+        parts = []
+        for tag, query in self.variants:
+            parts += [
+                "results = spark.sql({0!r})".format(query.rstrip(';')),
+                self._spark_write(self.output_location(output_dir, tag)),
+                ]
+        return parts
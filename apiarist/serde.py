@@ -12,7 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import os
-from apiarist.s3 import upload_file_to_s3
+from apiarist.context import ExecutionContext
 
 
 class UnknownSerdeError(Exception):
@@ -25,7 +25,7 @@ class Serde(object):
     JARS_DIR = os.path.join(os.path.dirname(__file__), 'jars')
     CSV_JAR = 'csv-serde-1.1.2-0.11.0-all.jar'
 
-    def __init__(self, serde='csv', s3_base_path=None):
+    def __init__(self, serde='csv', s3_base_path=None, context=None):
         if serde == 'csv':
             self.type = 'CSV'
             self.jar = os.path.abspath(os.path.join(self.JARS_DIR,
@@ -33,21 +33,13 @@ class Serde(object):
         else:
             raise UnknownSerdeError
 
+        # credentials, scratch space and the jar's location on S3
+        if context is None:
+            context = ExecutionContext(scratch_uri=s3_base_path)
+        self.context = context
         # base path for s3 files
-        if s3_base_path is None:
-            s3_base_path = os.environ.get('S3_SCRATCH_URI')
-        self._s3_base_path = s3_base_path
+        self._s3_base_path = context.scratch_uri
 
     def s3_path(self):
         """get or create a location on S3 for the serde jar"""
-        if 'CSV_SERDE_JAR_S3' in os.environ:
-            # known location on S3
-            serde = os.environ['CSV_SERDE_JAR_S3']
-        else:
-            if self._s3_base_path is None:
-                raise ValueError("must specify the S3 scratch URI")
-            # ensure the jar is up on S3
-            jar_path = self._s3_base_path + 'jars/csv-serde.jar'
-            upload_file_to_s3(self.jar, jar_path)
-            os.environ['CSV_SERDE_JAR_S3'] = serde = jar_path
-        return serde
+        return self.context.serde_jar(self.jar)
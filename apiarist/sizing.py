@@ -0,0 +1,140 @@
+# Copyright 2014 Max Sharples
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Choose the size of an EMR cluster for a job from the size of its
+input and the job's past runs.
+
+Past runs (from `apiarist.history`) give the job's throughput: bytes of
+input processed per second by each core of the cluster's core instances,
+while the query step ran. Starting the cluster and installing Hive take
+about as long whatever the cluster's size, so they aren't counted. The
+cluster is then sized so that the query should take about the target
+time, within the allowed instance types and counts.
+"""
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+# vCPUs of the instance types auto-sizing can choose from
+VCPUS = {
+    'm3.xlarge': 4, 'm3.2xlarge': 8,
+    'm4.xlarge': 4, 'm4.2xlarge': 8, 'm4.4xlarge': 16, 'm4.10xlarge': 40,
+    'm5.xlarge': 4, 'm5.2xlarge': 8, 'm5.4xlarge': 16, 'm5.12xlarge': 48,
+    'c4.xlarge': 4, 'c4.2xlarge': 8, 'c4.4xlarge': 16, 'c4.8xlarge': 36,
+    'c5.xlarge': 4, 'c5.2xlarge': 8, 'c5.4xlarge': 16, 'c5.9xlarge': 36,
+    'r4.xlarge': 4, 'r4.2xlarge': 8, 'r4.4xlarge': 16, 'r4.8xlarge': 32,
+    'r5.xlarge': 4, 'r5.2xlarge': 8, 'r5.4xlarge': 16, 'r5.12xlarge': 48,
+    }
+
+# throughput assumed for jobs with no history
+DEFAULT_BYTES_PER_CORE_SECOND = 4 * 1024 * 1024
+
+# how many of the job's most recent runs to learn from
+HISTORY_RUNS = 10
+
+
+class SizingError(Exception):
+    pass
+
+
+def worker_cores(instance_type, num_instances):
+    """Cores doing the work; the master instance doesn't, unless
+    it is the only one
+    """
+    return VCPUS[instance_type] * max(int(num_instances) - 1, 1)
+
+
+def _rates(runs):
+    """Bytes per core-second of the runs which have the
+    sizes and timings needed
+    """
+    rates = []
+    for run in runs:
+        if not (run.get('input_bytes') and run.get('query_seconds') and
+                run.get('num_instances') and
+                run.get('slave_instance_type') in VCPUS):
+            continue
+        cores = worker_cores(run['slave_instance_type'],
+                             run['num_instances'])
+        rates.append(run['input_bytes'] /
+                     float(run['query_seconds'] * cores))
+    return rates
+
+
+def job_throughput(runs):
+    """Median bytes per core-second of the runs, or None if none of
+    them have the sizes and timings needed
+    """
+    rates = _rates(runs)
+    if not rates:
+        return None
+    rates.sort()
+    middle = len(rates) // 2
+    if len(rates) % 2:
+        return rates[middle]
+    return (rates[middle - 1] + rates[middle]) / 2.0
+
+
+class ClusterSize(object):
+    """The chosen instance type and count, and how long the
+    query is expected to take with them
+    """
+
+    def __init__(self, instance_type, num_instances, predicted_seconds,
+                 runs_used):
+        self.instance_type = instance_type
+        self.num_instances = num_instances
+        self.predicted_seconds = predicted_seconds
+        # past runs the prediction is based on; 0 means a guess
+        self.runs_used = runs_used
+
+    def __repr__(self):
+        return "ClusterSize({0!r}, {1!r}, {2!r}, {3!r})".format(
+            self.instance_type, self.num_instances, self.predicted_seconds,
+            self.runs_used)
+
+
+def estimate_size(input_bytes, runs, instance_types, target_seconds,
+                  min_instances=2, max_instances=20):
+    """
+    The smallest of `instance_types` (in the order given) which can
+    finish in `target_seconds` with at most `max_instances` instances,
+    and the number of them needed. If none can, the last instance type
+    with `max_instances`.
+    """
+    unknown = [t for t in instance_types if t not in VCPUS]
+    if unknown:
+        raise SizingError("can't auto-size with instance types {0}; "
+                          "choose from: {1}".format(
+                              ", ".join(unknown), ", ".join(sorted(VCPUS))))
+    if min_instances > max_instances:
+        raise SizingError("min instances ({0}) is more than max instances "
+                          "({1})".format(min_instances, max_instances))
+    throughput = job_throughput(runs)
+    runs_used = len(_rates(runs))
+    throughput = throughput or DEFAULT_BYTES_PER_CORE_SECOND
+    cores_needed = input_bytes / (throughput * target_seconds)
+
+    def size(instance_type, num_instances):
+        cores = worker_cores(instance_type, num_instances)
+        return ClusterSize(instance_type, num_instances,
+                           input_bytes / (throughput * cores), runs_used)
+
+    for instance_type in instance_types:
+        # plus one for the master
+        needed = int(math.ceil(cores_needed / VCPUS[instance_type])) + 1
+        if needed <= max_instances:
+            return size(instance_type, max(needed, min_instances))
+    return size(instance_types[-1], max_instances)
@@ -0,0 +1,81 @@
+# Copyright 2014 Max Sharples
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Class to run HiveJobs locally with Spark SQL instead of Hive.
+The EMR equivalent is `apiarist.emr.SparkEMRRunner`.
+"""
+import subprocess
+import logging
+from apiarist.local import LocalRunner
+from apiarist.script import generate_hive_script_file
+
+logger = logging.getLogger(__name__)
+
+
+class SparkLocalRunner(LocalRunner):
+    """
+    Runs the job's query through Spark SQL on a local
+    Spark installation, using `spark-submit`.
+    """
+
+    def __init__(self, job_name=None,
+                 input_path=None, hive_query=None, output_dir=None,
+                 temp_dir=None, no_output=False, retain_hive_table=False,
+                 spark_submit=None, validate_input=False,
+                 prune_columns=False, dedupe=False, scratch_quota=None,
+                 cache_tables=False):
+
+        super(SparkLocalRunner, self).__init__(
+            job_name=job_name, input_path=input_path, hive_query=hive_query,
+            output_dir=output_dir, temp_dir=temp_dir, no_output=no_output,
+            retain_hive_table=retain_hive_table,
+            validate_input=validate_input, dedupe=dedupe,
+            scratch_quota=scratch_quota)
+
+        # Spark only reads the columns the query uses by itself,
+        # and reads the input where it is
+        self.prune_columns = False
+        self.cache_tables = False
+
+        self.spark_submit = spark_submit or 'spark-submit'
+        self.local_script_file = self.scratch_dir + self.job_id + '.py'
+
+    def stage(self):
+        """
+        Write the PySpark script. Spark reads the input
+        where it is, so there is no data to copy.
+        """
+        if self.validate_input:
+            self._validate_input()
+        self._ensure_local_scratch_dir_exists()
+        self._clear_shared_output()
+        script = self.hive_query.spark_script(self.input_path,
+                                              self.output_dir)
+        generate_hive_script_file(script, self.local_script_file)
+
+    def _dedupe_script(self):
+        return self.hive_query.spark_script('${data_path}', '${output_dir}')
+
+    def execute(self):
+        """
+        Run the script with spark-submit
+        """
+        cmd = [self.spark_submit, self.local_script_file]
+        logger.info("running Spark script with: {}".format(cmd))
+        spark = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+        stdout = spark.communicate()
+        if stdout[1] is not None:
+            logger.info(stdout)
+        if spark.returncode != 0:
+            raise subprocess.CalledProcessError(spark.returncode, cmd)
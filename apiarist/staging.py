@@ -0,0 +1,205 @@
+# Copyright 2014 Max Sharples
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Streaming passes over local CSV input, used when staging
+the input for a local Hive run.
+
+Large files are split into byte ranges at line breaks and staged by
+several processes; this assumes quoted fields don't contain line breaks.
+Processes are only forked when no other threads are running: a child
+forked while another thread holds a lock (logging's, say) could wait
+for it forever. So when several jobs are staged at once by `apiarist run`,
+each file is staged by a single process.
+"""
+import os
+import io
+import csv
+import shutil
+import logging
+import threading
+import multiprocessing
+import six
+
+from apiarist.util import unescape_control_char
+
+logger = logging.getLogger(__name__)
+
+# files smaller than this are staged by a single process
+PARALLEL_MIN_BYTES = 64 * 1024 * 1024
+
+NUMERIC_TYPES = ('TINYINT', 'SMALLINT', 'INT', 'BIGINT', 'FLOAT', 'DOUBLE')
+
+
+def csv_format(control_chars):
+    """Arguments for `csv.reader` and `csv.writer` which match
+    the serde's delimiter, quote and escape characters
+    """
+    delimiter, quote_char, escape_char = [unescape_control_char(c)
+                                          for c in control_chars]
+    return {
+        'delimiter': delimiter,
+        'quotechar': quote_char,
+        'escapechar': escape_char,
+        # the serde escapes quotes with the escape character
+        'doublequote': escape_char == quote_char,
+        'lineterminator': '\n',
+        # like the serde writes its output
+        'quoting': csv.QUOTE_ALL,
+        }
+
+
+def open_csv(path, mode='r'):
+    """Open a file for the csv module"""
+    if six.PY3:
+        return io.open(path, mode, encoding='utf-8', newline='')
+    return open(path, mode + 'b')
+
+
+class RowFilter(object):
+    """Tests rows against a job's predicates: (column, operator, value)
+    tuples which must all be true. Missing and NULL values never match,
+    and neither do empty or unparsable numeric values, which Hive reads
+    as NULL; an empty string is an ordinary STRING value.
+    """
+
+    def __init__(self, predicates, columns):
+        names = [col[0] for col in columns]
+        types = dict((col[0], col[1].upper()) for col in columns)
+        self.tests = []
+        for column, op, value in predicates:
+            numeric = types[column] in NUMERIC_TYPES
+            if op == 'in':
+                value = [self._convert(v, numeric) for v in value]
+            else:
+                value = self._convert(value, numeric)
+            self.tests.append((names.index(column), op, value, numeric))
+
+    @staticmethod
+    def _convert(value, numeric):
+        return float(value) if numeric else six.text_type(value)
+
+    def __call__(self, row):
+        for index, op, value, numeric in self.tests:
+            if index >= len(row) or row[index] == '\\N':
+                return False
+            field = row[index]
+            if numeric:
+                try:
+                    field = float(field)
+                except ValueError:
+                    return False
+            if not _compare(field, op, value):
+                return False
+        return True
+
+
+def _compare(field, op, value):
+    if op == '=':
+        return field == value
+    if op == '!=':
+        return field != value
+    if op == '<':
+        return field < value
+    if op == '<=':
+        return field <= value
+    if op == '>':
+        return field > value
+    if op == '>=':
+        return field >= value
+    if op == 'in':
+        return field in value
+    raise ValueError("unknown operator '{0}'".format(op))
+
+
+def _range_lines(path, start, end):
+    """The lines which start in the byte range [start, end) of a file
+    """
+    with open(path, 'rb') as f:
+        if start > 0:
+            # skip the line which started in the previous range
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            yield line.decode('utf-8') if six.PY3 else line
+
+
+def _stage_lines(lines, destination, control_chars, indexes, row_filter):
+    fmt = csv_format(control_chars)
+    rows = 0
+    with open_csv(destination, 'w') as dest:
+        writer = csv.writer(dest, **fmt)
+        for row in csv.reader(lines, **fmt):
+            if not row:
+                continue
+            if row_filter and not row_filter(row):
+                continue
+            if indexes is not None:
+                row = [row[i] if i < len(row) else '' for i in indexes]
+            writer.writerow(row)
+            rows += 1
+    return rows
+
+
+def _stage_range(args):
+    """Stage one byte range of a file; run in a worker process"""
+    (source, destination, start, end,
+     control_chars, indexes, row_filter) = args
+    return _stage_lines(_range_lines(source, start, end), destination,
+                        control_chars, indexes, row_filter)
+
+
+def byte_ranges(size, count):
+    """Split `size` bytes into `count` contiguous (start, end) ranges
+    """
+    step = max(1, -(-size // count))
+    return [(start, min(start + step, size))
+            for start in range(0, size, step)]
+
+
+def stage_csv(source, destination, control_chars, indexes=None,
+              row_filter=None, processes=None):
+    """Copy the CSV file `source` to `destination`, keeping only the rows
+    `row_filter` accepts and the fields at `indexes`. Large files are
+    staged in parallel. Returns the number of rows written.
+    """
+    size = os.path.getsize(source)
+    processes = processes or multiprocessing.cpu_count()
+    if size < PARALLEL_MIN_BYTES or processes < 2 or \
+            threading.active_count() > 1:
+        with open_csv(source) as src:
+            rows = _stage_lines(src, destination, control_chars, indexes,
+                                row_filter)
+    else:
+        ranges = byte_ranges(size, processes)
+        parts = ['{0}.part{1}'.format(destination, i)
+                 for i in range(len(ranges))]
+        tasks = [(source, part, start, end, control_chars, indexes,
+                  row_filter)
+                 for part, (start, end) in zip(parts, ranges)]
+        pool = multiprocessing.Pool(min(processes, len(tasks)))
+        try:
+            rows = sum(pool.map(_stage_range, tasks))
+        finally:
+            pool.close()
+            pool.join()
+        with open(destination, 'wb') as dest:
+            for part in parts:
+                with open(part, 'rb') as f:
+                    shutil.copyfileobj(f, dest)
+                os.remove(part)
+    logger.info("Staged {0} rows of input".format(rows))
+    return rows
@@ -0,0 +1,211 @@
+# Copyright 2014 Max Sharples
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Upload local input to S3 for a run on EMR.
+
+Each file is stored under `uploads/<md5 of its contents>/` in the S3
+scratch space, so a file that hasn't changed since it was last uploaded
+is not uploaded again. Files are uploaded concurrently, and files larger
+than a part are sent as multipart uploads with their parts uploaded
+concurrently too. They can be gzipped as they are read.
+
+Hive moves its input into the table it loads, so each run gets copies
+(made within S3) of the uploaded files in its own data directory.
+"""
+import io
+import os
+import zlib
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from boto.s3.multipart import MultiPartUpload
+
+from apiarist.s3 import MissingDataException, get_conn, parse_s3_uri
+from apiarist.metrics import S3_CALLS, S3_UPLOADED_BYTES
+from apiarist.util import local_input_files
+
+logger = logging.getLogger(__name__)
+
+# S3's smallest part (except the last) is 5MB
+PART_SIZE = 16 * 1024 * 1024
+
+# files, and parts of each file, uploaded at once
+UPLOAD_THREADS = 4
+
+
+def file_md5(path, block_size=1024 * 1024):
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_chunks(path, size):
+    """The file's contents in pieces of `size` bytes"""
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(size), b''):
+            yield chunk
+
+
+def gzip_chunks(path, size):
+    """The file's gzipped contents, in pieces of at least `size`
+    bytes (except the last), compressed as the file is read
+    """
+    # wbits=31 writes the gzip header and trailer
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    buf = io.BytesIO()
+    for block in file_chunks(path, size):
+        buf.write(compressor.compress(block))
+        if buf.tell() >= size:
+            yield buf.getvalue()
+            buf = io.BytesIO()
+    buf.write(compressor.flush())
+    if buf.tell():
+        yield buf.getvalue()
+
+
+class Uploader(object):
+    """Uploads local files to S3, a part at a time
+    """
+
+    def __init__(self, aws_access_key_id=None, aws_secret_access_key=None,
+                 part_size=PART_SIZE, threads=UPLOAD_THREADS):
+        self.aws_access_key_id = aws_access_key_id
+        self.aws_secret_access_key = aws_secret_access_key
+        self.part_size = part_size
+        self.threads = threads
+
+    def _bucket(self, name):
+        # boto connections shouldn't be shared between threads,
+        # so each call gets its own
+        conn = get_conn(self.aws_access_key_id, self.aws_secret_access_key)
+        return conn.get_bucket(name)
+
+    def exists(self, s3_path):
+        S3_CALLS.inc(operation='head')
+        bucket, key = parse_s3_uri(s3_path)
+        return self._bucket(bucket).get_key(key) is not None
+
+    def copy(self, source, destination):
+        S3_CALLS.inc(operation='copy')
+        s_bucket, s_key = parse_s3_uri(source)
+        d_bucket, d_key = parse_s3_uri(destination)
+        self._bucket(d_bucket).copy_key(d_key, s_bucket, s_key)
+
+    def upload(self, path, s3_path, compress=False):
+        """Upload a file; a single request if it fits in one part,
+        otherwise a multipart upload
+        """
+        S3_CALLS.inc(operation='upload')
+        if compress:
+            chunks = gzip_chunks(path, self.part_size)
+        else:
+            chunks = file_chunks(path, self.part_size)
+        first = next(chunks, b'')
+        second = next(chunks, None)
+        bucket, key = parse_s3_uri(s3_path)
+        if second is None:
+            self._bucket(bucket).new_key(key).set_contents_from_string(first)
+            S3_UPLOADED_BYTES.inc(len(first))
+            return
+        self._multipart_upload(bucket, key, [first, second], chunks)
+
+    def _multipart_upload(self, bucket_name, key_name, head, chunks):
+        bucket = self._bucket(bucket_name)
+        mp = bucket.initiate_multipart_upload(key_name)
+        try:
+            etags = {}
+            with ThreadPoolExecutor(max_workers=self.threads) as pool:
+                pending = []
+                for part_num, chunk in enumerate(_chain(head, chunks), 1):
+                    # only keep a few parts in memory
+                    if len(pending) >= self.threads:
+                        self._finish_part(pending.pop(0), etags)
+                    pending.append((part_num, pool.submit(
+                        self._upload_part, bucket_name, key_name, mp.id,
+                        part_num, chunk)))
+                for part in pending:
+                    self._finish_part(part, etags)
+        except Exception:
+            bucket.cancel_multipart_upload(key_name, mp.id)
+            raise
+        bucket.complete_multipart_upload(key_name, mp.id,
+                                         _completion_xml(etags))
+
+    def _finish_part(self, part, etags):
+        part_num, future = part
+        etags[part_num] = future.result()
+
+    def _upload_part(self, bucket_name, key_name, upload_id, part_num, data):
+        mp = MultiPartUpload(self._bucket(bucket_name))
+        mp.key_name = key_name
+        mp.id = upload_id
+        key = mp.upload_part_from_file(io.BytesIO(data), part_num)
+        S3_UPLOADED_BYTES.inc(len(data))
+        return key.etag
+
+
+def _chain(head, rest):
+    for chunk in head:
+        yield chunk
+    for chunk in rest:
+        yield chunk
+
+
+def _completion_xml(etags):
+    parts = "".join(
+        "<Part><PartNumber>{0}</PartNumber><ETag>{1}</ETag></Part>".format(
+            part_num, etags[part_num]) for part_num in sorted(etags))
+    return "<CompleteMultipartUpload>{0}</CompleteMultipartUpload>".format(
+        parts)
+
+
+def upload_local_input(path, uploads_uri, data_path, compress=False,
+                       aws_access_key_id=None, aws_secret_access_key=None,
+                       threads=UPLOAD_THREADS):
+    """
+    Upload the local file, directory or glob at `path` to `uploads_uri`,
+    skipping files already there, and copy them to the `data_path`
+    directory. Returns the number of files uploaded and reused.
+    """
+    files = local_input_files(path)
+    if not files:
+        raise MissingDataException("no input files at {0}".format(path))
+    uploader = Uploader(aws_access_key_id, aws_secret_access_key,
+                        threads=threads)
+
+    def stage(item):
+        i, f = item
+        name = os.path.basename(f)
+        gzipped = compress and not name.endswith('.gz')
+        if gzipped:
+            name += '.gz'
+        cached = '{0}{1}/{2}'.format(uploads_uri, file_md5(f), name)
+        uploaded = not uploader.exists(cached)
+        if uploaded:
+            logger.info("Uploading {0} to {1}".format(f, cached))
+            uploader.upload(f, cached, compress=gzipped)
+        else:
+            logger.debug("{0} is already uploaded".format(f))
+        # numbered, as files from different directories
+        # can have the same name
+        uploader.copy(cached, '{0}{1:05d}-{2}'.format(data_path, i, name))
+        return uploaded
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        uploaded = list(pool.map(stage, enumerate(files)))
+    logger.info("Uploaded {0} input files, reused {1}".format(
+                uploaded.count(True), uploaded.count(False)))
+    return uploaded.count(True), uploaded.count(False)
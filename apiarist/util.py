@@ -14,7 +14,10 @@
 
 """Utility functions that have no external dependencies."""
 
+import os
 import sys
+import glob
+import codecs
 import logging
 
 
@@ -49,3 +52,28 @@ def log_to_stream(name=None, stream=None, format=None, level=None,
     logger = logging.getLogger(name)
     logger.setLevel(level)
     logger.addHandler(handler)
+
+
+def unescape_control_char(char):
+    r"""Turn a control character as written for the Hive serde
+    (e.g. r'\t' or r'\"') into the character itself."""
+    return codecs.decode(char, 'unicode_escape')
+
+
+def is_glob(path):
+    """Is `path` a pattern, like 'data/2014-*.csv'?"""
+    return any(c in path for c in '*?[')
+
+
+def local_input_files(path):
+    """The files that make up local input: the file, the (non-hidden)
+    files in the directory, or the files matching the pattern
+    """
+    if is_glob(path):
+        paths = glob.glob(path)
+    elif os.path.isdir(path):
+        paths = [os.path.join(path, name) for name in os.listdir(path)
+                 if not name.startswith('.')]
+    else:
+        paths = [path]
+    return sorted(p for p in paths if os.path.isfile(p))
@@ -0,0 +1,215 @@
+# Copyright 2014 Max Sharples
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Check input data against a job's input table before running the job.
+
+Each row must have one field per input column, and each field must
+parse as the column's type. Local files are read in full; S3 objects
+are checked from a sample at the start of each object.
+"""
+import csv
+import gzip
+import io
+import zlib
+import logging
+import six
+from concurrent.futures import ThreadPoolExecutor
+
+from apiarist.util import unescape_control_char, local_input_files
+
+logger = logging.getLogger(__name__)
+
+# bytes read from the start of each S3 object
+SAMPLE_BYTES = 1024 * 1024
+
+# stop reporting a file's problems after this many
+MAX_ERRORS = 10
+
+# bits in each of Hive's integer types
+INT_BITS = {'TINYINT': 8, 'SMALLINT': 16, 'INT': 32, 'BIGINT': 64}
+
+BOOLEANS = ('true', 'false')
+
+# how Hive writes NULL in text files
+HIVE_NULL = '\\N'
+
+
+class InvalidInputDataError(Exception):
+    pass
+
+
+def _parses_as(value, col_type):
+    """Can Hive read `value` as a `col_type`? Types
+    which aren't checked are assumed to be fine.
+    """
+    if value == '' or value == HIVE_NULL:
+        return True
+    col_type = col_type.upper()
+    if col_type in INT_BITS:
+        try:
+            n = int(value)
+        except ValueError:
+            return False
+        limit = 2 ** (INT_BITS[col_type] - 1)
+        return -limit <= n < limit
+    if col_type in ('FLOAT', 'DOUBLE'):
+        try:
+            float(value)
+        except ValueError:
+            return False
+        return True
+    if col_type == 'BOOLEAN':
+        return value.lower() in BOOLEANS
+    return True
+
+
+class InputValidator(object):
+    """Checks rows of CSV data against a Hive query's input table
+    """
+
+    def __init__(self, hive_query, sample_bytes=SAMPLE_BYTES,
+                 max_errors=MAX_ERRORS,
+                 aws_access_key_id=None, aws_secret_access_key=None):
+        self.columns = hive_query.input_columns
+        chars = [unescape_control_char(c)
+                 for c in hive_query.input_control_chars]
+        self.delimiter, self.quote_char, self.escape_char = chars
+        self.sample_bytes = sample_bytes
+        self.max_errors = max_errors
+        self.aws_access_key_id = aws_access_key_id
+        self.aws_secret_access_key = aws_secret_access_key
+
+    def validate(self, path):
+        """Check all the files at `path`, a local or S3 file or
+        directory, in parallel. Raises InvalidInputDataError.
+        """
+        sources = self._sources(path)
+        if not sources:
+            raise InvalidInputDataError("no input found at {0}".format(path))
+        with ThreadPoolExecutor(max_workers=min(len(sources), 8)) as pool:
+            results = list(pool.map(self._validate_source, sources))
+        errors = [error for result in results for error in result]
+        if errors:
+            raise InvalidInputDataError(
+                "input doesn't match the input columns:\n" +
+                "\n".join(errors))
+        logger.info("Input checked: {0} file(s) match the input columns".
+                    format(len(sources)))
+
+    def validate_rows(self, rows, source):
+        """Problems with `rows` (lists of fields) as messages
+        """
+        errors = []
+        for line_num, row in rows:
+            if len(row) != len(self.columns):
+                errors.append("{0} line {1}: expected {2} fields, "
+                              "found {3}".format(source, line_num,
+                                                 len(self.columns), len(row)))
+            else:
+                for value, col in zip(row, self.columns):
+                    if not _parses_as(value, col[1]):
+                        errors.append("{0} line {1}: {2!r} is not a valid "
+                                      "{3} for column `{4}`".format(
+                                          source, line_num, value,
+                                          col[1], col[0]))
+                        break
+            if len(errors) >= self.max_errors:
+                break
+        return errors
+
+    def _reader(self, lines):
+        reader = csv.reader(lines, delimiter=self.delimiter,
+                            quotechar=self.quote_char,
+                            escapechar=self.escape_char)
+        for row in reader:
+            # blank lines are skipped by Hive
+            if row:
+                yield reader.line_num, row
+
+    def _validate_source(self, source):
+        if source.startswith('s3://'):
+            lines = self._s3_sample_lines(source)
+        else:
+            lines = self._local_lines(source)
+        try:
+            return self.validate_rows(self._reader(lines), source)
+        except csv.Error as e:
+            return ["{0}: can't be read as CSV ({1})".format(source, e)]
+
+    #  finding and reading input
+
+    def _sources(self, path):
+        if path.startswith('s3://'):
+            return self._s3_sources(path)
+        return local_input_files(path)
+
+    def _local_lines(self, path):
+        if path.endswith('.gz'):
+            f = gzip.open(path, 'rb')
+            if six.PY3:
+                f = io.TextIOWrapper(f, encoding='utf-8', errors='replace',
+                                     newline='')
+        elif six.PY3:
+            f = io.open(path, encoding='utf-8', errors='replace', newline='')
+        else:
+            f = open(path, 'rb')
+        with f:
+            for line in f:
+                yield line
+
+    def _s3_bucket(self, bucket):
+        # boto is only imported when there is S3 input to check
+        from apiarist.s3 import get_conn
+        conn = get_conn(self.aws_access_key_id, self.aws_secret_access_key)
+        return conn.get_bucket(bucket)
+
+    def _s3_sources(self, path):
+        from apiarist.s3 import parse_s3_uri, is_dir, get_bucket_list
+        bucket, key = parse_s3_uri(path)
+        if not is_dir(path):
+            return [path]
+        bkt = self._s3_bucket(bucket)
+        return ['s3://{0}/{1}'.format(bucket, k.name)
+                for k in get_bucket_list(bkt, key)]
+
+    def _s3_sample_lines(self, path):
+        """The complete lines in the first `sample_bytes` of the object
+        """
+        from apiarist.s3 import parse_s3_uri
+        bucket, key = parse_s3_uri(path)
+        k = self._s3_bucket(bucket).get_key(key)
+        if k is None:
+            return []
+        truncated = k.size > self.sample_bytes
+        headers = None
+        if truncated:
+            headers = {'Range': 'bytes=0-{0}'.format(self.sample_bytes - 1)}
+        data = k.get_contents_as_string(headers=headers)
+        if path.endswith('.gz'):
+            # a partial gzip stream can still be decompressed
+            data = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(data)
+        if six.PY3:
+            data = data.decode('utf-8', 'replace')
+        lines = data.splitlines(True)
+        if truncated and lines:
+            # the last line is probably cut short
+            lines = lines[:-1]
+        return lines
+
+
+def validate_input(path, hive_query, **kwargs):
+    """Raise InvalidInputDataError if the input at `path`
+    doesn't fit the query's input table
+    """
+    InputValidator(hive_query, **kwargs).validate(path)
@@ -0,0 +1,65 @@
+# Copyright 2014 Max Sharples
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Command-line entry point for the benchmarks
+"""
+import sys
+import json
+from optparse import OptionParser
+
+from apiarist.util import log_to_stream
+from benchmarks.suite import BenchmarkSuite
+
+
+def main(args=None):
+    parser = OptionParser(usage="usage: python -m benchmarks [options]")
+    parser.add_option('--rows', dest='rows', type='int', default=10000)
+    parser.add_option('--columns', dest='columns', type='int', default=10)
+    parser.add_option('--files', dest='files', type='int', default=4)
+    parser.add_option('--repeat', dest='repeat', type='int', default=5)
+    parser.add_option('--emr-polls', dest='emr_polls', type='int', default=20)
+    parser.add_option('--emr-other-steps', dest='emr_other_steps',
+                      type='int', default=100)
+    parser.add_option('--only', dest='only', action='append', default=None,
+                      help="one of: " + ", ".join(BenchmarkSuite.BENCHMARKS))
+    parser.add_option('--output', dest='output', default=None,
+                      help="write JSON results here instead of STDOUT")
+    parser.add_option('--keep-work-dir', dest='keep_work_dir',
+                      action='store_true', default=False)
+    parser.add_option('--verbose', dest='verbose', action='store_true',
+                      default=False)
+    options, _ = parser.parse_args(args)
+
+    if options.verbose:
+        log_to_stream(name='benchmarks')
+
+    suite = BenchmarkSuite(rows=options.rows, columns=options.columns,
+                           files=options.files, repeat=options.repeat,
+                           emr_polls=options.emr_polls,
+                           emr_other_steps=options.emr_other_steps)
+    try:
+        report = suite.run(only=options.only)
+    finally:
+        if not options.keep_work_dir:
+            suite.cleanup()
+
+    out = json.dumps(report, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(out + '\n')
+    else:
+        sys.stdout.write(out + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# Copyright 2014 Max Sharples
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Synthetic CSV data for the benchmarks
+"""
+import csv
+import random
+import datetime
+
+# column types cycled through when building a synthetic schema
+COLUMN_TYPES = ['STRING', 'INT', 'BIGINT', 'DOUBLE', 'STRING']
+
+WORDS = ['apiary', 'bee', 'comb', 'drone', 'hive', 'honey', 'nectar',
+         'pollen', 'queen', 'swarm', 'wax', 'worker']
+
+EPOCH = datetime.date(2014, 1, 1)
+
+
+def synthetic_columns(columns):
+    """Column definitions in the same form as `HiveJob.input_columns()`.
+    The first column is always a date string.
+    """
+    cols = [('day', 'STRING')]
+    for i in range(1, columns):
+        cols.append(('col_{0}'.format(i), COLUMN_TYPES[i % len(COLUMN_TYPES)]))
+    return cols
+
+
+def _value(col_type, rnd, row):
+    if col_type in ('INT', 'BIGINT'):
+        return str(rnd.randint(0, 1000000))
+    elif col_type == 'DOUBLE':
+        return '{0:.4f}'.format(rnd.random() * 1000)
+    else:
+        # strings with the odd delimiter and quote to exercise the serde
+        word = rnd.choice(WORDS)
+        if row % 10 == 0:
+            return '{0}, "{1}"'.format(word, rnd.choice(WORDS))
+        return word
+
+
+def generate_csv(path, rows, columns, seed=0):
+    """Write a CSV file of `rows` x `columns` to `path`.
+    Returns the column definitions used.
+    """
+    rnd = random.Random(seed)
+    cols = synthetic_columns(columns)
+    with open(path, 'w') as f:
+        writer = csv.writer(f, lineterminator='\n', escapechar='\\',
+                            doublequote=False)
+        for row in range(rows):
+            day = EPOCH + datetime.timedelta(days=row % 365)
+            values = [day.isoformat()]
+            values += [_value(c[1], rnd, row) for c in cols[1:]]
+            writer.writerow(values)
+    return cols
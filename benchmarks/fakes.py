@@ -0,0 +1,170 @@
+# Copyright 2014 Max Sharples
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Local stand-ins for the parts of the S3 and EMR APIs used by apiarist.
+
+S3 buckets are directories under a root directory and keys are files,
+so copies and uploads do real I/O without touching the network.
+"""
+import os
+import shutil
+import contextlib
+
+import apiarist.s3
+
+
+class FakeKey(object):
+
+    def __init__(self, bucket=None, name=None):
+        self.bucket = bucket
+        self.key = name
+
+    @property
+    def _path(self):
+        return self.bucket._path(self.key)
+
+    @property
+    def size(self):
+        return os.path.getsize(self._path)
+
+    def set_contents_from_filename(self, filename):
+        self.bucket._ensure_parent(self.key)
+        shutil.copyfile(filename, self._path)
+        return self.size
+
+
+class FakeMultiPartUpload(object):
+
+    def __init__(self, bucket, key_name):
+        self.bucket = bucket
+        self.key_name = key_name
+        self.parts = {}
+
+    def copy_part_from_key(self, src_bucket_name, src_key_name, part_num):
+        src = self.bucket.connection.get_bucket(src_bucket_name)
+        self.parts[part_num] = src._path(src_key_name)
+
+    def complete_upload(self):
+        self.bucket._ensure_parent(self.key_name)
+        with open(self.bucket._path(self.key_name), 'wb') as out:
+            for num in sorted(self.parts):
+                with open(self.parts[num], 'rb') as part:
+                    shutil.copyfileobj(part, out)
+
+
+class FakeBucket(object):
+
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+        self.root = os.path.join(connection.root, name)
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+
+    def _path(self, key_name):
+        return os.path.join(self.root, key_name)
+
+    def _ensure_parent(self, key_name):
+        parent = os.path.dirname(self._path(key_name))
+        if not os.path.exists(parent):
+            os.makedirs(parent)
+
+    def list(self, prefix=''):
+        keys = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for fn in filenames:
+                name = os.path.relpath(os.path.join(dirpath, fn), self.root)
+                if name.startswith(prefix):
+                    keys.append(FakeKey(self, name))
+        return sorted(keys, key=lambda k: k.key)
+
+    def copy_key(self, new_key_name, src_bucket_name, src_key_name):
+        src = self.connection.get_bucket(src_bucket_name)
+        self._ensure_parent(new_key_name)
+        shutil.copyfile(src._path(src_key_name), self._path(new_key_name))
+        return FakeKey(self, new_key_name)
+
+    def initiate_multipart_upload(self, key_name):
+        return FakeMultiPartUpload(self, key_name)
+
+
+class FakeS3Connection(object):
+    """Directory-backed replacement for `boto.s3.connection.S3Connection`
+    """
+    root = None
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def get_bucket(self, name):
+        return FakeBucket(self, name)
+
+
+@contextlib.contextmanager
+def local_s3(root):
+    """Point the `apiarist.s3` helpers at a directory for the duration
+    of the block.
+    """
+    conn_cls = type('RootedFakeS3Connection', (FakeS3Connection,),
+                    {'root': root})
+    saved = (apiarist.s3.S3Connection, apiarist.s3.Key)
+    apiarist.s3.S3Connection, apiarist.s3.Key = conn_cls, FakeKey
+    try:
+        yield conn_cls()
+    finally:
+        apiarist.s3.S3Connection, apiarist.s3.Key = saved
+
+
+class _Obj(object):
+    """Attribute bag, like the boto EMR response objects"""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeEmrConnection(object):
+    """Replacement for `boto.emr.connection.EmrConnection` which reports
+    a cluster whose steps complete after a fixed number of polls.
+
+    `other_steps` adds steps belonging to other jobs, which the runner
+    has to skip over on every poll.
+    """
+
+    def __init__(self, job_name, polls=10, other_steps=0):
+        self.job_name = job_name
+        self.polls = polls
+        self.other_steps = other_steps
+        self.calls = 0
+
+    def describe_cluster(self, cluster_id):
+        self.calls += 1
+        state = 'RUNNING' if self.calls < self.polls else 'WAITING'
+        reason = _Obj(message='Running step')
+        return _Obj(id=cluster_id,
+                    status=_Obj(state=state, statechangereason=reason))
+
+    def list_steps(self, cluster_id):
+        done = self.calls >= self.polls
+        steps = []
+        for i in range(self.other_steps):
+            steps.append(self._step('OtherJob-{0}'.format(i), 'COMPLETED'))
+        steps.append(self._step(self.job_name + ': setup', 'COMPLETED'))
+        steps.append(self._step(self.job_name,
+                                'COMPLETED' if done else 'RUNNING'))
+        return _Obj(steps=steps)
+
+    def _step(self, name, state):
+        return _Obj(name=name,
+                    status=_Obj(state=state),
+                    startdatetime='2014-01-01T00:00:00Z',
+                    enddatetime='2014-01-01T00:05:00Z')
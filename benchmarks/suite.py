@@ -0,0 +1,231 @@
+# Copyright 2014 Max Sharples
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""The benchmark cases and the machinery to time them
+"""
+import os
+import sys
+import time
+import shutil
+import platform
+import datetime
+import tempfile
+import logging
+
+import apiarist
+from apiarist.job import HiveJob
+from apiarist.script import HiveQuery
+from apiarist.local import LocalRunner
+from apiarist.emr import EMRRunner
+from apiarist import s3
+from benchmarks.data import generate_csv
+from benchmarks.fakes import local_s3, FakeEmrConnection
+
+logger = logging.getLogger(__name__)
+
+BUCKET = 'apiarist-bench'
+
+# the S3 stand-in ignores credentials, but the helpers insist on some
+CREDS = {'aws_access_key_id': 'bench', 'aws_secret_access_key': 'bench'}
+
+
+class SyntheticJob(HiveJob):
+    """A HiveJob over the synthetic columns; skips option parsing"""
+
+    def __init__(self, columns):
+        self.job_name = 'SyntheticJob'
+        self.columns = columns
+
+    def table(self):
+        return 'synthetic'
+
+    def input_columns(self):
+        return self.columns
+
+    def output_columns(self):
+        return [('day', 'STRING'), ('total', 'BIGINT')]
+
+    def query(self):
+        return """SELECT day, COUNT(*)
+                  FROM synthetic
+                  GROUP BY day;"""
+
+
+def timed(func, repeat):
+    """Call `func` `repeat` times, returning a summary of the timings
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        timings.append(time.time() - start)
+    timings.sort()
+    return {
+        'repeat': repeat,
+        'min': timings[0],
+        'max': timings[-1],
+        'mean': sum(timings) / len(timings),
+        'median': timings[len(timings) // 2],
+        }
+
+
+class BenchmarkSuite(object):
+
+    def __init__(self, rows=10000, columns=10, files=4, repeat=5,
+                 emr_polls=20, emr_other_steps=100, work_dir=None):
+        self.rows = rows
+        self.columns = columns
+        self.files = files
+        self.repeat = repeat
+        self.emr_polls = emr_polls
+        self.emr_other_steps = emr_other_steps
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix='apiarist-bench-')
+        self.csv_path = os.path.join(self.work_dir, 'input.csv')
+        self.input_columns = generate_csv(self.csv_path, rows, columns)
+        self.input_bytes = os.path.getsize(self.csv_path)
+        self.job = SyntheticJob(self.input_columns)
+        self.results = []
+
+    def params(self):
+        return {
+            'rows': self.rows,
+            'columns': self.columns,
+            'files': self.files,
+            'repeat': self.repeat,
+            'input_bytes': self.input_bytes,
+            'emr_polls': self.emr_polls,
+            'emr_other_steps': self.emr_other_steps,
+            }
+
+    def _record(self, name, func, units=None, repeat=None):
+        logger.info("running {0}".format(name))
+        result = timed(func, repeat or self.repeat)
+        result['name'] = name
+        if units:
+            # throughput based on the median timing
+            for unit, count in units.items():
+                per_sec = count / result['median'] if result['median'] else 0
+                result['{0}_per_sec'.format(unit)] = per_sec
+        self.results.append(result)
+        return result
+
+    #  the benchmarks  ###
+
+    def bench_hive_query(self):
+        os.environ.setdefault('CSV_SERDE_JAR_S3', 's3://bench/serde.jar')
+        self._record('hive_query.init', lambda: HiveQuery(self.job))
+        hq = HiveQuery(self.job)
+        self._record('hive_query.local_hive_script',
+                     lambda: hq.local_hive_script('/tmp/data', '/tmp/out',
+                                                  '/tmp/table'))
+        self._record('hive_query.emr_hive_script',
+                     lambda: hq.emr_hive_script('s3://b/data', 's3://b/out/',
+                                                's3://b/table/'))
+
+    def bench_local_runner(self):
+        hq = HiveQuery(self.job)
+        temp_dir = os.path.join(self.work_dir, 'local') + '/'
+
+        def runner():
+            return LocalRunner('SyntheticJob', input_path=self.csv_path,
+                               hive_query=hq, temp_dir=temp_dir,
+                               no_output=True)
+
+        def stage():
+            r = runner()
+            r._ensure_local_scratch_dir_exists()
+            r._copy_input_data()
+            r._generate_hive_script()
+            shutil.rmtree(r.scratch_dir)
+
+        self._record('local_runner.stage', stage,
+                     units={'bytes': self.input_bytes})
+
+        # output reading, with the input standing in for the query results
+        r = runner()
+        os.makedirs(r.output_dir)
+        for i in range(self.files):
+            shutil.copyfile(self.csv_path,
+                            os.path.join(r.output_dir, '00000{0}_0'.format(i)))
+        self._record('local_runner.read_output', r._wait_for_job_to_complete,
+                     units={'bytes': self.input_bytes * self.files})
+        shutil.rmtree(r.scratch_dir)
+
+    def bench_s3(self):
+        root = os.path.join(self.work_dir, 's3')
+        src_dir = 's3://{0}/source/'.format(BUCKET)
+        with local_s3(root):
+            for i in range(self.files):
+                s3.upload_file_to_s3(self.csv_path,
+                                     '{0}part-{1}'.format(src_dir, i), **CREDS)
+            self._record('s3.upload_file_to_s3',
+                         lambda: s3.upload_file_to_s3(
+                            self.csv_path, 's3://{0}/upload'.format(BUCKET),
+                            **CREDS),
+                         units={'bytes': self.input_bytes})
+            self._record('s3.copy_s3_file',
+                         lambda: s3.copy_s3_file(
+                            src_dir + 'part-0', 's3://{0}/copy'.format(BUCKET),
+                            **CREDS),
+                         units={'bytes': self.input_bytes})
+            self._record('s3.copy_s3_file.dir',
+                         lambda: s3.copy_s3_file(
+                            src_dir, 's3://{0}/copydir/'.format(BUCKET),
+                            **CREDS),
+                         units={'bytes': self.input_bytes * self.files,
+                                'objects': self.files})
+            bucket = s3.get_conn(**CREDS).get_bucket(BUCKET)
+            self._record('s3.get_bucket_list',
+                         lambda: s3.get_bucket_list(bucket, 'source/'),
+                         units={'objects': self.files})
+            self._record('s3.concatenate_keys',
+                         lambda: s3.concatenate_keys(
+                            src_dir, 's3://{0}/concat'.format(BUCKET),
+                            **CREDS),
+                         units={'bytes': self.input_bytes * self.files})
+
+    def bench_emr_polling(self):
+        runner = EMRRunner('SyntheticJob', hive_query=HiveQuery(self.job),
+                           scratch_uri='s3://{0}/scratch/'.format(BUCKET),
+                           check_emr_status_every=0, **CREDS)
+
+        def poll():
+            conn = FakeEmrConnection('SyntheticJob', polls=self.emr_polls,
+                                     other_steps=self.emr_other_steps)
+            runner._wait_for_job_to_complete(conn, 'j-BENCHMARK')
+
+        self._record('emr_runner.wait_for_job_to_complete', poll,
+                     units={'polls': self.emr_polls})
+
+    BENCHMARKS = ['hive_query', 'local_runner', 's3', 'emr_polling']
+
+    def run(self, only=None):
+        for name in self.BENCHMARKS:
+            if only and name not in only:
+                continue
+            getattr(self, 'bench_' + name)()
+        return self.report()
+
+    def report(self):
+        return {
+            'apiarist_version': apiarist.__version__,
+            'python_version': platform.python_version(),
+            'platform': platform.platform(),
+            'created': datetime.datetime.utcnow().isoformat() + 'Z',
+            'argv': sys.argv[1:],
+            'params': self.params(),
+            'results': self.results,
+            }
+
+    def cleanup(self):
+        shutil.rmtree(self.work_dir)
@@ -22,9 +22,21 @@ try:
     # arguments that distutils doesn't understand
     setuptools_kwargs = {
         'install_requires': [
-            'boto>=2.6.0'
+            'boto>=2.6.0',
+            'futures; python_version < "3.2"',
         ],
-        'provides': ['apiarist']
+        'provides': ['apiarist'],
+        'entry_points': {
+            'console_scripts': [
+                'apiarist = apiarist.cli:main',
+            ],
+            'apiarist.runners': [
+                'local = apiarist.local:LocalRunner',
+                'emr = apiarist.emr:EMRRunner',
+                'spark = apiarist.spark:SparkLocalRunner',
+                'spark-emr = apiarist.emr:SparkEMRRunner',
+            ]
+        }
     }
 except ImportError:
     from distutils.core import setup
@@ -0,0 +1,190 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from six import StringIO
+from apiarist.batch import Batch
+from apiarist.batch import BatchJob
+from apiarist.batch import ManifestError
+from apiarist.batch import load_job_class
+from apiarist.batch import load_manifest
+from apiarist.cli import main
+from apiarist.job import HiveJob
+
+
+class Obj(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class LaunchedJob(HiveJob):
+    """Records its options instead of running"""
+
+    launched = []
+
+    def launch(self):
+        if self.input_data == 'missing':
+            raise ValueError('no input')
+        LaunchedJob.launched.append((self.input_data, self.options.runner))
+        return Obj(job_id='hj-' + self.input_data)
+
+
+class CountingJob(BatchJob):
+    """Tracks how many jobs run at once"""
+
+    def __init__(self, counter, **kwargs):
+        super(CountingJob, self).__init__('batch_test:LaunchedJob', 'x',
+                                          **kwargs)
+        self.counter = counter
+
+    def run(self):
+        with self.counter['lock']:
+            self.counter['running'] += 1
+            self.counter['most'] = max(self.counter['most'],
+                                       self.counter['running'])
+        time.sleep(0.02)
+        with self.counter['lock']:
+            self.counter['running'] -= 1
+
+
+class ManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'manifest.yaml')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _write(self, text):
+        with open(self.path, 'w') as f:
+            f.write(text)
+
+    def load_manifest_test(self):
+        self._write("concurrency:\n  emr: 3\n"
+                    "jobs:\n"
+                    "  - job: batch_test:LaunchedJob\n"
+                    "    input: /data/a.csv\n"
+                    "  - job: batch_test:LaunchedJob\n"
+                    "    input: s3://bucket/b/\n"
+                    "    runner: emr\n"
+                    "    args: [--pool-clusters, --num-ec2-instances, 4]\n"
+                    "    name: b\n")
+        jobs, concurrency = load_manifest(self.path)
+        self.assertEqual(concurrency, {'emr': 3})
+        self.assertEqual([j.name for j in jobs],
+                         ['batch_test:LaunchedJob', 'b'])
+        self.assertEqual(jobs[0].command_line(),
+                         ['/data/a.csv', '-r', 'local'])
+        self.assertEqual(jobs[1].command_line(),
+                         ['s3://bucket/b/', '-r', 'emr',
+                          '--pool-clusters', '--num-ec2-instances', '4'])
+
+    def job_needs_input_test(self):
+        self._write("jobs:\n  - job: batch_test:LaunchedJob\n")
+        self.assertRaises(ManifestError, load_manifest, self.path)
+
+    def unknown_keys_test(self):
+        self._write("jobs:\n  - job: batch_test:LaunchedJob\n"
+                    "    input: x\n    imput: y\n")
+        self.assertRaises(ManifestError, load_manifest, self.path)
+
+    def no_jobs_test(self):
+        self._write("concurrency:\n  local: 2\n")
+        self.assertRaises(ManifestError, load_manifest, self.path)
+
+    def job_class_from_module_test(self):
+        self.assertTrue(load_job_class('batch_test:LaunchedJob') is
+                        LaunchedJob)
+        self.assertRaises(ManifestError, load_job_class,
+                          'batch_test:NoSuchJob')
+        self.assertRaises(ManifestError, load_job_class,
+                          'no_such_module:Job')
+
+    def job_class_from_file_test(self):
+        path = os.path.join(self.tmp, 'my-job.py')
+        with open(path, 'w') as f:
+            f.write("from apiarist.job import HiveJob\n\n\n"
+                    "class MyJob(HiveJob):\n    pass\n")
+        self.assertEqual(load_job_class(path).__name__, 'MyJob')
+        self.assertEqual(load_job_class(path + ':MyJob').__name__, 'MyJob')
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.counter = {'lock': threading.Lock(), 'running': 0, 'most': 0}
+
+    def concurrency_is_limited_per_runner_test(self):
+        jobs = [CountingJob(self.counter) for _ in range(6)]
+        self.assertTrue(Batch(jobs, {'local': 2}).run())
+        self.assertEqual(self.counter['most'], 2)
+        self.assertEqual(set(j.state for j in jobs), set(['COMPLETED']))
+
+    def failures_are_reported_test(self):
+        jobs = [BatchJob('batch_test:LaunchedJob', 'a'),
+                BatchJob('batch_test:LaunchedJob', 'missing')]
+        lines = []
+        batch = Batch(jobs, on_change=lambda b: lines.append(
+            b.status_line()))
+        self.assertFalse(batch.run())
+        self.assertEqual(jobs[0].job_id, 'hj-a')
+        self.assertEqual(jobs[1].state, 'FAILED')
+        self.assertEqual(jobs[1].error, 'ValueError: no input')
+        self.assertEqual(lines[-1],
+                         '0 queued, 0 running, 1 completed, 1 failed')
+        self.assertEqual(len(lines), 4)
+
+    def bad_options_fail_the_job_test(self):
+        job = BatchJob('batch_test:LaunchedJob', 'a', args=['--nonsense'])
+        self.assertFalse(Batch([job]).run())
+        self.assertEqual(job.state, 'FAILED')
+
+    def unknown_runner_fails_before_running_test(self):
+        from apiarist.runner import UnknownRunnerError
+        jobs = [CountingJob(self.counter),
+                CountingJob(self.counter, runner='nonsense')]
+        self.assertRaises(UnknownRunnerError, Batch(jobs).run)
+        self.assertEqual(self.counter['most'], 0)
+
+
+class RunCommandTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'manifest.yaml')
+        with open(self.path, 'w') as f:
+            f.write("jobs:\n"
+                    "  - job: batch_test:LaunchedJob\n"
+                    "    input: a\n"
+                    "  - job: batch_test:LaunchedJob\n"
+                    "    input: missing\n"
+                    "    name: broken\n")
+        del LaunchedJob.launched[:]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def run_command_test(self):
+        out = StringIO()
+        status = main(['run', self.path, '--quiet',
+                       '--concurrency', 'local=2'], out)
+        self.assertEqual(status, 1)
+        self.assertEqual(LaunchedJob.launched, [('a', 'local')])
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0].split(),
+                         ['JOB', 'RUNNER', 'STATUS', 'SECONDS', 'JOB', 'ID',
+                          'ERROR'])
+        self.assertEqual(lines[1].split()[:3],
+                         ['batch_test:LaunchedJob', 'local', 'COMPLETED'])
+        self.assertTrue(lines[2].startswith('broken'))
+        self.assertTrue(lines[2].endswith('ValueError: no input'))
+
+    def bad_manifest_test(self):
+        self.assertEqual(main(['run', self.tmp + '/nothing.yaml'],
+                              StringIO()), 1)
@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from apiarist.checkpoint import Checkpoint
+from apiarist.checkpoint import CheckpointError
+from apiarist.checkpoint import checkpoint_dir
+from apiarist.runner import HiveJobRunner
+
+
+class CheckpointedRunner(HiveJobRunner):
+
+    def __init__(self, checkpoint_path, fail_in=None, resume=False,
+                 **kwargs):
+        super(CheckpointedRunner, self).__init__(**kwargs)
+        self.checkpoint_path = checkpoint_path
+        self.fail_in = fail_in
+        self.resume = resume
+        self.calls = []
+        self.restored = None
+
+    def _checkpoint(self):
+        checkpoint = Checkpoint(self.job_id, self.job_name,
+                                self.checkpoint_path)
+        if self.resume:
+            checkpoint.load()
+        return checkpoint
+
+    def _checkpoint_artifacts(self):
+        return {'last_phase': self.calls[-1]}
+
+    def _restore_checkpoint(self, artifacts):
+        self.restored = dict(artifacts)
+
+    def _phase(self, name):
+        self.calls.append(name)
+        if name == self.fail_in:
+            raise ValueError(name)
+
+    def stage(self):
+        self._phase('stage')
+
+    def execute(self):
+        self._phase('execute')
+
+    def fetch(self):
+        self._phase('fetch')
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def checkpoint_dir_test(self):
+        self.assertEqual(checkpoint_dir('/foo/'), '/foo/checkpoints')
+
+    def save_and_load_test(self):
+        c = Checkpoint('hj-1', 'TestJob', self.tmp)
+        c.complete_phase('stage', script_path='s3://foo/script.hql')
+        loaded = Checkpoint('hj-1', 'TestJob', self.tmp)
+        loaded.load()
+        self.assertEqual(loaded.completed_phases, ['stage'])
+        self.assertEqual(loaded.artifacts,
+                         {'script_path': 's3://foo/script.hql'})
+
+    def missing_checkpoint_test(self):
+        self.assertRaises(CheckpointError,
+                          Checkpoint('hj-1', 'TestJob', self.tmp).load)
+
+    def other_job_test(self):
+        Checkpoint('hj-1', 'TestJob', self.tmp).save()
+        self.assertRaises(CheckpointError,
+                          Checkpoint('hj-1', 'OtherJob', self.tmp).load)
+
+    def redo_phase_test(self):
+        c = Checkpoint('hj-1', 'TestJob', self.tmp)
+        c.complete_phase('stage')
+        c.redo_phase('stage')
+        with open(c.path) as f:
+            self.assertEqual(json.load(f)['completed_phases'], [])
+
+    def failed_run_keeps_checkpoint_test(self):
+        r = CheckpointedRunner(self.tmp, fail_in='execute',
+                               job_name='TestJob')
+        self.assertRaises(ValueError, r.run)
+        c = Checkpoint(r.job_id, 'TestJob', self.tmp)
+        c.load()
+        self.assertEqual(c.completed_phases, ['stage'])
+        self.assertEqual(c.artifacts, {'last_phase': 'stage'})
+
+    def resumed_run_skips_completed_phases_test(self):
+        first = CheckpointedRunner(self.tmp, fail_in='execute',
+                                   job_name='TestJob')
+        self.assertRaises(ValueError, first.run)
+        second = CheckpointedRunner(self.tmp, resume=True,
+                                    job_name='TestJob', job_id=first.job_id)
+        second.run()
+        self.assertEqual(second.calls, ['execute', 'fetch'])
+        self.assertEqual(second.restored, {'last_phase': 'stage'})
+        # finished, so the local copy is gone
+        self.assertFalse(os.path.exists(second.checkpoint.path))
@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+from six import StringIO
+from apiarist.cli import main
+from apiarist.history import JobHistory
+
+try:
+    from history_test import run
+except ImportError:
+    from .history_test import run
+
+
+class CliTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'history.db')
+        history = JobHistory(self.path)
+        for i in range(5):
+            history.record(run('hj-{0}'.format(i), started=i))
+        history.record(run('hj-5', started=5, seconds=180.0))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _main(self, *args):
+        out = StringIO()
+        status = main(list(args) + ['--history-db', self.path], out)
+        return status, out.getvalue().splitlines()
+
+    def unknown_command_test(self):
+        self.assertEqual(main(['nonsense'], StringIO()), 2)
+
+    def history_command_test(self):
+        status, lines = self._main('history', '--limit', '2')
+        self.assertEqual(status, 0)
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('STARTED'))
+        self.assertTrue('hj-5' in lines[2])
+        self.assertTrue('180.0s' in lines[2])
+
+    def trends_command_test(self):
+        status, lines = self._main('trends', '--window', '1')
+        self.assertEqual(lines[1].split(),
+                         ['TestJob', '6', '953.7MB', '953.7MB', '60.0s',
+                          '180.0s', '180.0s'])
+
+    def regressions_command_test(self):
+        status, lines = self._main('regressions')
+        self.assertEqual(lines[1].split(),
+                         ['TestJob', '180.0s', '60.0s', '3.0x'])
+
+    def no_regressions_test(self):
+        status, lines = self._main('regressions', '--threshold', '5')
+        self.assertEqual(lines, ['No regressions'])
+
+    def gc_command_test(self):
+        import apiarist.emr
+        gc_job_files = apiarist.emr.gc_job_files
+        calls = []
+
+        def gc(uri, days, **kwargs):
+            calls.append((uri, days, kwargs['dry_run']))
+            return [uri + 'hj-1/']
+        apiarist.emr.gc_job_files = gc
+        try:
+            out = StringIO()
+            status = main(['gc', '--s3-scratch-uri', 's3://foo/bar/',
+                           '--older-than-days', '3', '--dry-run'], out)
+        finally:
+            apiarist.emr.gc_job_files = gc_job_files
+        self.assertEqual(status, 0)
+        self.assertEqual(calls, [('s3://foo/bar/', 3.0, True)])
+        self.assertEqual(out.getvalue(), 'Would delete s3://foo/bar/hj-1/\n')
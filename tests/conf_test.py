@@ -88,3 +88,6 @@ class ConfigFileTest(unittest.TestCase):
         args = self.conf.merge_config_file_args(u + p, 'emr')
         self.assert_contains_args(args, u)
         self.assert_contains_args(args, p)
+
+    def unknown_runner_has_no_extra_args_test(self):
+        self.assertEqual(self.conf.merge_config_file_args([], 'foo'), [])
@@ -0,0 +1,56 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import unittest
+import apiarist.s3
+from apiarist.context import ExecutionContext
+from apiarist.serde import Serde
+
+
+class ExecutionContextTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = dict(os.environ)
+        for name in ('S3_SCRATCH_URI', 'CSV_SERDE_JAR_S3'):
+            os.environ.pop(name, None)
+        self.uploads = []
+        self._upload = apiarist.s3.upload_file_to_s3
+        apiarist.s3.upload_file_to_s3 = \
+            lambda path, uri, *args: self.uploads.append((uri, args))
+
+    def tearDown(self):
+        apiarist.s3.upload_file_to_s3 = self._upload
+        os.environ.clear()
+        os.environ.update(self.env)
+
+    def arguments_override_environment_test(self):
+        os.environ['S3_SCRATCH_URI'] = 's3://env/scratch/'
+        context = ExecutionContext('key', 'secret', 's3://arg/scratch/')
+        self.assertEqual(context.credentials, ('key', 'secret'))
+        self.assertEqual(context.scratch_uri, 's3://arg/scratch/')
+        self.assertEqual(ExecutionContext().scratch_uri,
+                         's3://env/scratch/')
+
+    def serde_jar_is_uploaded_once_test(self):
+        context = ExecutionContext('key', 'secret', 's3://foo/scratch/')
+        for _ in range(2):
+            self.assertEqual(Serde(context=context).s3_path(),
+                             's3://foo/scratch/jars/csv-serde.jar')
+        self.assertEqual(self.uploads, [
+            ('s3://foo/scratch/jars/csv-serde.jar', ('key', 'secret'))])
+        # the environment is left alone
+        self.assertFalse('CSV_SERDE_JAR_S3' in os.environ)
+
+    def known_serde_jar_test(self):
+        os.environ['CSV_SERDE_JAR_S3'] = 's3://path/to/serde.jar'
+        self.assertEqual(Serde().s3_path(), 's3://path/to/serde.jar')
+        self.assertEqual(self.uploads, [])
+
+    def contexts_are_separate_test(self):
+        first = ExecutionContext('a', 'a', 's3://first/')
+        second = ExecutionContext('b', 'b', 's3://second/')
+        first.serde_jar('/tmp/serde.jar')
+        second.serde_jar('/tmp/serde.jar')
+        self.assertEqual([uri for uri, _ in self.uploads],
+                         ['s3://first/jars/csv-serde.jar',
+                          's3://second/jars/csv-serde.jar'])
@@ -3,7 +3,69 @@
 
 import unittest
 import os
+import hashlib
+import apiarist.emr
+import apiarist.logs
 from apiarist.emr import EMRRunner
+from apiarist.emr import SparkEMRRunner
+from apiarist.emr import ClusterNotReadyError
+from apiarist.emr import JobFailedError
+from apiarist.s3 import parse_s3_uri
+from apiarist.script import HiveQuery
+from script_test import DummyJob
+from fake_s3 import FakeBucket, FakeS3Connection, Obj
+
+
+class FakeEmrConnection(object):
+    """Records calls and completes every step straight away"""
+
+    def __init__(self, clusters=None, applications=('Hive',),
+                 state='WAITING', step_state='COMPLETED'):
+        # cluster id => tags
+        self.clusters = clusters or {}
+        self.applications = applications
+        self.state = state
+        self.step_state = step_state
+        self.steps = {}
+        self.calls = []
+
+    def run_jobflow(self, name, log_uri, **kwargs):
+        self.calls.append(('run_jobflow', kwargs))
+        cluster_id = 'j-NEW'
+        self.clusters[cluster_id] = {}
+        return cluster_id
+
+    def add_tags(self, cluster_id, tags):
+        self.calls.append(('add_tags', cluster_id, tags))
+        self.clusters[cluster_id].update(tags)
+
+    def list_clusters(self, cluster_states=None):
+        return Obj(clusters=[Obj(id=c) for c in sorted(self.clusters)])
+
+    def describe_cluster(self, cluster_id):
+        tags = [Obj(key=k, value=v)
+                for k, v in self.clusters[cluster_id].items()]
+        apps = [Obj(name=name) for name in self.applications]
+        return Obj(id=cluster_id, tags=tags, applications=apps,
+                   status=Obj(state=self.state, statechangereason=None))
+
+    def add_jobflow_steps(self, cluster_id, steps):
+        self.calls.append(('add_jobflow_steps', cluster_id, steps))
+        ids = []
+        for step in steps:
+            step_id = 's-{0}'.format(len(self.steps))
+            self.steps[step_id] = step
+            ids.append(Obj(value=step_id))
+        return Obj(stepids=ids)
+
+    def list_steps(self, cluster_id):
+        # an old step with the same name as ours, from a previous job
+        steps = [Obj(id='s-OLD', name='TestJob',
+                     status=Obj(state='FAILED'))]
+        for step_id, step in self.steps.items():
+            steps.append(Obj(id=step_id, name=step.name,
+                             status=Obj(state=self.step_state)))
+        return Obj(steps=steps)
 
 
 class EmrTest(unittest.TestCase):
@@ -18,13 +80,660 @@ class EmrTest(unittest.TestCase):
         self.assertEqual(r.job_name, 'TestJob')
 
     def set_aws_credentials_test(self):
+        env = dict(os.environ)
         del os.environ['AWS_ACCESS_KEY_ID']
         del os.environ['AWS_SECRET_ACCESS_KEY']
-        k, s = 'foo', 'bar'
-        r = EMRRunner('TestJob',
-                      aws_access_key_id=k,
-                      aws_secret_access_key=s)
-        self.assertEqual(r.aws_access_key_id, k)
-        self.assertEqual(r.aws_secret_access_key, s)
-        self.assertEqual(os.environ['AWS_ACCESS_KEY_ID'], k)
-        self.assertEqual(os.environ['AWS_SECRET_ACCESS_KEY'], s)
+        try:
+            k, s = 'foo', 'bar'
+            r = EMRRunner('TestJob',
+                          aws_access_key_id=k,
+                          aws_secret_access_key=s)
+            self.assertEqual(r.aws_access_key_id, k)
+            self.assertEqual(r.aws_secret_access_key, s)
+            # the environment is left alone
+            self.assertFalse('AWS_ACCESS_KEY_ID' in os.environ)
+            self.assertFalse('AWS_SECRET_ACCESS_KEY' in os.environ)
+            self.assertRaises(ValueError, EMRRunner, 'TestJob')
+        finally:
+            os.environ.update(env)
+
+    def scratch_uri_is_not_shared_test(self):
+        r = EMRRunner('TestJob', scratch_uri='s3://other/scratch/')
+        self.assertEqual(r.base_path, 's3://other/scratch/')
+        self.assertEqual(os.environ['S3_SCRATCH_URI'], 's3://foo/bar/')
+        self.assertEqual(EMRRunner('TestJob').base_path, 's3://foo/bar/')
+
+    def runners_in_threads_keep_their_settings_test(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from apiarist.context import ExecutionContext
+
+        def runner(i):
+            context = ExecutionContext(
+                'key{0}'.format(i), 'secret{0}'.format(i),
+                's3://bucket{0}/scratch/'.format(i))
+            return EMRRunner('TestJob', context=context)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            runners = list(pool.map(runner, range(8)))
+        for i, r in enumerate(runners):
+            self.assertEqual(r.aws_access_key_id, 'key{0}'.format(i))
+            self.assertTrue(r.job_files.startswith(
+                's3://bucket{0}/scratch/'.format(i)))
+
+    def hive_steps_test(self):
+        r = EMRRunner('TestJob', aws_access_key_id='foo',
+                      aws_secret_access_key='bar')
+        setup_step, run_step = r._job_steps()
+        self.assertEqual(run_step.name, 'TestJob')
+        self.assertTrue(r.script_path in run_step.args())
+        # a failed query mustn't shut down a shared cluster
+        self.assertEqual(run_step.action_on_failure, 'CANCEL_AND_WAIT')
+
+
+class ScriptUploadTest(unittest.TestCase):
+
+    def setUp(self):
+        os.environ['S3_SCRATCH_URI'] = 's3://foo/bar/'
+        os.environ['CSV_SERDE_JAR_S3'] = 's3://path/to/serde.jar'
+        self.uploads = []
+        self.existing = set()
+        self._patched = dict((name, getattr(apiarist.emr, name)) for name in
+                             ('copy_s3_file', 'upload_string_to_s3',
+                              's3_key_exists'))
+        apiarist.emr.copy_s3_file = lambda *args: None
+        apiarist.emr.upload_string_to_s3 = \
+            lambda script, path, *args: self.uploads.append((path, script))
+        apiarist.emr.s3_key_exists = lambda path, *args: path in self.existing
+        apiarist.emr._uploaded_scripts.clear()
+        self.hq = HiveQuery(DummyJob('SELECT foo FROM some_table',
+                                     'some_table', [('foo', 'STRING')],
+                                     [('foo', 'STRING')]))
+
+    def tearDown(self):
+        for name, func in self._patched.items():
+            setattr(apiarist.emr, name, func)
+        apiarist.emr._uploaded_scripts.clear()
+
+    def _runner(self):
+        return EMRRunner('TestJob', input_path='s3://foo/input.csv',
+                         hive_query=self.hq, aws_access_key_id='foo',
+                         aws_secret_access_key='bar', s3_sync_wait_time=0)
+
+    def script_has_no_run_paths_test(self):
+        r = self._runner()
+        script = r._compile_hive_script()
+        self.assertFalse(r.job_id in script)
+        self.assertTrue("LOAD DATA INPATH '${hivevar:data_path}'" in script)
+        self.assertTrue("LOCATION '${hivevar:output_path}';" in script)
+
+    def content_addressed_script_test(self):
+        r = self._runner()
+        r.stage()
+        self.assertTrue(r.script_path.startswith('s3://foo/bar/scripts/'))
+        self.assertEqual(self.uploads,
+                         [(r.script_path, r._compile_hive_script())])
+
+    def script_uploaded_once_test(self):
+        first, second = self._runner(), self._runner()
+        first.stage()
+        second.stage()
+        self.assertEqual(first.script_path, second.script_path)
+        self.assertEqual(len(self.uploads), 1)
+
+    def existing_script_reused_test(self):
+        r = self._runner()
+        self.existing.add('s3://foo/bar/scripts/{0}.hql'.format(
+            hashlib.md5(r._compile_hive_script().encode('utf-8')).hexdigest()))
+        r.stage()
+        self.assertEqual(self.uploads, [])
+
+    def invalid_input_stops_staging_test(self):
+        from apiarist.validate import InvalidInputDataError
+
+        def invalid(*args, **kwargs):
+            raise InvalidInputDataError('bad input')
+        validate_input = apiarist.emr.validate_input
+        apiarist.emr.validate_input = invalid
+        try:
+            r = EMRRunner('TestJob', input_path='s3://foo/input.csv',
+                          hive_query=self.hq, aws_access_key_id='foo',
+                          aws_secret_access_key='bar', validate_input=True)
+            self.assertRaises(InvalidInputDataError, r.stage)
+            self.assertEqual(self.uploads, [])
+        finally:
+            apiarist.emr.validate_input = validate_input
+
+    def local_input_is_uploaded_test(self):
+        staged = []
+        upload_local_input = apiarist.emr.upload_local_input
+        apiarist.emr.upload_local_input = \
+            lambda *args, **kwargs: staged.append((args, kwargs))
+        try:
+            r = EMRRunner('TestJob', input_path='/data/input-*.csv',
+                          hive_query=self.hq, aws_access_key_id='foo',
+                          aws_secret_access_key='bar', s3_sync_wait_time=0,
+                          compress_input=True)
+            r.stage()
+        finally:
+            apiarist.emr.upload_local_input = upload_local_input
+        self.assertTrue(r.local_input)
+        self.assertTrue(r.data_path.endswith('/data/'))
+        (args, kwargs), = staged
+        self.assertEqual(args, ('/data/input-*.csv', 's3://foo/bar/uploads/',
+                                r.data_path))
+        self.assertTrue(kwargs['compress'])
+
+    def run_paths_are_step_args_test(self):
+        r = self._runner()
+        r.stage()
+        args = r._job_steps()[-1].args()
+        self.assertTrue(r.script_path in args)
+        self.assertEqual(args[-6:], [
+            '-d', 'data_path=' + r.data_path,
+            '-d', 'output_path=' + r.output_path.rstrip('/'),
+            '-d', 'table_path=' + r.table_path])
+
+
+class EmrRunTestCase(unittest.TestCase):
+    """Runs EMR jobs against a fake connection; has no tests of its own,
+    so the test cases built on it don't run each other's tests
+    """
+
+    def setUp(self):
+        os.environ['S3_SCRATCH_URI'] = 's3://foo/bar/'
+        self._emr_connection = apiarist.emr.EmrConnection
+        self._get_conn = apiarist.logs.get_conn
+        self.log_bucket = FakeBucket()
+        apiarist.logs.get_conn = lambda *args: FakeS3Connection(
+            self.log_bucket)
+
+    def tearDown(self):
+        apiarist.emr.EmrConnection = self._emr_connection
+        apiarist.logs.get_conn = self._get_conn
+
+    def _runner(self, **kwargs):
+        return EMRRunner('TestJob', aws_access_key_id='foo',
+                         aws_secret_access_key='bar',
+                         master_instance_type='m3.xlarge',
+                         slave_instance_type='m3.xlarge', num_instances=2,
+                         check_emr_status_every=0, **kwargs)
+
+    def _execute(self, runner, conn):
+        apiarist.emr.EmrConnection = lambda *args: conn
+        runner.execute()
+
+
+class PooledEmrTest(EmrRunTestCase):
+
+    def keep_alive_test(self):
+        self.assertFalse('keep_alive' in self._runner()._jobflow_kwargs())
+        r = self._runner(pool_clusters=True, release_label='emr-5.36.0',
+                         max_mins_idle=10)
+        kwargs = r._jobflow_kwargs()
+        self.assertTrue(kwargs['keep_alive'])
+        self.assertEqual(
+            kwargs['api_params']['AutoTerminationPolicy.IdleTimeout'], 600)
+
+    def idle_timeout_needs_release_test(self):
+        # AMI version clusters don't take an auto-termination policy
+        self.assertRaises(ValueError, self._runner, pool_clusters=True,
+                          release_label=None, max_mins_idle=10)
+        self.assertRaises(ValueError, self._runner, pool_clusters=True,
+                          release_label='emr-5.29.0', max_mins_idle=10)
+        self.assertRaises(ValueError, self._runner, pool_clusters=True,
+                          release_label='emr-6.0.0', max_mins_idle=10)
+        self._runner(pool_clusters=True, release_label='emr-6.1.0',
+                     max_mins_idle=10)
+
+    def pool_hash_test(self):
+        r1 = self._runner(pool_clusters=True, release_label='emr-5.36.0')
+        r2 = self._runner(pool_clusters=True, release_label='emr-5.36.0',
+                          max_mins_idle=10)
+        self.assertEqual(r1._pool_hash(), r2._pool_hash())
+        r3 = self._runner(pool_clusters=True, release_label='emr-5.36.0',
+                          hive_version='0.13.1')
+        self.assertNotEqual(r1._pool_hash(), r3._pool_hash())
+
+    def pooled_run_drops_tables_first_test(self):
+        # an earlier run on the same cluster leaves its tables behind
+        os.environ['CSV_SERDE_JAR_S3'] = 's3://path/to/serde.jar'
+        hq = HiveQuery(DummyJob('SELECT foo FROM some_table', 'some_table',
+                                [('foo', 'STRING')], [('foo', 'STRING')]))
+        r = self._runner(pool_clusters=True, hive_query=hq)
+        lines = r._compile_hive_script().split('\n')
+        for table in ('some_table', 'some_table_results'):
+            drop = lines.index('DROP TABLE IF EXISTS {0};'.format(table))
+            create = [i for i, line in enumerate(lines) if line.startswith(
+                'CREATE EXTERNAL TABLE {0} '.format(table))]
+            self.assertTrue(drop < create[0])
+
+    def no_pooling_creates_cluster_test(self):
+        conn = FakeEmrConnection()
+        self._execute(self._runner(), conn)
+        calls = [c[0] for c in conn.calls]
+        self.assertEqual(calls, ['run_jobflow', 'add_jobflow_steps'])
+
+    def new_pooled_cluster_is_tagged_test(self):
+        conn = FakeEmrConnection()
+        r = self._runner(pool_clusters=True, pool_name='reports')
+        self._execute(r, conn)
+        calls = [c[0] for c in conn.calls]
+        self.assertEqual(calls, ['run_jobflow', 'add_tags',
+                                 'add_jobflow_steps'])
+        self.assertEqual(conn.clusters['j-NEW'],
+                         {EMRRunner.POOL_NAME_TAG: 'reports',
+                          EMRRunner.POOL_HASH_TAG: r._pool_hash()})
+        # setup and run steps
+        self.assertEqual(len(conn.calls[2][2]), len(r._job_steps()))
+
+    def reuse_pooled_cluster_test(self):
+        r = self._runner(pool_clusters=True, pool_name='reports')
+        conn = FakeEmrConnection(clusters={
+            'j-OTHERPOOL': {EMRRunner.POOL_NAME_TAG: 'adhoc',
+                            EMRRunner.POOL_HASH_TAG: r._pool_hash()},
+            'j-POOLED': {EMRRunner.POOL_NAME_TAG: 'reports',
+                         EMRRunner.POOL_HASH_TAG: r._pool_hash()},
+            })
+        self._execute(r, conn)
+        self.assertEqual([c[0] for c in conn.calls], ['add_jobflow_steps'])
+        cluster_id, steps = conn.calls[0][1:]
+        self.assertEqual(cluster_id, 'j-POOLED')
+        # no setup step on a cluster which is already set up
+        self.assertEqual(len(steps), 1)
+        self.assertEqual(steps[0].name, 'TestJob')
+
+    def mismatched_pool_creates_cluster_test(self):
+        r = self._runner(pool_clusters=True)
+        conn = FakeEmrConnection(clusters={
+            'j-BIGGER': {EMRRunner.POOL_NAME_TAG: 'default',
+                         EMRRunner.POOL_HASH_TAG: 'abc123'},
+            })
+        self._execute(r, conn)
+        self.assertEqual(conn.calls[0][0], 'run_jobflow')
+
+    def throttled_status_check_is_retried_test(self):
+        import boto.exception
+        from apiarist.metrics import EMR_THROTTLES
+        conn = FakeEmrConnection()
+        original = conn.list_steps
+        throttled = []
+
+        def list_steps(cluster_id):
+            if not throttled:
+                throttled.append(cluster_id)
+                error = boto.exception.BotoServerError(400, 'Bad Request')
+                error.error_code = 'ThrottlingException'
+                raise error
+            return original(cluster_id)
+        conn.list_steps = list_steps
+        before = EMR_THROTTLES.value()
+        self._execute(self._runner(), conn)
+        self.assertEqual(EMR_THROTTLES.value(), before + 1)
+
+    def other_emr_errors_are_raised_test(self):
+        import boto.exception
+        conn = FakeEmrConnection()
+
+        def list_steps(cluster_id):
+            raise boto.exception.BotoServerError(403, 'Forbidden')
+        conn.list_steps = list_steps
+        self.assertRaises(boto.exception.BotoServerError, self._execute,
+                          self._runner(), conn)
+
+    def failed_step_hive_error_test(self):
+        r = self._runner()
+        _, prefix = parse_s3_uri(r.log_path)
+        for step in range(len(r._job_steps())):
+            name = '{0}j-NEW/steps/s-{1}/stderr'.format(prefix, step)
+            self.log_bucket.objects[name] = \
+                b'FAILED: ParseException line 1:0\n'
+        conn = FakeEmrConnection(step_state='FAILED')
+        try:
+            self._execute(r, conn)
+        except JobFailedError as e:
+            self.assertEqual(e.hive_error, 'FAILED: ParseException line 1:0')
+            self.assertTrue('j-NEW/steps/' in str(e))
+        else:
+            self.fail('expected JobFailedError')
+
+
+class ResumeEmrTest(EmrRunTestCase):
+
+    def setUp(self):
+        import tempfile
+        super(ResumeEmrTest, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        super(ResumeEmrTest, self).tearDown()
+        shutil.rmtree(self.tmp)
+
+    def _checkpoint(self, runner, **artifacts):
+        from apiarist.checkpoint import Checkpoint
+        runner.checkpoint = Checkpoint(runner.job_id, runner.job_name,
+                                       self.tmp)
+        runner.checkpoint.complete_phase('stage', **artifacts)
+        return runner.checkpoint
+
+    def resumed_run_keeps_job_id_test(self):
+        r = self._runner(resume='hj-abc')
+        self.assertEqual(r.job_id, 'hj-abc')
+        self.assertTrue(r.job_files.endswith('/hj-abc/'))
+
+    def rejoin_running_steps_test(self):
+        r = self._runner()
+        self._checkpoint(r, cluster_id='j-OLD', step_ids=['s-0'])
+        conn = FakeEmrConnection(clusters={'j-OLD': {}}, state='RUNNING')
+        conn.steps['s-0'] = Obj(name='TestJob')
+        self._execute(r, conn)
+        self.assertEqual(conn.calls, [])
+
+    def stopped_cluster_starts_again_test(self):
+        r = self._runner()
+        checkpoint = self._checkpoint(r, cluster_id='j-OLD',
+                                      step_ids=['s-0'])
+        conn = FakeEmrConnection(clusters={'j-OLD': {}, 'j-NEW': {}},
+                                 state='TERMINATED')
+        original = conn.describe_cluster
+
+        def describe_cluster(cluster_id):
+            cluster = original(cluster_id)
+            if cluster_id == 'j-NEW':
+                cluster.status.state = 'STARTING'
+            return cluster
+        conn.describe_cluster = describe_cluster
+        self._execute(r, conn)
+        self.assertEqual([c[0] for c in conn.calls],
+                         ['run_jobflow', 'add_jobflow_steps'])
+        self.assertEqual(checkpoint.artifacts['cluster_id'], 'j-NEW')
+
+    def failed_steps_are_not_rejoined_test(self):
+        r = self._runner()
+        checkpoint = self._checkpoint(r)
+        conn = FakeEmrConnection(step_state='FAILED')
+        self.assertRaises(JobFailedError, self._execute, r, conn)
+        self.assertEqual(checkpoint.artifacts['cluster_id'], None)
+
+    def missing_staged_input_is_staged_again_test(self):
+        r = self._runner()
+        checkpoint = self._checkpoint(r, script_path='s3://foo/script.hql')
+        s3_size = apiarist.emr.s3_size
+        apiarist.emr.s3_size = lambda path, *args: (
+            (10, 1) if path == 's3://foo/script.hql' else (0, 0))
+        try:
+            r._restore_checkpoint(checkpoint.artifacts)
+        finally:
+            apiarist.emr.s3_size = s3_size
+        self.assertEqual(r.script_path, 's3://foo/script.hql')
+        self.assertFalse(checkpoint.is_complete('stage'))
+
+
+class CleanupEmrTest(unittest.TestCase):
+
+    def setUp(self):
+        os.environ['S3_SCRATCH_URI'] = 's3://foo/bar/'
+        self.deleted = []
+        self._patched = dict((name, getattr(apiarist.emr, name)) for name in
+                             ('delete_prefix', 'list_prefixes', 'list_keys'))
+        apiarist.emr.delete_prefix = lambda path, keep=(), **kwargs: \
+            self.deleted.append((path, list(keep))) or 3
+
+    def tearDown(self):
+        for name, func in self._patched.items():
+            setattr(apiarist.emr, name, func)
+
+    def _runner(self, **kwargs):
+        r = EMRRunner('TestJob', aws_access_key_id='foo',
+                      aws_secret_access_key='bar', **kwargs)
+        r.completed = True
+        return r
+
+    def job_files_are_deleted_test(self):
+        r = self._runner()
+        r.cleanup()
+        self.assertEqual(self.deleted, [(r.job_files, [r.output_path])])
+
+    def output_elsewhere_test(self):
+        r = self._runner(output_dir='s3://foo/out/')
+        r.cleanup()
+        self.assertEqual(self.deleted, [(r.job_files, [])])
+
+    def failed_run_is_kept_test(self):
+        r = self._runner()
+        r.completed = False
+        r.cleanup()
+        self.assertEqual(self.deleted, [])
+
+    def retain_job_files_test(self):
+        self._runner(retain_job_files=True).cleanup()
+        self.assertEqual(self.deleted, [])
+
+    def cleanup_in_background_test(self):
+        r = self._runner(cleanup_in_background=True)
+        r.cleanup()
+        r.cleanup_thread.join()
+        self.assertEqual(self.deleted, [(r.job_files, [r.output_path])])
+
+    def gc_job_files_test(self):
+        import time
+        from apiarist.emr import gc_job_files
+        old, new = 'hj-' + 'a' * 32, 'hj-' + 'b' * 32
+        output_only = 'hj-' + 'c' * 32
+        apiarist.emr.list_prefixes = lambda uri, *args: [
+            uri + old + '/', uri + new + '/', uri + output_only + '/',
+            uri + 'logs/']
+        now = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
+        long_ago = '2014-01-01T00:00:00.000Z'
+        keys = {old: ['script.hql', 'output/000000_0'],
+                new: ['script.hql'],
+                output_only: ['output/000000_0']}
+        modified = {old: long_ago, new: now, output_only: long_ago}
+
+        def list_keys(uri, *args):
+            job_dir = uri.split('/')[-2]
+            return [Obj(name='bar/{0}/{1}'.format(job_dir, name),
+                        last_modified=modified[job_dir])
+                    for name in keys[job_dir]]
+        apiarist.emr.list_keys = list_keys
+        self.assertEqual(gc_job_files('s3://foo/bar/', 7, dry_run=True),
+                         ['s3://foo/bar/' + old + '/'])
+        self.assertEqual(self.deleted, [])
+        gc_job_files('s3://foo/bar', 7)
+        # the output is kept
+        self.assertEqual(self.deleted, [
+            ('s3://foo/bar/' + old + '/',
+             ['s3://foo/bar/' + old + '/output/'])])
+
+
+class AutoSizeEmrTest(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        from apiarist.history import JobHistory
+        self.tmp = tempfile.mkdtemp()
+        self.history = JobHistory(os.path.join(self.tmp, 'history.db'))
+        self._s3_size = apiarist.emr.s3_size
+        apiarist.emr.s3_size = lambda *args: (8 * 10 ** 9, 4)
+        self._emr_connection = apiarist.emr.EmrConnection
+        self._get_conn = apiarist.logs.get_conn
+        apiarist.logs.get_conn = lambda *args: FakeS3Connection(
+            FakeBucket())
+        os.environ['S3_SCRATCH_URI'] = 's3://foo/bar/'
+
+    def tearDown(self):
+        import shutil
+        apiarist.emr.EmrConnection = self._emr_connection
+        apiarist.logs.get_conn = self._get_conn
+        apiarist.emr.s3_size = self._s3_size
+        shutil.rmtree(self.tmp)
+
+    def _runner(self, **kwargs):
+        kwargs.setdefault('input_path', 's3://foo/input/')
+        return EMRRunner('TestJob', aws_access_key_id='foo',
+                         aws_secret_access_key='bar',
+                         master_instance_type='m3.xlarge',
+                         slave_instance_type='m3.xlarge', num_instances=2,
+                         check_emr_status_every=0, auto_size=True,
+                         target_minutes=1,
+                         auto_size_instance_types=['m3.xlarge', 'm3.2xlarge'],
+                         history_db=self.history.path, **kwargs)
+
+    def _execute(self, runner, conn):
+        apiarist.emr.EmrConnection = lambda *args: conn
+        runner.execute()
+
+    def auto_size_from_history_test(self):
+        self.history.record({
+            'job_id': 'hj-1', 'job_name': 'TestJob', 'status': 'COMPLETED',
+            'input_bytes': 10 ** 9, 'query_seconds': 60.0,
+            'num_instances': 3, 'slave_instance_type': 'm3.xlarge'})
+        r = self._runner()
+        conn = FakeEmrConnection()
+        self._execute(r, conn)
+        kwargs = conn.calls[0][1]
+        # 8 times the data in the same time needs 8 times the cores
+        self.assertEqual(kwargs['slave_instance_type'], 'm3.xlarge')
+        self.assertEqual(kwargs['num_instances'], 17)
+        self.assertEqual(r.metrics['predicted_query_seconds'], 60.0)
+        self.assertEqual(r.history_record()['predicted_seconds'], 60.0)
+
+    def auto_size_local_input_test(self):
+        self.history.record({
+            'job_id': 'hj-1', 'job_name': 'TestJob', 'status': 'COMPLETED',
+            'input_bytes': 10 ** 9, 'query_seconds': 60.0,
+            'num_instances': 3, 'slave_instance_type': 'm3.xlarge'})
+        input_dir = os.path.join(self.tmp, 'input')
+        os.mkdir(input_dir)
+        for name in ('a.csv', 'b.csv'):
+            with open(os.path.join(input_dir, name), 'w') as f:
+                f.write('x' * 1000)
+        r = self._runner(input_path=input_dir)
+        r._auto_size()
+        # 2KB of local files needs the smallest cluster, where the
+        # (patched) S3 listing of 8GB would have needed 17 instances
+        self.assertEqual(r.num_instances, 2)
+        self.assertEqual(r.slave_instance_type, 'm3.xlarge')
+
+    def query_seconds_leave_out_setup_test(self):
+        from boto.emr.step import InstallHiveStep
+        r = self._runner()
+        self.assertEqual(r.history_record()['query_seconds'], None)
+        r.metrics['step_seconds'] = {InstallHiveStep.InstallHiveName: 90.0,
+                                     'TestJob': 30.0}
+        self.assertEqual(r.history_record()['query_seconds'], 30.0)
+
+    def auto_size_bounds_test(self):
+        self.history.record({
+            'job_id': 'hj-1', 'job_name': 'TestJob', 'status': 'COMPLETED',
+            'input_bytes': 10 ** 9, 'query_seconds': 60.0,
+            'num_instances': 3, 'slave_instance_type': 'm3.xlarge'})
+        r = self._runner(max_instances=10)
+        self._execute(r, FakeEmrConnection())
+        self.assertEqual(r.slave_instance_type, 'm3.2xlarge')
+        self.assertEqual(r.num_instances, 9)
+
+
+class ReleaseLabelEmrTest(EmrRunTestCase):
+
+    def _runner(self, **kwargs):
+        kwargs.setdefault('release_label', 'emr-5.36.0')
+        return super(ReleaseLabelEmrTest, self)._runner(**kwargs)
+
+    def hive_application_test(self):
+        kwargs = self._runner()._jobflow_kwargs()
+        self.assertEqual(kwargs['ami_version'], None)
+        self.assertEqual(kwargs['api_params']['ReleaseLabel'], 'emr-5.36.0')
+        self.assertEqual(kwargs['api_params']['Applications.member.1.Name'],
+                         'Hive')
+
+    def no_install_hive_step_test(self):
+        r = self._runner()
+        self.assertEqual(r._setup_steps(), [])
+        steps = r._job_steps()
+        self.assertEqual(len(steps), 1)
+        self.assertEqual(steps[0].jar(), 'command-runner.jar')
+        self.assertEqual(steps[0].args(),
+                         ['hive-script', '--run-hive-script', '--args',
+                          '-f', r.script_path] + r._hive_args())
+
+    def install_skipped_metric_test(self):
+        r = self._runner(history_db='/nonexistent/history.db')
+        self._execute(r, FakeEmrConnection())
+        self.assertTrue(r.metrics['hive_install_skipped'])
+        self.assertEqual(r.metrics['hive_install_seconds_saved'],
+                         apiarist.emr.TYPICAL_HIVE_INSTALL_SECONDS)
+        r = self._runner(release_label=None)
+        self._execute(r, FakeEmrConnection())
+        self.assertFalse(r.metrics['hive_install_skipped'])
+        self.assertFalse('hive_install_seconds_saved' in r.metrics)
+
+    def install_time_saved_from_history_test(self):
+        import shutil
+        import tempfile
+        from apiarist.history import JobHistory
+        tmp = tempfile.mkdtemp()
+        try:
+            history = JobHistory(os.path.join(tmp, 'history.db'))
+            for i, seconds in enumerate([100.0, 200.0, 150.0]):
+                history.record({'job_id': 'hj-{0}'.format(i),
+                                'job_name': 'Other', 'status': 'COMPLETED',
+                                'hive_install_seconds': seconds})
+            r = self._runner(history_db=history.path)
+            self._execute(r, FakeEmrConnection())
+            self.assertEqual(r.metrics['hive_install_seconds_saved'], 150.0)
+        finally:
+            shutil.rmtree(tmp)
+
+    def cluster_without_hive_not_ready_test(self):
+        conn = FakeEmrConnection(applications=('Spark',))
+        self.assertRaises(ClusterNotReadyError, self._execute,
+                          self._runner(), conn)
+        conn = FakeEmrConnection(state='TERMINATING')
+        self.assertRaises(ClusterNotReadyError, self._execute,
+                          self._runner(), conn)
+
+    def pooled_cluster_without_hive_test(self):
+        r = self._runner(pool_clusters=True)
+        conn = FakeEmrConnection(applications=('Spark',), clusters={
+            'j-POOLED': r._pool_tags()})
+        self.assertRaises(ClusterNotReadyError, self._execute, r, conn)
+        # it wasn't used: a new cluster was requested
+        self.assertEqual(conn.calls[0][0], 'run_jobflow')
+
+
+class SparkEmrTest(unittest.TestCase):
+
+    def setUp(self):
+        os.environ['S3_SCRATCH_URI'] = 's3://foo/bar/'
+        self.runner = SparkEMRRunner('TestJob', aws_access_key_id='foo',
+                                     aws_secret_access_key='bar',
+                                     ami_version='latest')
+
+    def script_path_test(self):
+        r = self.runner
+        self.assertEqual(r.script_path,
+                         's3://foo/bar/' + r.job_id + '/script.py')
+        self.assertEqual(r.local_script_file[-3:], '.py')
+
+    def release_label_test(self):
+        kwargs = self.runner._jobflow_kwargs()
+        self.assertEqual(kwargs['ami_version'], None)
+        self.assertEqual(kwargs['api_params']['ReleaseLabel'],
+                         SparkEMRRunner.DEFAULT_RELEASE_LABEL)
+        self.assertEqual(kwargs['api_params']['Applications.member.1.Name'],
+                         'Spark')
+        r = SparkEMRRunner('TestJob', release_label='emr-6.0.0',
+                           aws_access_key_id='foo',
+                           aws_secret_access_key='bar')
+        self.assertEqual(r._jobflow_kwargs()['api_params']['ReleaseLabel'],
+                         'emr-6.0.0')
+
+    def spark_submit_step_test(self):
+        self.assertEqual(self.runner._setup_steps(), [])
+        steps = self.runner._job_steps()
+        self.assertEqual(len(steps), 1)
+        self.assertEqual(steps[0].name, 'TestJob')
+        self.assertEqual(steps[0].jar(), 'command-runner.jar')
+        self.assertEqual(steps[0].args(),
+                         ['spark-submit', '--deploy-mode', 'cluster',
+                          self.runner.script_path])
@@ -0,0 +1,127 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+An in-memory stand-in for the parts of boto's S3 API apiarist uses,
+shared by the tests. Objects are kept in `FakeBucket.objects`, a dict
+of key name => contents.
+"""
+import re
+import threading
+from boto.exception import S3ResponseError
+
+
+class Obj(object):
+    """Attribute bag standing in for boto's response objects"""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeKey(object):
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.key = name
+
+    @property
+    def size(self):
+        return len(self.bucket.objects.get(self.name, b''))
+
+    def get_contents_as_string(self, headers=None):
+        if self.name not in self.bucket.objects:
+            raise S3ResponseError(404, 'Not Found')
+        data = self.bucket.objects[self.name]
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        if headers and 'Range' in headers:
+            self.bucket.ranges.setdefault(self.name, []).append(
+                headers['Range'])
+            start, end = headers['Range'][len('bytes='):].split('-')
+            if end:
+                return data[int(start):int(end) + 1]
+            return data[int(start):]
+        return data
+
+    def set_contents_from_string(self, data, headers=None):
+        # conditional puts, as used by the S3 job registry
+        if (headers or {}).get('If-None-Match') == '*' and \
+                self.name in self.bucket.objects:
+            raise S3ResponseError(412, 'Precondition Failed')
+        self.bucket.objects[self.name] = data
+
+    def set_contents_from_file(self, fp, query_args=None, **kwargs):
+        # only used to upload parts of multipart uploads
+        m = re.match(r'uploadId=(.+)&partNumber=(\d+)', query_args)
+        data = fp.read()
+        with self.bucket.lock:
+            self.bucket.parts[m.group(1)][int(m.group(2))] = data
+        self.etag = '"etag-{0}"'.format(m.group(2))
+
+    def delete(self):
+        self.bucket.objects.pop(self.name, None)
+
+
+class FakeBucket(object):
+
+    def __init__(self, objects=None):
+        self.objects = dict(objects or {})
+        # key name => Range headers it was read with
+        self.ranges = {}
+        # upload id => part number => data
+        self.parts = {}
+        # (key name, part numbers) of completed multipart uploads
+        self.completed = []
+        # sizes of the multi-object delete requests
+        self.delete_batches = []
+        self.lock = threading.Lock()
+
+    def list(self, prefix='', delimiter=None):
+        names = sorted(n for n in self.objects if n.startswith(prefix))
+        if delimiter:
+            # collapse to the first 'directory' after the prefix
+            names = sorted(set(
+                prefix + n[len(prefix):].split(delimiter)[0] +
+                (delimiter if delimiter in n[len(prefix):] else '')
+                for n in names))
+        return [FakeKey(self, name) for name in names]
+
+    def get_key(self, name):
+        return FakeKey(self, name) if name in self.objects else None
+
+    def new_key(self, name):
+        return FakeKey(self, name)
+
+    def copy_key(self, new_name, bucket_name, name):
+        self.objects[new_name] = self.objects[name]
+        return FakeKey(self, new_name)
+
+    def delete_keys(self, names, quiet=False):
+        self.delete_batches.append(len(names))
+        for name in names:
+            self.objects.pop(name, None)
+        return Obj(errors=[])
+
+    def initiate_multipart_upload(self, name):
+        with self.lock:
+            upload_id = 'up-{0}'.format(len(self.parts))
+            self.parts[upload_id] = {}
+        return Obj(id=upload_id)
+
+    def complete_multipart_upload(self, name, upload_id, xml):
+        parts = self.parts.pop(upload_id)
+        numbers = [int(n) for n in re.findall(r'<PartNumber>(\d+)', xml)]
+        self.completed.append((name, numbers))
+        self.objects[name] = b''.join(parts[n] for n in numbers)
+
+    def cancel_multipart_upload(self, name, upload_id):
+        self.parts.pop(upload_id)
+
+
+class FakeS3Connection(object):
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def get_bucket(self, name):
+        return self.bucket
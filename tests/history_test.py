@@ -0,0 +1,181 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+import apiarist.s3
+from apiarist.history import JobHistory
+from apiarist.history import record_run
+from apiarist.history import seconds_per_gb
+from apiarist.launch import HiveJobLauncher
+from apiarist.runner import HiveJobRunner
+
+GB = 10 ** 9
+
+
+def run(job_id, job_name='TestJob', started=0, seconds=60.0,
+        input_bytes=GB, status='COMPLETED'):
+    return {'job_id': job_id, 'job_name': job_name, 'started': started,
+            'total_seconds': seconds, 'input_bytes': input_bytes,
+            'status': status}
+
+
+class FinishedRunner(HiveJobRunner):
+
+    def __init__(self, fail=False, **kwargs):
+        super(FinishedRunner, self).__init__(**kwargs)
+        self.fail = fail
+
+    def stage(self):
+        pass
+
+    def execute(self):
+        if self.fail:
+            raise ValueError('failed')
+
+    def _input_size(self):
+        return 2048, 2
+
+
+class HistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'history', 'history.db')
+        self.history = JobHistory(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def default_path_test(self):
+        os.environ['APIARIST_HISTORY_DB'] = self.path
+        try:
+            self.assertEqual(JobHistory().path, self.path)
+        finally:
+            del os.environ['APIARIST_HISTORY_DB']
+
+    def record_run_test(self):
+        self.history.record(run('hj-1'))
+        runs = self.history.runs()
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(runs[0]['job_id'], 'hj-1')
+        self.assertEqual(runs[0]['input_bytes'], GB)
+        self.assertEqual(runs[0]['output_bytes'], None)
+
+    def runs_are_oldest_first_test(self):
+        for i in (3, 1, 2):
+            self.history.record(run('hj-{0}'.format(i), started=i))
+        self.assertEqual([r['job_id'] for r in self.history.runs()],
+                         ['hj-1', 'hj-2', 'hj-3'])
+        self.assertEqual([r['job_id'] for r in self.history.runs(limit=2)],
+                         ['hj-2', 'hj-3'])
+
+    def runs_of_one_job_test(self):
+        self.history.record(run('hj-1'))
+        self.history.record(run('hj-2', job_name='OtherJob'))
+        self.assertEqual([r['job_id'] for r in self.history.runs('OtherJob')],
+                         ['hj-2'])
+
+    def seconds_per_gb_test(self):
+        self.assertEqual(seconds_per_gb(run('hj-1', input_bytes=2 * GB)),
+                         30.0)
+        self.assertEqual(seconds_per_gb(run('hj-1', input_bytes=None)),
+                         None)
+
+    def trends_test(self):
+        for i in range(10):
+            self.history.record(run('hj-{0}'.format(i), started=i,
+                                    seconds=60.0 * (i + 1)))
+        self.history.record(run('hj-x', started=20, status='FAILED'))
+        trend, = self.history.trends(window=3)
+        self.assertEqual(trend['runs'], 10)
+        self.assertEqual(trend['first_seconds_per_gb'], 120.0)
+        self.assertEqual(trend['last_seconds_per_gb'], 540.0)
+        self.assertEqual(trend['last_seconds'], 600.0)
+
+    def regressions_test(self):
+        for i in range(5):
+            self.history.record(run('hj-{0}'.format(i), started=i))
+            self.history.record(run('other-{0}'.format(i), started=i,
+                                    job_name='OtherJob'))
+        self.history.record(run('hj-5', started=5, seconds=120.0))
+        self.history.record(run('other-5', started=5, seconds=70.0,
+                                job_name='OtherJob'))
+        self.assertEqual(self.history.regressions(threshold=1.5),
+                         [('TestJob', 120.0, 60.0)])
+
+    def merge_test(self):
+        other = JobHistory(os.path.join(self.tmp, 'other.db'))
+        other.record(run('hj-1', started=1))
+        other.record(run('hj-2', started=2))
+        self.history.record(run('hj-2', started=2, status='FAILED'))
+        self.history.merge(other.path)
+        runs = self.history.runs()
+        self.assertEqual([r['job_id'] for r in runs], ['hj-1', 'hj-2'])
+        # the local record is kept
+        self.assertEqual(runs[1]['status'], 'FAILED')
+
+    def record_run_with_s3_copy_test(self):
+        uploads = []
+        s3_copy = JobHistory(os.path.join(self.tmp, 's3-copy.db'))
+        s3_copy.record(run('hj-0'))
+        patched = {
+            's3_key_exists': lambda *args: True,
+            'download_s3_file': lambda uri, path, *creds: shutil.copyfile(
+                s3_copy.path, path),
+            'upload_file_to_s3': lambda path, uri, *creds: uploads.append(
+                (path, uri)),
+            }
+        originals = dict((name, getattr(apiarist.s3, name))
+                         for name in patched)
+        for name, f in patched.items():
+            setattr(apiarist.s3, name, f)
+        try:
+            history = record_run(run('hj-1'), self.path,
+                                 's3://bucket/history.db')
+        finally:
+            for name, f in originals.items():
+                setattr(apiarist.s3, name, f)
+        self.assertEqual(sorted(r['job_id'] for r in history.runs()),
+                         ['hj-0', 'hj-1'])
+        self.assertEqual(uploads, [(self.path, 's3://bucket/history.db')])
+        self.assertFalse(os.path.exists(self.path + '.s3'))
+
+
+class RunnerHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'history.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def history_record_test(self):
+        r = FinishedRunner(job_name='TestJob')
+        r.run()
+        record = r.history_record()
+        self.assertEqual(record['job_id'], r.job_id)
+        self.assertEqual(record['input_bytes'], 2048)
+        self.assertEqual(record['input_objects'], 2)
+        self.assertTrue(record['execute_seconds'] is not None)
+
+    def launcher_records_failed_run_test(self):
+        launcher = HiveJobLauncher('TestJob', ['/foo/bar', '--history-db',
+                                               self.path])
+        r = FinishedRunner(fail=True, job_name='TestJob')
+        launcher.make_runner = lambda: r
+        launcher.set_up_logging = lambda **kwargs: None
+        self.assertRaises(ValueError, launcher.run_job)
+        run, = JobHistory(self.path).runs()
+        self.assertEqual(run['status'], 'FAILED')
+        self.assertEqual(run['runner'], 'local')
+
+    def no_history_test(self):
+        launcher = HiveJobLauncher('TestJob', ['/foo/bar', '--history-db',
+                                               self.path, '--no-history'])
+        launcher.make_runner = lambda: FinishedRunner(job_name='TestJob')
+        launcher.set_up_logging = lambda **kwargs: None
+        launcher.run_job()
+        self.assertFalse(os.path.exists(self.path))
@@ -4,6 +4,7 @@
 import unittest
 from apiarist.job import HiveJob, InvalidHiveJobException
 from apiarist.job import HiveQuery
+from apiarist.script import SweepQuery
 
 
 class MockJob(HiveJob):
@@ -28,6 +29,16 @@ class MockJob(HiveJob):
                                     dest='popt')
 
 
+class SweepMockJob(MockJob):
+    def query(self):
+        return "SELECT foo FROM foo WHERE day = '{0}' AND x = {1}".format(
+            self.options.popt, self.options.x)
+
+    def configure_options(self):
+        super(SweepMockJob, self).configure_options()
+        self.add_passthrough_option('--x', dest='x', default='1')
+
+
 class BrokenMockJob(MockJob):
     def query(self):
         return None
@@ -80,3 +91,27 @@ class HiveJobTest(unittest.TestCase):
     def broken_query_raises_invalid_job_error_test(self):
         j = BrokenMockJob(['foo'])
         self.assertRaises(InvalidHiveJobException, j.plain_query)
+
+    def no_sweep_test(self):
+        self.assertEqual(MockJob(['foo']).sweep_params(), [])
+
+    def sweep_params_test(self):
+        j = SweepMockJob(['foo', '--sweep', 'popt=mon,tue',
+                          '--sweep', 'x=1,2'])
+        self.assertEqual(j.sweep_params(), [
+            [('popt', 'mon'), ('x', '1')], [('popt', 'mon'), ('x', '2')],
+            [('popt', 'tue'), ('x', '1')], [('popt', 'tue'), ('x', '2')]])
+
+    def sweep_query_test(self):
+        j = SweepMockJob(['foo', '--sweep', 'popt=mon,tue'])
+        hq = j.hive_query()
+        self.assertEqual(type(hq), SweepQuery)
+        self.assertEqual(hq.variants, [
+            ('popt=mon', "SELECT foo FROM foo WHERE day = 'mon' AND x = 1;"),
+            ('popt=tue', "SELECT foo FROM foo WHERE day = 'tue' AND x = 1;")])
+        # the job's own options are left alone
+        self.assertEqual(j.options.popt, None)
+
+    def sweep_only_passthrough_options_test(self):
+        j = SweepMockJob(['foo', '--sweep', 'runner=emr'])
+        self.assertRaises(InvalidHiveJobException, j.sweep_params)
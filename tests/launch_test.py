@@ -3,8 +3,10 @@
 
 import sys
 import unittest
+from optparse import OptionValueError
 from apiarist.launch import HiveJobLauncher
 from apiarist.launch import ArgumentMissingError
+from apiarist.runner import UnknownRunnerError
 
 try:
     from conf_test import CONFIG_PATH
@@ -12,6 +14,13 @@ except:
     from .conf_test import CONFIG_PATH
 
 
+class LocalJobLauncher(HiveJobLauncher):
+    """Launcher which doesn't need a real HiveJob for its query"""
+
+    def hive_query(self):
+        return None
+
+
 class HiveJobLauncherTest(unittest.TestCase):
 
     DATA_PATH = 's3://path/to/data/'
@@ -134,3 +143,39 @@ class HiveJobLauncherTest(unittest.TestCase):
         j = HiveJobLauncher('TestJob', [self.DATA_PATH,
                                         '--retain-hive-table'])
         self.assertTrue(j.options.retain_hive_table)
+
+    def make_local_runner_test(self):
+        from apiarist.local import LocalRunner
+        j = LocalJobLauncher('TestJob', ['/path/to/data', '-r', 'local'])
+        r = j.make_runner()
+        self.assertTrue(isinstance(r, LocalRunner))
+        self.assertEqual(r.job_name, 'TestJob')
+        self.assertEqual(r.input_path, '/path/to/data')
+
+    def make_unknown_runner_test(self):
+        j = LocalJobLauncher('TestJob', [self.DATA_PATH, '-r', 'foo'])
+        self.assertRaises(UnknownRunnerError, j.make_runner)
+
+    def resume_needs_checkpoints_test(self):
+        from apiarist.emr import EMRRunner
+        from apiarist.local import LocalRunner
+        self.assertTrue(EMRRunner.checkpoints())
+        self.assertFalse(LocalRunner.checkpoints())
+        j = LocalJobLauncher('TestJob', [self.DATA_PATH, '-r', 'local',
+                                         '--resume', 'hj-1'])
+        self.assertRaises(OptionValueError, j.make_runner)
+
+    def supply_release_label_test(self):
+        j = HiveJobLauncher('TestJob', [self.DATA_PATH])
+        self.assertEqual(None, j.options.release_label)
+        j = HiveJobLauncher('TestJob', [self.DATA_PATH,
+                                        '--release-label', 'emr-5.36.0'])
+        self.assertEqual('emr-5.36.0', j.options.release_label)
+
+    def make_spark_runner_test(self):
+        from apiarist.spark import SparkLocalRunner
+        j = LocalJobLauncher('TestJob', ['/path/to/data', '-r', 'spark',
+                                         '--spark-submit', '/bin/spark'])
+        r = j.make_runner()
+        self.assertTrue(isinstance(r, SparkLocalRunner))
+        self.assertEqual(r.spark_submit, '/bin/spark')
@@ -40,3 +40,187 @@ class LocalTest(unittest.TestCase):
         r = LocalRunner('TestJob', input_path='/foo/bar',
                         retain_hive_table=True)
         self.assertTrue(r.retain_hive_table)
+
+    def output_dirs_test(self):
+        r = LocalRunner('TestJob', input_path='/foo/bar', temp_dir='/tmp/')
+        self.assertEqual(r._output_dirs(), [(None, r.output_dir)])
+
+    def multi_output_dirs_test(self):
+        from script_test import MultiOutputJob
+        from apiarist.script import HiveQuery
+        hq = HiveQuery(MultiOutputJob([
+            ('daily', [('day', 'STRING')], 'SELECT day'),
+            ('addresses', [('address', 'STRING')], 'SELECT address')]))
+        r = LocalRunner('TestJob', input_path='/foo/bar', hive_query=hq,
+                        temp_dir='/tmp/')
+        self.assertEqual(r._output_dirs(), [
+            ('daily', r.output_dir + '/daily/'),
+            ('addresses', r.output_dir + '/addresses/')])
+
+    def prune_columns_stage_test(self):
+        import shutil
+        import tempfile
+        from script_test import DummyJob
+        from apiarist.script import HiveQuery
+        tmp = tempfile.mkdtemp() + '/'
+        try:
+            input_path = tmp + 'input.csv'
+            with open(input_path, 'w') as f:
+                f.write('mon,a@b.com,1\ntue,c@d.com,2\n')
+            hq = HiveQuery(DummyJob(
+                'SELECT day, SUM(sent) FROM emails GROUP BY day', 'emails',
+                [('day', 'STRING'), ('address', 'STRING'), ('sent', 'INT')],
+                [('day', 'STRING'), ('sent', 'INT')]))
+            r = LocalRunner('TestJob', input_path=input_path, hive_query=hq,
+                            temp_dir=tmp, prune_columns=True)
+            r.stage()
+            with open(r.data_path) as f:
+                self.assertEqual(f.read(), '"mon","1"\n"tue","2"\n')
+        finally:
+            shutil.rmtree(tmp)
+
+
+class LocalCleanupTest(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.mkdtemp() + '/'
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp)
+
+    def _runner(self, **kwargs):
+        r = LocalRunner('TestJob', input_path='/foo/bar', temp_dir=self.tmp,
+                        **kwargs)
+        r._ensure_local_scratch_dir_exists()
+        return r
+
+    def scratch_dir_is_removed_in_background_test(self):
+        r = self._runner()
+        r.cleanup()
+        self.assertFalse(os.path.exists(r.scratch_dir))
+        r.cleanup_thread.join()
+        self.assertEqual(os.listdir(self.tmp), [])
+
+    def retained_scratch_dir_is_not_active_test(self):
+        from apiarist.scratch import is_active
+        r = self._runner(retain_hive_table=True)
+        self.assertTrue(is_active(r.scratch_dir))
+        r.cleanup()
+        self.assertTrue(os.path.exists(r.scratch_dir))
+        self.assertFalse(is_active(r.scratch_dir))
+
+    def quota_evicts_retained_scratch_dirs_test(self):
+        old = self._runner(retain_hive_table=True)
+        with open(old.data_path, 'w') as f:
+            f.write('x' * 100)
+        old.cleanup()
+        os.utime(old.data_path, (1000, 1000))
+        os.utime(old.scratch_dir, (1000, 1000))
+        r = self._runner(retain_hive_table=True, scratch_quota='50')
+        with open(r.data_path, 'w') as f:
+            f.write('x' * 10)
+        r.cleanup()
+        self.assertFalse(os.path.exists(old.scratch_dir))
+        self.assertTrue(os.path.exists(r.scratch_dir))
+        # let the eviction finish before tearDown
+        import threading
+        for thread in threading.enumerate():
+            if thread.name.startswith('remove-'):
+                thread.join()
+
+
+class TableCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.mkdtemp() + '/'
+        self.input_path = self.tmp + 'input.csv'
+        with open(self.input_path, 'w') as f:
+            f.write('mon,1\n')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp)
+
+    def _runner(self):
+        from script_test import DummyJob
+        from apiarist.script import HiveQuery
+        hq = HiveQuery(DummyJob(
+            'SELECT day FROM emails', 'emails',
+            [('day', 'STRING'), ('sent', 'INT')], [('day', 'STRING')]))
+        return LocalRunner('TestJob', input_path=self.input_path,
+                           hive_query=hq, temp_dir=self.tmp,
+                           cache_tables=True)
+
+    def _loaded(self, r):
+        # as if hive had run the script
+        from apiarist.local import CACHED_TABLE_MARKER
+        open(os.path.join(r.table_path, CACHED_TABLE_MARKER), 'w').close()
+        r.cleanup()
+        r.cleanup_thread.join()
+
+    def _script(self, r):
+        with open(r.local_script_file) as f:
+            return f.read()
+
+    def first_run_loads_the_table_test(self):
+        r = self._runner()
+        r.stage()
+        self.assertTrue(r.table_path.startswith(self.tmp + 'tables/'))
+        self.assertFalse(r.table_cached)
+        self.assertTrue('LOAD DATA' in self._script(r))
+
+    def later_run_reuses_the_table_test(self):
+        first = self._runner()
+        first.stage()
+        self._loaded(first)
+        r = self._runner()
+        r.stage()
+        self.assertTrue(r.table_cached)
+        self.assertEqual(r.table_path, first.table_path)
+        self.assertFalse(os.path.exists(r.data_path))
+        self.assertFalse('LOAD DATA' in self._script(r))
+
+    def changed_input_is_loaded_again_test(self):
+        first = self._runner()
+        first.stage()
+        self._loaded(first)
+        with open(self.input_path, 'a') as f:
+            f.write('tue,2\n')
+        r = self._runner()
+        r.stage()
+        self.assertFalse(r.table_cached)
+        self.assertNotEqual(r.table_path, first.table_path)
+
+    def table_being_loaded_is_not_shared_test(self):
+        first = self._runner()
+        first.stage()
+        r = self._runner()
+        r.stage()
+        self.assertFalse(r.cache_tables)
+        self.assertEqual(r.table_path, r.scratch_dir + 'table')
+
+    def failed_run_raises_test(self):
+        import subprocess
+        from apiarist.local import CACHED_TABLE_MARKER
+        # a hive which fails
+        bin_dir = self.tmp + 'bin/'
+        os.mkdir(bin_dir)
+        with open(bin_dir + 'hive', 'w') as f:
+            f.write('#!/bin/sh\nexit 3\n')
+        os.chmod(bin_dir + 'hive', 0o755)
+        path = os.environ['PATH']
+        os.environ['PATH'] = bin_dir + os.pathsep + path
+        r = self._runner()
+        r.stage()
+        try:
+            with self.assertRaises(subprocess.CalledProcessError) as e:
+                r.execute()
+        finally:
+            os.environ['PATH'] = path
+        self.assertEqual(e.exception.returncode, 3)
+        # the table mustn't be used by later runs
+        self.assertFalse(os.path.exists(
+            os.path.join(r.table_path, CACHED_TABLE_MARKER)))
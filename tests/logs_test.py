@@ -0,0 +1,98 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import gzip
+import io
+import unittest
+import apiarist.logs
+from apiarist.logs import StepLogTailer
+from apiarist.logs import find_hive_error
+from fake_s3 import FakeBucket, FakeS3Connection
+
+STEPS = 'logs/j-1/steps/'
+
+
+def gzipped(text):
+    buf = io.BytesIO()
+    f = gzip.GzipFile(fileobj=buf, mode='wb')
+    f.write(text.encode('utf-8'))
+    f.close()
+    return buf.getvalue()
+
+
+class StepLogTailerTest(unittest.TestCase):
+
+    def setUp(self):
+        self._get_conn = apiarist.logs.get_conn
+        self.bucket = FakeBucket()
+        apiarist.logs.get_conn = lambda *args: FakeS3Connection(self.bucket)
+        self.tailer = StepLogTailer('s3://b/logs', 'j-1', ['s-1'])
+
+    def tearDown(self):
+        apiarist.logs.get_conn = self._get_conn
+
+    def _put(self, name, data):
+        self.bucket.objects[STEPS + 's-1/' + name] = data
+
+    def steps_uri_test(self):
+        self.assertEqual(self.tailer.steps_uri, 's3://b/logs/j-1/steps/')
+
+    def no_logs_yet_test(self):
+        self.assertEqual(self.tailer.poll(), [])
+
+    def plain_log_reads_new_bytes_test(self):
+        self._put('stderr', b'one\n')
+        self.assertEqual(self.tailer.poll(), [('s-1', 'stderr', 'one\n')])
+        # unchanged objects aren't read again
+        self.assertEqual(self.tailer.poll(), [])
+        self._put('stderr', b'one\ntwo\n')
+        self.assertEqual(self.tailer.poll(), [('s-1', 'stderr', 'two\n')])
+        self.assertEqual(self.bucket.ranges[STEPS + 's-1/stderr'],
+                         ['bytes=4-'])
+
+    def gzipped_log_reads_new_lines_test(self):
+        self._put('syslog.gz', gzipped('one\n'))
+        self.assertEqual(self.tailer.poll(), [('s-1', 'syslog', 'one\n')])
+        self._put('syslog.gz', gzipped('one\ntwo\n'))
+        self.assertEqual(self.tailer.poll(), [('s-1', 'syslog', 'two\n')])
+
+    def ignores_other_steps_test(self):
+        self.bucket.objects[STEPS + 's-2/stderr'] = b'other\n'
+        self.assertEqual(self.tailer.poll(), [])
+
+    def failure_logs_test(self):
+        self._put('controller.gz', gzipped('controller\n'))
+        self._put('stderr.gz', gzipped('err\n'))
+        self._put('syslog', b'sys\n')
+        self.assertEqual(self.tailer.failure_logs(['s-1']),
+                         {('s-1', 'stderr'): 'err\n',
+                          ('s-1', 'syslog'): 'sys\n'})
+
+    def hive_error_test(self):
+        self._put('syslog', b'java.io.IOException: disk\n')
+        self._put('stderr.gz', gzipped(
+            'OK\nFAILED: SemanticException [Error 10001]: '
+            'Table not found foo\n'))
+        self.assertEqual(self.tailer.hive_error(['s-1']),
+                         'FAILED: SemanticException [Error 10001]: '
+                         'Table not found foo')
+
+    def no_hive_error_test(self):
+        self.assertEqual(self.tailer.hive_error(['s-1']), None)
+
+
+class FindHiveErrorTest(unittest.TestCase):
+
+    def failed_line_preferred_test(self):
+        text = ("Caused by: java.lang.RuntimeException: x\n"
+                "FAILED: Execution Error, return code 2\n")
+        self.assertEqual(find_hive_error(text),
+                         'FAILED: Execution Error, return code 2')
+
+    def caused_by_test(self):
+        text = "INFO starting\nCaused by: java.io.IOException: gone\n"
+        self.assertEqual(find_hive_error(text),
+                         'Caused by: java.io.IOException: gone')
+
+    def nothing_found_test(self):
+        self.assertEqual(find_hive_error("INFO all good\n"), None)
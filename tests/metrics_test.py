@@ -0,0 +1,153 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import socket
+import shutil
+import tempfile
+import unittest
+from six.moves.urllib.request import Request, urlopen
+from apiarist import metrics
+from apiarist.metrics import Counter
+from apiarist.metrics import Histogram
+from apiarist.runner import HiveJobRunner
+
+
+class SimpleRunner(HiveJobRunner):
+
+    def __init__(self, fail=False):
+        super(SimpleRunner, self).__init__('SimpleJob')
+        self.fail = fail
+
+    def stage(self):
+        pass
+
+    def execute(self):
+        if self.fail:
+            raise ValueError('failed')
+
+
+class CounterTest(unittest.TestCase):
+
+    def inc_test(self):
+        c = Counter('test_things', 'Things.', ['kind'])
+        c.inc(kind='a')
+        c.inc(3, kind='a')
+        c.inc(kind='b')
+        self.assertEqual(c.value(kind='a'), 4)
+        self.assertEqual(c.value(kind='c'), 0)
+
+    def labels_are_checked_test(self):
+        c = Counter('test_things', 'Things.', ['kind'])
+        self.assertRaises(ValueError, c.inc)
+        self.assertRaises(ValueError, c.inc, kind='a', other='b')
+        self.assertRaises(ValueError, c.inc, -1, kind='a')
+
+    def exposition_test(self):
+        c = Counter('test_things', 'Things.', ['kind'])
+        c.inc(2, kind='a"b')
+        self.assertEqual(c.exposition(), [
+            '# HELP test_things_total Things.',
+            '# TYPE test_things_total counter',
+            'test_things_total{kind="a\\"b"} 2.0'])
+
+    def openmetrics_exposition_test(self):
+        c = Counter('test_things', 'Things.')
+        c.inc()
+        self.assertEqual(c.exposition(openmetrics=True), [
+            '# HELP test_things Things.',
+            '# TYPE test_things counter',
+            'test_things_total 1.0'])
+
+
+class HistogramTest(unittest.TestCase):
+
+    def observe_test(self):
+        h = Histogram('test_seconds', 'Seconds.', ['phase'],
+                      buckets=(1, 10))
+        h.observe(0.5, phase='stage')
+        h.observe(5, phase='stage')
+        h.observe(50, phase='stage')
+        self.assertEqual(h.count(phase='stage'), 3)
+        self.assertEqual(h.exposition()[2:], [
+            'test_seconds_bucket{phase="stage",le="1.0"} 1.0',
+            'test_seconds_bucket{phase="stage",le="10.0"} 2.0',
+            'test_seconds_bucket{phase="stage",le="+Inf"} 3.0',
+            'test_seconds_count{phase="stage"} 3.0',
+            'test_seconds_sum{phase="stage"} 55.5'])
+
+
+class ExpositionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def all_metrics_test(self):
+        text = metrics.exposition()
+        for metric in metrics.METRICS:
+            self.assertTrue('# TYPE {0}'.format(metric.name) in text)
+        self.assertFalse('# EOF' in text)
+        self.assertTrue(metrics.exposition(True).endswith('# EOF\n'))
+
+    def write_textfile_test(self):
+        path = os.path.join(self.tmp, 'apiarist.prom')
+        metrics.write_textfile(path)
+        with open(path) as f:
+            self.assertEqual(f.read(), metrics.exposition())
+        self.assertEqual(os.listdir(self.tmp), ['apiarist.prom'])
+
+    def s3_call_test(self):
+        @metrics.s3_call('test')
+        def helper(x):
+            return x * 2
+        before = metrics.S3_CALLS.value(operation='test')
+        self.assertEqual(helper(2), 4)
+        self.assertEqual(helper.__name__, 'helper')
+        self.assertEqual(metrics.S3_CALLS.value(operation='test'),
+                         before + 1)
+
+    def serve_test(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        server = metrics.serve(port, '127.0.0.1')
+        try:
+            url = 'http://127.0.0.1:{0}/metrics'.format(port)
+            response = urlopen(url)
+            self.assertTrue(response.headers['Content-Type'].startswith(
+                'text/plain'))
+            self.assertTrue(b'apiarist_jobs_started_total' in
+                            response.read())
+            request = Request(url, headers={
+                'Accept': 'application/openmetrics-text'})
+            body = urlopen(request).read()
+            self.assertTrue(body.endswith(b'# EOF\n'))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class RunnerMetricsTest(unittest.TestCase):
+
+    def successful_run_test(self):
+        started = metrics.JOBS_STARTED.value(runner='SimpleRunner')
+        succeeded = metrics.JOBS_SUCCEEDED.value(runner='SimpleRunner')
+        phases = metrics.PHASE_SECONDS.count(runner='SimpleRunner',
+                                             phase='execute')
+        SimpleRunner().run()
+        self.assertEqual(metrics.JOBS_STARTED.value(runner='SimpleRunner'),
+                         started + 1)
+        self.assertEqual(metrics.JOBS_SUCCEEDED.value(runner='SimpleRunner'),
+                         succeeded + 1)
+        self.assertEqual(metrics.PHASE_SECONDS.count(runner='SimpleRunner',
+                                                     phase='execute'),
+                         phases + 1)
+
+    def failed_run_test(self):
+        failed = metrics.JOBS_FAILED.value(runner='SimpleRunner')
+        self.assertRaises(ValueError, SimpleRunner(fail=True).run)
+        self.assertEqual(metrics.JOBS_FAILED.value(runner='SimpleRunner'),
+                         failed + 1)
@@ -0,0 +1,151 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+from apiarist.job import HiveJob
+from apiarist.pipeline import HiveJobPipeline
+from apiarist.script import PipelineQuery
+from apiarist import InvalidHiveJobException
+
+
+class DailyEmails(HiveJob):
+
+    def table(self):
+        return 'emails'
+
+    def input_columns(self):
+        return [('day', 'STRING'), ('address', 'STRING')]
+
+    def output_columns(self):
+        return [('day', 'STRING'), ('total', 'BIGINT')]
+
+    def query(self):
+        return "SELECT day, COUNT(*) FROM emails GROUP BY day;"
+
+
+class BusyDays(HiveJob):
+
+    INFILE_DELIMITER_CHAR = r'\t'
+    OUTFILE_DELIMITER_CHAR = r'|'
+
+    def table(self):
+        return 'daily_emails'
+
+    def input_columns(self):
+        return [('day', 'STRING'), ('total', 'bigint')]
+
+    def output_columns(self):
+        return [('day', 'STRING')]
+
+    def query(self):
+        return "SELECT day FROM daily_emails WHERE total > {0}".format(
+            self.options.threshold)
+
+
+class BusyDaysPipeline(HiveJobPipeline):
+
+    def steps(self):
+        return [DailyEmails, BusyDays]
+
+    def configure_options(self):
+        super(BusyDaysPipeline, self).configure_options()
+        self.add_passthrough_option('--threshold', dest='threshold',
+                                    default='100')
+
+
+class MismatchedPipeline(BusyDaysPipeline):
+
+    def steps(self):
+        return [BusyDays, DailyEmails]
+
+
+class HiveJobPipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pipeline = BusyDaysPipeline(['-r', 'local', 'input.csv'])
+
+    def steps_share_options_test(self):
+        jobs = self.pipeline.step_jobs()
+        self.assertEqual([j.options for j in jobs],
+                         [self.pipeline.options] * 2)
+        self.assertTrue('total > 100' in jobs[1].query())
+
+    def io_of_first_and_last_steps_test(self):
+        self.assertEqual(self.pipeline.table(), 'emails')
+        self.assertEqual(self.pipeline.output_columns(), [('day', 'STRING')])
+
+    def hive_query_test(self):
+        hq = self.pipeline.hive_query()
+        self.assertTrue(isinstance(hq, PipelineQuery))
+        self.assertEqual(hq.intermediate_tables(), ['daily_emails'])
+        self.assertEqual(hq.results_table_name, 'daily_emails_results')
+        # input read like the first step, output written like the last
+        self.assertEqual(hq.input_control_chars[0], ',')
+        self.assertEqual(hq.output_control_chars[0], '|')
+
+    def mismatched_columns_test(self):
+        pipeline = MismatchedPipeline(['-r', 'local', 'input.csv'])
+        self.assertRaises(InvalidHiveJobException, pipeline.hive_query)
+
+    def no_sweep_test(self):
+        pipeline = BusyDaysPipeline(['--sweep', 'threshold=1,2', 'input.csv'])
+        self.assertRaises(InvalidHiveJobException, pipeline.hive_query)
+
+
+class PipelineQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        pipeline = BusyDaysPipeline(['-r', 'local', 'input.csv'])
+        self.hq = pipeline.hive_query()
+
+    def needs_steps_test(self):
+        self.assertRaises(InvalidHiveJobException, PipelineQuery, [])
+
+    def has_every_query_attribute_test(self):
+        first = self.hq.steps[0]
+        self.assertEqual(set(vars(first)) - set(vars(self.hq)), set())
+        # the input is the first step's
+        self.assertEqual(self.hq.table_name, first.table_name)
+        self.assertEqual(self.hq.predicates, first.predicates)
+        self.assertEqual(self.hq.results_table_name,
+                         self.hq.steps[-1].results_table_name)
+
+    def emr_script_test(self):
+        os.environ['CSV_SERDE_JAR_S3'] = 's3://path/to/serde.jar'
+        script = self.hq.emr_hive_script('s3://b/data', 's3://b/out/',
+                                         's3://b/table/', 's3://b/scratch/')
+        lines = script.split('\n')
+        # only the first step's input is loaded
+        self.assertEqual(
+            [line for line in lines if line.startswith('LOAD DATA')],
+            ["LOAD DATA INPATH 's3://b/data' INTO TABLE emails;"])
+        # the intermediate table is managed, so it has no location
+        i = lines.index('CREATE TABLE daily_emails '
+                        '(`day` STRING, `total` bigint);')
+        self.assertEqual(lines[i + 1:i + 3], [
+            'INSERT INTO TABLE daily_emails',
+            'SELECT day, COUNT(*) FROM emails GROUP BY day;'])
+        self.assertEqual(lines[-3:], [
+            'INSERT INTO TABLE daily_emails_results',
+            'SELECT day FROM daily_emails WHERE total > 100;',
+            'DROP TABLE daily_emails;'])
+        self.assertEqual(
+            [line for line in lines if line.startswith('LOCATION')],
+            ["LOCATION 's3://b/table/';", "LOCATION 's3://b/out/';"])
+
+    def local_script_test(self):
+        script = self.hq.local_hive_script('/tmp/data', '/tmp/out',
+                                           '/tmp/table')
+        self.assertTrue('DROP TABLE IF EXISTS daily_emails;' in script)
+        self.assertTrue(
+            "LOAD DATA LOCAL INPATH '/tmp/data' INTO TABLE emails;" in script)
+
+    def spark_script_test(self):
+        script = self.hq.spark_script('/tmp/data', '/tmp/out')
+        self.assertTrue(
+            "spark.sql('SELECT day, COUNT(*) FROM emails GROUP BY day')"
+            ".createOrReplaceTempView('daily_emails')" in script)
+        self.assertTrue(
+            "results = spark.sql('SELECT day FROM daily_emails "
+            "WHERE total > 100')" in script)
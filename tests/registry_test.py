@@ -0,0 +1,281 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+import apiarist.s3
+import apiarist.registry
+from apiarist.registry import AttachedJobFailedError
+from apiarist.registry import LocalJobRegistry
+from apiarist.registry import S3JobRegistry
+from apiarist.registry import job_key
+from apiarist.registry import local_fingerprint
+from apiarist.runner import HiveJobRunner
+from fake_s3 import FakeBucket, FakeS3Connection
+
+
+class DedupingRunner(HiveJobRunner):
+
+    def __init__(self, registry, fail=False, **kwargs):
+        super(DedupingRunner, self).__init__(**kwargs)
+        self.registry = registry
+        self.fail = fail
+        self.calls = []
+
+    def _job_registry(self):
+        return self.registry
+
+    def stage(self):
+        self.calls.append('stage')
+
+    def execute(self):
+        self.calls.append('execute')
+        if self.fail:
+            raise ValueError('failed')
+
+    def attach(self, result):
+        self.calls.append(('attach', result['job_id']))
+
+
+class JobKeyTest(unittest.TestCase):
+
+    def same_job_same_key_test(self):
+        self.assertEqual(job_key('SELECT 1', 'a:1:2'),
+                         job_key(u'SELECT 1', u'a:1:2'))
+
+    def different_input_different_key_test(self):
+        self.assertNotEqual(job_key('SELECT 1', 'a:1:2'),
+                            job_key('SELECT 1', 'a:1:3'))
+
+    def local_fingerprint_test(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'input.csv')
+            with open(path, 'w') as f:
+                f.write('a,b\n')
+            before = local_fingerprint(path)
+            self.assertEqual(local_fingerprint(tmp), before)
+            with open(path, 'a') as f:
+                f.write('c,d\n')
+            self.assertNotEqual(local_fingerprint(path), before)
+        finally:
+            shutil.rmtree(tmp)
+
+
+class LocalJobRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.registry_dir = os.path.join(self.tmp, 'registry')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _registry(self):
+        return LocalJobRegistry(self.registry_dir, 'abc', poll_seconds=0)
+
+    def first_run_acquires_test(self):
+        r = self._registry()
+        self.assertEqual(r.acquire({'job_id': 'hj-1'}), None)
+        self.assertTrue(os.path.exists(r.marker_path))
+
+    def second_run_finds_first_test(self):
+        self._registry().acquire({'job_id': 'hj-1'})
+        owner = self._registry().acquire({'job_id': 'hj-2'})
+        self.assertEqual(owner['job_id'], 'hj-1')
+
+    def release_records_result_test(self):
+        r = self._registry()
+        r.acquire({'job_id': 'hj-1', 'output_dir': '/out'})
+        r.release('COMPLETED')
+        self.assertFalse(os.path.exists(r.marker_path))
+        with open(r.result_path) as f:
+            result = json.load(f)
+        self.assertEqual(result['status'], 'COMPLETED')
+        self.assertEqual(result['output_dir'], '/out')
+        # the next run goes ahead
+        self.assertEqual(self._registry().acquire({'job_id': 'hj-2'}), None)
+
+    def wait_returns_result_test(self):
+        first = self._registry()
+        first.acquire({'job_id': 'hj-1'})
+        owner = self._registry().acquire({'job_id': 'hj-2'})
+        first.release('COMPLETED')
+        result = self._registry().wait(owner)
+        self.assertEqual(result['job_id'], 'hj-1')
+
+    def wait_for_failed_run_test(self):
+        first = self._registry()
+        first.acquire({'job_id': 'hj-1'})
+        owner = self._registry().acquire({'job_id': 'hj-2'})
+        first.release('FAILED')
+        self.assertRaises(AttachedJobFailedError,
+                          self._registry().wait, owner)
+
+    def dead_process_marker_is_replaced_test(self):
+        r = self._registry()
+        r.acquire({'job_id': 'hj-1'})
+        with open(r.marker_path) as f:
+            marker = json.load(f)
+        # a process which can't exist
+        marker['pid'] = 2 ** 22 + 1
+        with open(r.marker_path, 'w') as f:
+            json.dump(marker, f)
+        self.assertEqual(self._registry().acquire({'job_id': 'hj-2'}), None)
+
+    def marker_being_written_is_read_again_test(self):
+        r = self._registry()
+        # created, but not written yet
+        open(r.marker_path, 'w').close()
+        record = {'job_id': 'hj-1', 'started': time.time(),
+                  'host': socket.gethostname(), 'pid': os.getpid()}
+
+        def write():
+            with open(r.marker_path, 'w') as f:
+                json.dump(record, f)
+        writer = threading.Timer(0.05, write)
+        writer.start()
+        try:
+            registry = LocalJobRegistry(self.registry_dir, 'abc',
+                                        poll_seconds=0.01)
+            owner = registry.acquire({'job_id': 'hj-2'})
+        finally:
+            writer.join()
+        self.assertEqual(owner['job_id'], 'hj-1')
+
+    def old_marker_is_replaced_test(self):
+        r = self._registry()
+        r.acquire({'job_id': 'hj-1'})
+        with open(r.marker_path) as f:
+            marker = json.load(f)
+        marker['host'] = 'elsewhere'
+        marker['started'] = (time.time() -
+                             apiarist.registry.STALE_MARKER_SECONDS - 1)
+        with open(r.marker_path, 'w') as f:
+            json.dump(marker, f)
+        self.assertEqual(self._registry().acquire({'job_id': 'hj-2'}), None)
+
+
+class S3JobRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self._get_conn = apiarist.s3.get_conn
+        self.bucket = FakeBucket()
+        apiarist.s3.get_conn = lambda *args: FakeS3Connection(self.bucket)
+
+    def tearDown(self):
+        apiarist.s3.get_conn = self._get_conn
+
+    def _registry(self):
+        return S3JobRegistry('s3://bucket/scratch/registry/', 'abc',
+                             poll_seconds=0)
+
+    def marker_location_test(self):
+        r = self._registry()
+        r.acquire({'job_id': 'hj-1'})
+        self.assertEqual(list(self.bucket.objects),
+                         ['scratch/registry/abc.running'])
+
+    def conditional_put_test(self):
+        self.assertEqual(self._registry().acquire({'job_id': 'hj-1'}), None)
+        owner = self._registry().acquire({'job_id': 'hj-2'})
+        self.assertEqual(owner['job_id'], 'hj-1')
+
+    def wait_returns_result_test(self):
+        first = self._registry()
+        first.acquire({'job_id': 'hj-1', 'output_path': 's3://out/'})
+        owner = self._registry().acquire({'job_id': 'hj-2'})
+        first.release('COMPLETED')
+        result = self._registry().wait(owner)
+        self.assertEqual(result['output_path'], 's3://out/')
+        self.assertEqual(list(self.bucket.objects),
+                         ['scratch/registry/abc.result'])
+
+
+class DedupingRunnerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _registry(self):
+        return LocalJobRegistry(self.tmp, 'abc', poll_seconds=0)
+
+    def first_run_runs_test(self):
+        r = DedupingRunner(self._registry(), job_name='TestJob')
+        r.run()
+        self.assertEqual(r.calls, ['stage', 'execute'])
+        self.assertEqual(self._registry()._read_result()['status'],
+                         'COMPLETED')
+
+    def failed_run_is_recorded_test(self):
+        r = DedupingRunner(self._registry(), fail=True, job_name='TestJob')
+        self.assertRaises(ValueError, r.run)
+        self.assertEqual(self._registry()._read_result()['status'],
+                         'FAILED')
+        self.assertEqual(self._registry()._read_marker(), None)
+
+    def identical_run_attaches_test(self):
+        first = self._registry()
+        first.acquire({'job_id': 'hj-1'})
+        second = self._registry()
+        wait = second.wait
+
+        def finish_first_and_wait(owner):
+            first.release('COMPLETED')
+            return wait(owner)
+        second.wait = finish_first_and_wait
+        r = DedupingRunner(second, job_name='TestJob')
+        r.run()
+        self.assertEqual(r.calls, [('attach', 'hj-1')])
+        self.assertEqual(r.metrics['deduplicated_into'], 'hj-1')
+
+
+class LocalRunnerDedupeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp() + '/'
+        self.input_path = self.tmp + 'input.csv'
+        with open(self.input_path, 'w') as f:
+            f.write('mon,1\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _runner(self, **kwargs):
+        from script_test import DummyJob
+        from apiarist.script import HiveQuery
+        from apiarist.local import LocalRunner
+        hq = HiveQuery(DummyJob(
+            'SELECT day FROM emails', 'emails',
+            [('day', 'STRING'), ('sent', 'INT')], [('day', 'STRING')]))
+        return LocalRunner('TestJob', input_path=self.input_path,
+                           hive_query=hq, temp_dir=self.tmp, dedupe=True,
+                           **kwargs)
+
+    def no_registry_without_dedupe_test(self):
+        r = self._runner()
+        r.dedupe = False
+        self.assertEqual(r._job_registry(), None)
+
+    def identical_runs_share_a_key_test(self):
+        self.assertEqual(self._runner()._job_registry().key,
+                         self._runner()._job_registry().key)
+
+    def shared_output_is_kept_in_registry_test(self):
+        r = self._runner()
+        registry = r._job_registry()
+        self.assertEqual(r.output_dir, os.path.join(
+            self.tmp, 'registry', registry.key + '.output'))
+
+    def given_output_dir_is_used_test(self):
+        r = self._runner(output_dir=self.tmp + 'out')
+        r._job_registry()
+        self.assertEqual(r.output_dir, self.tmp + 'out/' + r.job_id)
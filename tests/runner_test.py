@@ -0,0 +1,129 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import sys
+import subprocess
+import unittest
+import apiarist.runner
+from apiarist.runner import HiveJobRunner
+from apiarist.runner import get_runner_class
+from apiarist.runner import runner_names
+from apiarist.runner import UnknownRunnerError
+
+# seconds allowed for `import apiarist.job`, measured in a fresh interpreter
+IMPORT_TIME_BUDGET = 0.2
+
+IMPORT_SCRIPT = """
+import sys, time
+start = time.time()
+import apiarist.job
+elapsed = time.time() - start
+print(elapsed)
+print(sorted(m for m in sys.modules if m == 'boto' or m.startswith('boto.')))
+"""
+
+
+class RecordingRunner(HiveJobRunner):
+
+    def __init__(self, **kwargs):
+        super(RecordingRunner, self).__init__(**kwargs)
+        self.calls = []
+
+    def stage(self):
+        self.calls.append('stage')
+
+    def execute(self):
+        self.calls.append('execute')
+
+    def fetch(self):
+        self.calls.append('fetch')
+
+    def cleanup(self):
+        self.calls.append('cleanup')
+
+
+class FakeEntryPoint(object):
+    name = 'recording'
+
+    def load(self):
+        return RecordingRunner
+
+
+class RunnerRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self._entry_point_runners = apiarist.runner._entry_point_runners
+
+    def tearDown(self):
+        apiarist.runner._entry_point_runners = self._entry_point_runners
+
+    def runner_names_test(self):
+        self.assertEqual(runner_names(),
+                         ['emr', 'local', 'spark', 'spark-emr'])
+
+    def get_local_runner_class_test(self):
+        from apiarist.local import LocalRunner
+        self.assertEqual(get_runner_class('local'), LocalRunner)
+
+    def get_emr_runner_class_test(self):
+        from apiarist.emr import EMRRunner
+        self.assertEqual(get_runner_class('emr'), EMRRunner)
+
+    def get_spark_runner_classes_test(self):
+        from apiarist.spark import SparkLocalRunner
+        from apiarist.emr import SparkEMRRunner
+        self.assertEqual(get_runner_class('spark'), SparkLocalRunner)
+        self.assertEqual(get_runner_class('spark-emr'), SparkEMRRunner)
+
+    def unknown_runner_error_test(self):
+        self.assertRaises(UnknownRunnerError, get_runner_class, 'foo')
+
+    def entry_point_runner_test(self):
+        apiarist.runner._entry_point_runners = lambda: {
+            'recording': FakeEntryPoint()}
+        self.assertTrue('recording' in runner_names())
+        self.assertEqual(get_runner_class('recording'), RecordingRunner)
+
+
+class HiveJobRunnerTest(unittest.TestCase):
+
+    def has_a_job_id_test(self):
+        r = HiveJobRunner(job_name='TestJob')
+        self.assertEqual(r.job_name, 'TestJob')
+        self.assertEqual(r.job_id[:3], 'hj-')
+
+    def hooks_must_be_implemented_test(self):
+        r = HiveJobRunner(job_name='TestJob')
+        self.assertRaises(NotImplementedError, r.stage)
+        self.assertRaises(NotImplementedError, r.execute)
+
+    def run_calls_hooks_in_order_test(self):
+        with RecordingRunner(job_name='TestJob') as r:
+            r.run()
+        self.assertEqual(r.calls, ['stage', 'execute', 'fetch', 'cleanup'])
+
+    def phase_timings_test(self):
+        r = RecordingRunner(job_name='TestJob')
+        r.run()
+        self.assertEqual(sorted(r.metrics['phase_seconds']),
+                         ['execute', 'fetch', 'stage'])
+
+    def no_extra_options_test(self):
+        self.assertEqual(HiveJobRunner.options_to_kwargs(None), {})
+
+
+class ImportTimeTest(unittest.TestCase):
+
+    def setUp(self):
+        out = subprocess.check_output([sys.executable, '-c', IMPORT_SCRIPT])
+        lines = out.decode('utf-8').splitlines()
+        self.elapsed = float(lines[0])
+        self.boto_modules = lines[1]
+
+    def job_import_does_not_load_boto_test(self):
+        self.assertEqual(self.boto_modules, '[]')
+
+    def job_import_time_budget_test(self):
+        msg = "importing apiarist.job took {0:.3f}s (budget {1}s)".format(
+            self.elapsed, IMPORT_TIME_BUDGET)
+        self.assertTrue(self.elapsed < IMPORT_TIME_BUDGET, msg)
@@ -2,9 +2,14 @@
 # -*- coding: utf-8 -*-
 
 import unittest
+import apiarist.s3
+from apiarist.s3 import delete_keys
+from apiarist.s3 import delete_prefix
+from apiarist.s3 import list_prefixes
 from apiarist.s3 import parse_s3_uri
 from apiarist.s3 import obj_type
 from apiarist.s3 import is_dir
+from fake_s3 import FakeBucket, FakeS3Connection
 
 
 class SerdeTest(unittest.TestCase):
@@ -26,3 +31,39 @@ class SerdeTest(unittest.TestCase):
         self.assertFalse(is_dir(s))
         s = 's3://foo/bar/baz/'
         self.assertTrue(is_dir(s))
+
+
+class S3DeleteTest(unittest.TestCase):
+
+    def setUp(self):
+        self._get_conn = apiarist.s3.get_conn
+        self.bucket = FakeBucket(dict.fromkeys(
+            ['scratch/hj-1/script.hql', 'scratch/hj-1/output/000000_0',
+             'scratch/hj-1/data/0', 'scratch/hj-2/data/0', 'other'], b'x'))
+        apiarist.s3.get_conn = lambda *args: FakeS3Connection(self.bucket)
+
+    def tearDown(self):
+        apiarist.s3.get_conn = self._get_conn
+
+    def list_prefixes_test(self):
+        self.assertEqual(list_prefixes('s3://b/scratch/'),
+                         ['s3://b/scratch/hj-1/', 's3://b/scratch/hj-2/'])
+
+    def delete_prefix_test(self):
+        deleted = delete_prefix('s3://b/scratch/hj-1/',
+                                keep=['s3://b/scratch/hj-1/output/'])
+        self.assertEqual(deleted, 2)
+        self.assertEqual(sorted(self.bucket.objects),
+                         ['other', 'scratch/hj-1/output/000000_0',
+                          'scratch/hj-2/data/0'])
+
+    def delete_keys_in_batches_test(self):
+        names = ['k{0}'.format(i) for i in range(2500)]
+        self.bucket.objects.update(dict.fromkeys(names, b'x'))
+        self.assertEqual(delete_keys('b', names), 2500)
+        self.assertEqual(sorted(self.bucket.delete_batches), [500, 1000, 1000])
+        self.assertFalse('k0' in self.bucket.objects)
+
+    def no_keys_test(self):
+        self.assertEqual(delete_keys('b', []), 0)
+        self.assertEqual(self.bucket.delete_batches, [])
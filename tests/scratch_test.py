@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+from apiarist.scratch import dir_usage
+from apiarist.scratch import enforce_quota
+from apiarist.scratch import mark_active
+from apiarist.scratch import is_active
+from apiarist.scratch import parse_size
+from apiarist.scratch import remove_dir
+
+
+class ScratchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _job_dir(self, char, size, mtime):
+        path = os.path.join(self.root, 'hj-' + char * 32)
+        os.makedirs(path)
+        data = os.path.join(path, 'data')
+        with open(data, 'w') as f:
+            f.write('x' * size)
+        for p in (data, path):
+            os.utime(p, (mtime, mtime))
+        return path
+
+    def parse_size_test(self):
+        self.assertEqual(parse_size('100'), 100)
+        self.assertEqual(parse_size('2K'), 2048)
+        self.assertEqual(parse_size('1.5g'), 1610612736)
+        self.assertEqual(parse_size('20GB'), 20 * 1024 ** 3)
+        self.assertEqual(parse_size(None), None)
+        self.assertRaises(ValueError, parse_size, 'lots')
+
+    def dir_usage_test(self):
+        path = self._job_dir('a', 10, 1000)
+        self.assertEqual(dir_usage(path), (10, 1000))
+
+    def remove_in_background_test(self):
+        path = self._job_dir('a', 10, 1000)
+        thread = remove_dir(path + '/', background=True)
+        # the name is free straight away
+        self.assertFalse(os.path.exists(path))
+        thread.join()
+        self.assertEqual(os.listdir(self.root), [])
+
+    def remove_missing_dir_test(self):
+        self.assertEqual(remove_dir(self.root + '/nothing', True), None)
+
+    def oldest_dirs_are_evicted_test(self):
+        old = self._job_dir('a', 10, 1000)
+        middle = self._job_dir('b', 10, 2000)
+        new = self._job_dir('c', 10, 3000)
+        self.assertEqual(enforce_quota(self.root, 15), [old, middle])
+        self.assertTrue(os.path.exists(new))
+
+    def under_quota_test(self):
+        self._job_dir('a', 10, 1000)
+        self.assertEqual(enforce_quota(self.root, 10), [])
+
+    def active_dirs_are_kept_test(self):
+        old = self._job_dir('a', 10, 1000)
+        new = self._job_dir('b', 10, 2000)
+        mark_active(old)
+        os.utime(old, (1000, 1000))
+        self.assertTrue(is_active(old))
+        self.assertEqual(enforce_quota(self.root, 15), [new])
+
+    def dead_run_is_not_active_test(self):
+        path = self._job_dir('a', 10, 1000)
+        with open(os.path.join(path, '.active'), 'w') as f:
+            f.write(str(2 ** 22 + 1))
+        self.assertFalse(is_active(path))
+
+    def other_files_are_left_alone_test(self):
+        os.makedirs(os.path.join(self.root, 'registry'))
+        with open(os.path.join(self.root, 'history.db'), 'w') as f:
+            f.write('x' * 100)
+        self.assertEqual(enforce_quota(self.root, 0), [])
+        self.assertEqual(sorted(os.listdir(self.root)),
+                         ['history.db', 'registry'])
+
+    def leftover_trash_is_removed_test(self):
+        os.makedirs(os.path.join(self.root, 'hj-1.deleting'))
+        enforce_quota(self.root, 0)
+        self.assertEqual(os.listdir(self.root), [])
+
+    def cached_tables_are_evicted_test(self):
+        table = os.path.join(self.root, 'tables', 'd' * 32)
+        os.makedirs(table)
+        with open(os.path.join(table, 'data'), 'w') as f:
+            f.write('x' * 10)
+        os.utime(table, (1000, 1000))
+        os.utime(os.path.join(table, 'data'), (1000, 1000))
+        new = self._job_dir('a', 10, 2000)
+        self.assertEqual(enforce_quota(self.root, 10), [table])
+        self.assertTrue(os.path.exists(new))
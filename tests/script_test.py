@@ -4,6 +4,7 @@
 import os
 import unittest
 from apiarist.script import HiveQuery
+from apiarist.script import SweepQuery
 from apiarist.job import HiveJob
 from apiarist import InvalidHiveJobException
 from apiarist.serde import Serde
@@ -75,6 +76,8 @@ class HiveQueryTest(unittest.TestCase):
         os.environ['S3_SCRATCH_URI'] = 's3://foo/bar/baz/'
         s = "ADD JAR {};\n".format(serde)
         s += "SET hive.exec.compress.output=false;\n"
+        s += "DROP TABLE IF EXISTS some_table;\n"
+        s += "DROP TABLE IF EXISTS some_table_results;\n"
         s += "CREATE EXTERNAL TABLE some_table (`foo` STRING, `bar` STRING)\n"
         s += "ROW FORMAT serde 'com.bizo.hive.serde.csv.CSVSerde'\n"
         s += "WITH serdeproperties (\n"
@@ -128,6 +131,39 @@ class HiveQueryTest(unittest.TestCase):
                                                       output_dir,
                                                       temp_table_dir))
 
+    def local_hive_script_without_load_test(self):
+        script = self.hq.local_hive_script('/tmp/data', '/tmp/out',
+                                           '/tmp/table', load_data=False)
+        self.assertFalse('LOAD DATA' in script)
+        self.assertTrue("LOCATION '/tmp/table';" in script)
+        self.assertTrue(script.endswith(
+            "SELECT foo, bar FROM some_table WHERE zero = 0;"))
+
+    def spark_script_test(self):
+        s = "from pyspark.sql import SparkSession\n"
+        s += "spark = SparkSession.builder.appName('some_table')"
+        s += ".getOrCreate()\n"
+        s += "spark.read.csv('/tmp/data', "
+        s += "schema='`foo` STRING, `bar` STRING', "
+        s += "sep=',', quote='\"', escape='\\\\')"
+        s += ".createOrReplaceTempView('some_table')\n"
+        s += "results = spark.sql("
+        s += "'SELECT foo, bar FROM some_table WHERE zero = 0')\n"
+        s += "results.toDF(*['foo', 'bar']).write.csv('/tmp/out', "
+        s += "mode='append', sep=',', quote='\"', escape='\\\\', "
+        s += "quoteAll=True)\n"
+        s += "spark.stop()\n"
+        self.assertEqual(s, self.hq.spark_script('/tmp/data', '/tmp/out'))
+
+    def spark_script_control_chars_test(self):
+        job = DummyJob("SELECT foo FROM some_table", 'some_table',
+                       [('foo', 'STRING')], [('foo', 'STRING')])
+        job.INFILE_DELIMITER_CHAR = r'\t'
+        job.OUTFILE_QUOTE_CHAR = r"\'"
+        script = HiveQuery(job).spark_script('/tmp/data', '/tmp/out')
+        self.assertTrue("sep='\\t'" in script)
+        self.assertTrue('quote="\'"' in script)
+
     def column_ddl_test(self):
         cols = [('foo', 'INT'), ('bar', 'STRING')]
         ddl = "`foo` INT, `bar` STRING"
@@ -167,3 +203,214 @@ class HiveQueryTest(unittest.TestCase):
         print(ddl)
         print(tbl)
         self.assertEqual(tbl, ddl)
+
+
+class MultiOutputJob(DummyJob):
+
+    def __init__(self, outputs):
+        super(MultiOutputJob, self).__init__(
+            tn='emails', ic=[('day', 'STRING'), ('address', 'STRING')])
+        self._outputs = outputs
+
+    def outputs(self):
+        return self._outputs
+
+
+class MultiOutputQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.hq = HiveQuery(MultiOutputJob([
+            ('daily', [('day', 'STRING'), ('total', 'BIGINT')],
+             """SELECT day, COUNT(*)
+                GROUP BY day"""),
+            ('addresses', [('address', 'STRING')],
+             "SELECT DISTINCT address;"),
+            ]))
+
+    def multi_insert_query_test(self):
+        self.assertEqual(self.hq.query, "\n".join([
+            "FROM emails",
+            "INSERT INTO TABLE emails_daily SELECT day, COUNT(*) GROUP BY day",
+            "INSERT INTO TABLE emails_addresses SELECT DISTINCT address;"]))
+
+    def output_location_test(self):
+        self.assertEqual(self.hq.output_location('s3://b/out/', 'daily'),
+                         's3://b/out/daily/')
+        self.assertEqual(self.hq.output_location('/tmp/out', 'daily'),
+                         '/tmp/out/daily/')
+
+    def emr_hive_script_test(self):
+        os.environ["CSV_SERDE_JAR_S3"] = 's3://path/to/serde.jar'
+        lines = self.hq.emr_hive_script('s3://b/data', 's3://b/out/',
+                                        's3://b/table/').split('\n')
+        self.assertTrue('CREATE EXTERNAL TABLE emails_daily '
+                        '(`day` STRING, `total` BIGINT)' in lines)
+        self.assertTrue('CREATE EXTERNAL TABLE emails_addresses '
+                        '(`address` STRING)' in lines)
+        self.assertEqual(
+            [line for line in lines if line.startswith('LOCATION')],
+            ["LOCATION 's3://b/table/';", "LOCATION 's3://b/out/daily/';",
+             "LOCATION 's3://b/out/addresses/';"])
+        # the input is scanned once
+        self.assertEqual(lines.count('FROM emails'), 1)
+        self.assertEqual(lines[-1],
+                         'INSERT INTO TABLE emails_addresses '
+                         'SELECT DISTINCT address;')
+
+    def local_hive_script_drops_output_tables_test(self):
+        script = self.hq.local_hive_script('/tmp/data', '/tmp/out',
+                                           '/tmp/table')
+        self.assertTrue('DROP TABLE emails_daily;\n'
+                        'DROP TABLE emails_addresses;' in script)
+
+    def invalid_output_name_test(self):
+        self.assertRaises(InvalidHiveJobException, HiveQuery,
+                          MultiOutputJob([('daily totals', [], 'SELECT 1')]))
+
+    def duplicate_output_name_test(self):
+        self.assertRaises(InvalidHiveJobException, HiveQuery,
+                          MultiOutputJob([('daily', [], 'SELECT 1'),
+                                          ('daily', [], 'SELECT 2')]))
+
+    def spark_not_supported_test(self):
+        self.assertRaises(InvalidHiveJobException, self.hq.spark_script,
+                          '/tmp/data', '/tmp/out')
+
+
+class SweepJob(DummyJob):
+
+    def __init__(self):
+        super(SweepJob, self).__init__(
+            tn='emails', ic=[('day', 'STRING')], oc=[('total', 'BIGINT')])
+        self.options = Options(day='mon')
+
+    def query(self):
+        return "SELECT COUNT(*) FROM emails WHERE day = '{0}'".format(
+            self.options.day)
+
+
+class Options(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class SweepQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.hq = SweepQuery(SweepJob(), [[('day', 'mon')], [('day', 'tue')]])
+
+    def sweep_tag_test(self):
+        self.assertEqual(SweepQuery.sweep_tag([('day', 'mon'), ('n', 2)]),
+                         'day=mon/n=2')
+
+    def output_names_test(self):
+        self.assertEqual(self.hq.output_names(), ['day=mon', 'day=tue'])
+
+    def emr_hive_script_test(self):
+        os.environ["CSV_SERDE_JAR_S3"] = 's3://path/to/serde.jar'
+        lines = self.hq.emr_hive_script('s3://b/data', 's3://b/out/',
+                                        's3://b/table/').split('\n')
+        # the input is loaded once
+        self.assertEqual(
+            len([line for line in lines if line.startswith('LOAD DATA')]), 1)
+        self.assertEqual(
+            [line for line in lines if line.startswith('LOCATION')],
+            ["LOCATION 's3://b/table/';", "LOCATION 's3://b/out/day=mon/';",
+             "LOCATION 's3://b/out/day=tue/';"])
+        self.assertEqual(lines[-4:], [
+            "INSERT INTO TABLE emails_results_0",
+            "SELECT COUNT(*) FROM emails WHERE day = 'mon';",
+            "INSERT INTO TABLE emails_results_1",
+            "SELECT COUNT(*) FROM emails WHERE day = 'tue';"])
+
+    def spark_script_test(self):
+        script = self.hq.spark_script('/tmp/data', '/tmp/out')
+        self.assertTrue("results = spark.sql(\"SELECT COUNT(*) FROM emails "
+                        "WHERE day = 'tue'\")\n"
+                        "results.toDF(*['total']).write.csv("
+                        "'/tmp/out/day=tue/'" in script)
+
+    def not_with_several_outputs_test(self):
+        job = MultiOutputJob([('daily', [], 'SELECT 1')])
+        job.options = Options(day='mon')
+        self.assertRaises(InvalidHiveJobException, SweepQuery, job,
+                          [[('day', 'tue')]])
+
+
+class ColumnPruningTest(unittest.TestCase):
+
+    COLUMNS = [('day', 'STRING'), ('address', 'STRING'), ('sent', 'INT'),
+               ('Opened', 'INT')]
+
+    def _query(self, q):
+        return HiveQuery(DummyJob(q, 'emails', self.COLUMNS,
+                                  [('day', 'STRING'), ('n', 'INT')]))
+
+    def referenced_columns_test(self):
+        hq = self._query("SELECT day, SUM(`opened`) FROM emails "
+                         "WHERE address != 'sent' GROUP BY day")
+        # 'sent' is only a string here
+        self.assertEqual(hq.referenced_columns(),
+                         [('day', 'STRING'), ('address', 'STRING'),
+                          ('Opened', 'INT')])
+
+    def select_all_uses_every_column_test(self):
+        hq = self._query("SELECT e.* FROM emails e")
+        self.assertEqual(hq.referenced_columns(), self.COLUMNS)
+        self.assertEqual(hq.prune_input_columns(), None)
+
+    def count_star_test(self):
+        hq = self._query("SELECT day, COUNT(*) FROM emails GROUP BY day")
+        self.assertEqual(hq.prune_input_columns(), [('day', 'STRING')])
+
+    def local_script_test(self):
+        hq = self._query("SELECT day, COUNT(*) FROM emails GROUP BY day")
+        hq.prune_input_columns()
+        script = hq.local_hive_script('/tmp/data', '/tmp/out', '/tmp/table')
+        self.assertTrue("CREATE EXTERNAL TABLE emails (`day` STRING)"
+                        in script)
+
+    def emr_script_test(self):
+        os.environ["CSV_SERDE_JAR_S3"] = 's3://path/to/serde.jar'
+        hq = self._query("SELECT day, COUNT(*) FROM emails GROUP BY day")
+        hq.prune_input_columns()
+        lines = hq.emr_hive_script('s3://b/data', 's3://b/out/',
+                                   's3://b/table/').split('\n')
+        self.assertTrue("CREATE EXTERNAL TABLE emails_source (`day` STRING, "
+                        "`address` STRING, `sent` INT, `Opened` INT)"
+                        in lines)
+        self.assertTrue("LOAD DATA INPATH 's3://b/data' "
+                        "INTO TABLE emails_source;" in lines)
+        self.assertTrue("CREATE TABLE emails AS SELECT `day` "
+                        "FROM emails_source;" in lines)
+        # the copy is dropped once the results are in
+        self.assertEqual(lines[-1], "DROP TABLE emails;")
+
+
+class PredicateJob(DummyJob):
+
+    def __init__(self, predicates):
+        super(PredicateJob, self).__init__(
+            'SELECT day FROM emails', 'emails', [('day', 'STRING')],
+            [('day', 'STRING')])
+        self._predicates = predicates
+
+    def predicates(self):
+        return self._predicates
+
+
+class PredicatesTest(unittest.TestCase):
+
+    def predicates_test(self):
+        hq = HiveQuery(PredicateJob([('day', '>=', '2014-01-01')]))
+        self.assertEqual(hq.predicates, [('day', '>=', '2014-01-01')])
+        self.assertEqual(HiveQuery(PredicateJob(None)).predicates, [])
+
+    def unknown_column_test(self):
+        self.assertRaises(InvalidHiveJobException, HiveQuery,
+                          PredicateJob([('month', '=', '2014-01')]))
+
+    def unknown_operator_test(self):
+        self.assertRaises(InvalidHiveJobException, HiveQuery,
+                          PredicateJob([('day', 'like', '2014%')]))
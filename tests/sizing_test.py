@@ -0,0 +1,81 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import unittest
+from apiarist.sizing import SizingError
+from apiarist.sizing import DEFAULT_BYTES_PER_CORE_SECOND
+from apiarist.sizing import estimate_size
+from apiarist.sizing import job_throughput
+from apiarist.sizing import worker_cores
+
+GB = 10 ** 9
+
+
+def run(input_bytes=GB, query_seconds=100.0, num_instances=3,
+        slave_instance_type='m3.xlarge'):
+    return {'input_bytes': input_bytes, 'query_seconds': query_seconds,
+            'num_instances': num_instances,
+            'slave_instance_type': slave_instance_type}
+
+
+class SizingTest(unittest.TestCase):
+
+    def worker_cores_test(self):
+        self.assertEqual(worker_cores('m3.xlarge', 3), 8)
+        # a single instance does the work itself
+        self.assertEqual(worker_cores('m3.xlarge', 1), 4)
+
+    def job_throughput_test(self):
+        # 1GB in 100 seconds on 8 cores
+        self.assertEqual(job_throughput([run()]), GB / 800.0)
+        self.assertEqual(job_throughput([run(), run(query_seconds=300.0),
+                                         run(query_seconds=50.0)]),
+                         GB / 800.0)
+
+    def unusable_runs_test(self):
+        self.assertEqual(job_throughput([run(input_bytes=None),
+                                         run(slave_instance_type='x1.big')]),
+                         None)
+
+    def execute_phase_is_not_used_test(self):
+        # runs recorded before query_seconds include cluster startup
+        old = run(query_seconds=None)
+        old['execute_seconds'] = 100.0
+        self.assertEqual(job_throughput([old]), None)
+
+    def size_from_history_test(self):
+        # 8GB in 100 seconds needs 64 cores => 16 m3.xlarge workers
+        size = estimate_size(8 * GB, [run()], ['m3.xlarge'], 100)
+        self.assertEqual(size.instance_type, 'm3.xlarge')
+        self.assertEqual(size.num_instances, 17)
+        self.assertEqual(size.predicted_seconds, 100.0)
+        self.assertEqual(size.runs_used, 1)
+
+    def bigger_instance_type_when_too_many_test(self):
+        size = estimate_size(8 * GB, [run()], ['m3.xlarge', 'm4.4xlarge'],
+                             100, max_instances=10)
+        self.assertEqual(size.instance_type, 'm4.4xlarge')
+        self.assertEqual(size.num_instances, 5)
+
+    def max_instances_test(self):
+        size = estimate_size(8 * GB, [run()], ['m3.xlarge'], 100,
+                             max_instances=5)
+        self.assertEqual(size.num_instances, 5)
+        self.assertEqual(size.predicted_seconds, 400.0)
+
+    def min_instances_test(self):
+        size = estimate_size(GB, [run()], ['m3.xlarge'], 3600,
+                             min_instances=3)
+        self.assertEqual(size.num_instances, 3)
+
+    def no_history_test(self):
+        size = estimate_size(DEFAULT_BYTES_PER_CORE_SECOND * 4 * 60, [],
+                             ['m3.xlarge'], 60)
+        self.assertEqual(size.num_instances, 2)
+        self.assertEqual(size.runs_used, 0)
+
+    def unknown_instance_type_test(self):
+        self.assertRaises(SizingError, estimate_size, GB, [], ['x1.big'], 60)
+
+    def bad_bounds_test(self):
+        self.assertRaises(SizingError, estimate_size, GB, [], ['m3.xlarge'],
+                          60, min_instances=5, max_instances=2)
@@ -0,0 +1,41 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import unittest
+import os
+from apiarist.spark import SparkLocalRunner
+
+
+class SparkLocalTest(unittest.TestCase):
+
+    def setUp(self):
+        if 'APIARIST_TMP_DIR' in os.environ:
+            del os.environ['APIARIST_TMP_DIR']
+
+    def has_a_job_name_test(self):
+        r = SparkLocalRunner('TestJob', input_path='/foo/bar')
+        self.assertEqual(r.job_name, 'TestJob')
+
+    def reads_input_in_place_test(self):
+        r = SparkLocalRunner('TestJob', input_path='/foo/bar')
+        self.assertEqual(r.input_path, '/foo/bar')
+
+    def script_is_python_test(self):
+        r = SparkLocalRunner('TestJob', input_path='/foo/bar',
+                             temp_dir='/bar/baz/')
+        self.assertEqual(r.local_script_file,
+                         '/bar/baz/' + r.job_id + '/' + r.job_id + '.py')
+
+    def spark_submit_test(self):
+        r = SparkLocalRunner('TestJob', input_path='/foo/bar')
+        self.assertEqual(r.spark_submit, 'spark-submit')
+        r = SparkLocalRunner('TestJob', input_path='/foo/bar',
+                             spark_submit='/opt/spark/bin/spark-submit')
+        self.assertEqual(r.spark_submit, '/opt/spark/bin/spark-submit')
+
+    def failed_run_raises_test(self):
+        import subprocess
+        r = SparkLocalRunner('TestJob', input_path='/foo/bar',
+                             spark_submit='false')
+        with self.assertRaises(subprocess.CalledProcessError) as e:
+            r.execute()
+        self.assertEqual(e.exception.returncode, 1)
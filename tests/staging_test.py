@@ -0,0 +1,146 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+import apiarist.staging
+from apiarist.staging import stage_csv
+from apiarist.staging import byte_ranges
+from apiarist.staging import RowFilter
+
+CHARS = (r',', r'\"', r'\\')
+
+
+class StageCsvTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.dir, 'source')
+        self.dest = os.path.join(self.dir, 'dest')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _project(self, text, indexes, chars=CHARS):
+        with open(self.source, 'w') as f:
+            f.write(text)
+        rows = stage_csv(self.source, self.dest, chars, indexes=indexes)
+        with open(self.dest) as f:
+            return rows, f.read()
+
+    def keeps_selected_fields_test(self):
+        rows, text = self._project('a,b,c\nd,e,f\n', [0, 2])
+        self.assertEqual(rows, 2)
+        self.assertEqual(text, '"a","c"\n"d","f"\n')
+
+    def quoting_and_escapes_kept_test(self):
+        rows, text = self._project('"x, y",b,"say \\"hi\\""\n', [0, 2])
+        self.assertEqual(text, '"x, y","say \\"hi\\""\n')
+
+    def other_delimiter_test(self):
+        rows, text = self._project('a\tb\tc\n', [1], (r'\t', r'\"', r'\\'))
+        self.assertEqual(text, '"b"\n')
+
+    def short_rows_and_blank_lines_test(self):
+        rows, text = self._project('a\n\nb,c\n', [1])
+        self.assertEqual(rows, 2)
+        self.assertEqual(text, '""\n"c"\n')
+
+    def filtered_rows_test(self):
+        with open(self.source, 'w') as f:
+            f.write('2014-01-01,AU,3\n2014-02-01,NZ,5\n2014-03-01,AU,\n')
+        row_filter = RowFilter([('day', '>=', '2014-01-15'),
+                                ('sent', '>', 2)],
+                               [('day', 'STRING'), ('country', 'STRING'),
+                                ('sent', 'INT')])
+        rows = stage_csv(self.source, self.dest, CHARS, indexes=[1],
+                         row_filter=row_filter)
+        self.assertEqual(rows, 1)
+        with open(self.dest) as f:
+            self.assertEqual(f.read(), '"NZ"\n')
+
+    def parallel_test(self):
+        lines = ['{0},{1}\n'.format(i, i % 3) for i in range(1000)]
+        with open(self.source, 'w') as f:
+            f.writelines(lines)
+        min_bytes = apiarist.staging.PARALLEL_MIN_BYTES
+        apiarist.staging.PARALLEL_MIN_BYTES = 0
+        try:
+            rows = stage_csv(self.source, self.dest, CHARS,
+                             row_filter=RowFilter([('n', '=', 0)],
+                                                  [('i', 'INT'),
+                                                   ('n', 'INT')]),
+                             processes=3)
+        finally:
+            apiarist.staging.PARALLEL_MIN_BYTES = min_bytes
+        expected = ['"{0}","0"\n'.format(i) for i in range(0, 1000, 3)]
+        self.assertEqual(rows, len(expected))
+        with open(self.dest) as f:
+            self.assertEqual(f.readlines(), expected)
+        # the parts are removed
+        self.assertEqual(sorted(os.listdir(self.dir)), ['dest', 'source'])
+
+    def parallel_in_a_thread_test(self):
+        import threading
+        lines = ['{0},{1}\n'.format(i, i % 3) for i in range(1000)]
+        with open(self.source, 'w') as f:
+            f.writelines(lines)
+        min_bytes = apiarist.staging.PARALLEL_MIN_BYTES
+        apiarist.staging.PARALLEL_MIN_BYTES = 0
+        pool = apiarist.staging.multiprocessing.Pool
+
+        def no_fork(*args):
+            raise AssertionError("forked with other threads running")
+        apiarist.staging.multiprocessing.Pool = no_fork
+        result = []
+        try:
+            thread = threading.Thread(target=lambda: result.append(
+                stage_csv(self.source, self.dest, CHARS, processes=3)))
+            thread.start()
+            thread.join()
+        finally:
+            apiarist.staging.PARALLEL_MIN_BYTES = min_bytes
+            apiarist.staging.multiprocessing.Pool = pool
+        self.assertEqual(result, [1000])
+        with open(self.dest) as f:
+            self.assertEqual(f.readlines(),
+                             ['"{0}","{1}"\n'.format(i, i % 3)
+                              for i in range(1000)])
+
+
+class RowFilterTest(unittest.TestCase):
+
+    COLUMNS = [('day', 'STRING'), ('sent', 'INT')]
+
+    def _match(self, predicates, row):
+        return RowFilter(predicates, self.COLUMNS)(row)
+
+    def numeric_comparison_test(self):
+        self.assertTrue(self._match([('sent', '>', '9')], ['x', '10']))
+        self.assertFalse(self._match([('sent', '>', 9)], ['x', '8']))
+
+    def in_test(self):
+        self.assertTrue(self._match([('day', 'in', ['mon', 'tue'])],
+                                    ['tue', '1']))
+        self.assertFalse(self._match([('day', 'in', ['mon'])], ['tue', '1']))
+
+    def nulls_never_match_test(self):
+        self.assertFalse(self._match([('sent', '!=', 1)], ['x', '']))
+        self.assertFalse(self._match([('sent', '!=', 1)], ['x', '\\N']))
+        self.assertFalse(self._match([('sent', '!=', 1)], ['x', 'ten']))
+        self.assertFalse(self._match([('sent', '!=', 1)], ['x']))
+        self.assertFalse(self._match([('day', '!=', 'mon')], ['\\N', '1']))
+
+    def empty_string_matches_test(self):
+        # unlike a numeric column, an empty STRING isn't NULL
+        self.assertTrue(self._match([('day', '!=', 'mon')], ['', '1']))
+        self.assertTrue(self._match([('day', '=', '')], ['', '1']))
+
+
+class ByteRangesTest(unittest.TestCase):
+
+    def covers_everything_test(self):
+        self.assertEqual(byte_ranges(10, 3), [(0, 4), (4, 8), (8, 10)])
+        self.assertEqual(byte_ranges(2, 4), [(0, 1), (1, 2)])
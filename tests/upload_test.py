@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import gzip
+import io
+import shutil
+import tempfile
+import unittest
+import apiarist.upload
+from apiarist.s3 import MissingDataException
+from apiarist.upload import Uploader
+from apiarist.upload import gzip_chunks
+from apiarist.upload import upload_local_input
+from apiarist.util import local_input_files
+from fake_s3 import FakeBucket, FakeS3Connection
+
+
+class UploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.bucket = FakeBucket()
+        self._get_conn = apiarist.upload.get_conn
+        apiarist.upload.get_conn = lambda *args: FakeS3Connection(
+            self.bucket)
+
+    def tearDown(self):
+        apiarist.upload.get_conn = self._get_conn
+        shutil.rmtree(self.tmp)
+
+    def _write(self, name, data):
+        path = os.path.join(self.tmp, name)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def local_input_files_test(self):
+        a = self._write('a.csv', b'1\n')
+        b = self._write('b.csv', b'2\n')
+        self._write('.hidden', b'3\n')
+        self._write('c.txt', b'4\n')
+        self.assertEqual(local_input_files(a), [a])
+        self.assertEqual(local_input_files(self.tmp),
+                         [a, b, os.path.join(self.tmp, 'c.txt')])
+        self.assertEqual(local_input_files(self.tmp + '/*.csv'), [a, b])
+
+    def gzip_chunks_test(self):
+        data = os.urandom(50000)
+        path = self._write('a.csv', data)
+        chunks = list(gzip_chunks(path, 10000))
+        self.assertTrue(len(chunks) > 1)
+        self.assertTrue(all(len(c) >= 10000 for c in chunks[:-1]))
+        unzipped = gzip.GzipFile(fileobj=io.BytesIO(b''.join(chunks))).read()
+        self.assertEqual(unzipped, data)
+
+    def small_file_single_request_test(self):
+        path = self._write('a.csv', b'a,b\n')
+        Uploader(part_size=1024).upload(path, 's3://b/up/a.csv')
+        self.assertEqual(self.bucket.objects['up/a.csv'], b'a,b\n')
+        self.assertEqual(self.bucket.completed, [])
+
+    def multipart_upload_test(self):
+        data = os.urandom(5000)
+        path = self._write('a.csv', data)
+        Uploader(part_size=1024, threads=2).upload(path, 's3://b/up/a.csv')
+        self.assertEqual(self.bucket.completed,
+                         [('up/a.csv', [1, 2, 3, 4, 5])])
+        self.assertEqual(self.bucket.objects['up/a.csv'], data)
+
+    def upload_local_input_test(self):
+        self._write('in/a.csv', b'a,b\n')
+        self._write('in/sub/ignored.csv', b'c,d\n')
+        self._write('in/b.csv', b'e,f\n')
+        counts = upload_local_input(self.tmp + '/in', 's3://b/uploads/',
+                                    's3://b/job/data/')
+        self.assertEqual(counts, (2, 0))
+        self.assertEqual(
+            sorted(name for name in self.bucket.objects
+                   if name.startswith('job/')),
+            ['job/data/00000-a.csv', 'job/data/00001-b.csv'])
+        self.assertEqual(self.bucket.objects['job/data/00001-b.csv'],
+                         b'e,f\n')
+
+    def unchanged_files_are_reused_test(self):
+        self._write('in/a.csv', b'a,b\n')
+        upload_local_input(self.tmp + '/in/*.csv', 's3://b/uploads/',
+                           's3://b/job1/data/')
+        self._write('in/b.csv', b'c,d\n')
+        counts = upload_local_input(self.tmp + '/in/*.csv', 's3://b/uploads/',
+                                    's3://b/job2/data/')
+        self.assertEqual(counts, (1, 1))
+        self.assertTrue('job2/data/00000-a.csv' in self.bucket.objects)
+
+    def compressed_upload_test(self):
+        self._write('in/a.csv', b'a,b\n')
+        upload_local_input(self.tmp + '/in', 's3://b/uploads/',
+                           's3://b/job/data/', compress=True)
+        data = self.bucket.objects['job/data/00000-a.csv.gz']
+        self.assertEqual(gzip.GzipFile(fileobj=io.BytesIO(data)).read(),
+                         b'a,b\n')
+
+    def no_input_files_test(self):
+        self.assertRaises(MissingDataException, upload_local_input,
+                          self.tmp + '/*.csv', 's3://b/uploads/',
+                          's3://b/job/data/')
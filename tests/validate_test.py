@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+import apiarist.s3
+from apiarist.script import HiveQuery
+from apiarist.validate import InputValidator
+from apiarist.validate import InvalidInputDataError
+from apiarist.validate import validate_input
+from script_test import DummyJob
+from fake_s3 import FakeBucket, FakeS3Connection
+
+COLUMNS = [('day', 'STRING'), ('sent', 'INT'), ('rate', 'DOUBLE'),
+           ('bounced', 'BOOLEAN')]
+
+
+class InputValidatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.hq = HiveQuery(DummyJob('SELECT * FROM emails', 'emails',
+                                     COLUMNS, COLUMNS))
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, name, text, opener=open):
+        path = os.path.join(self.dir, name)
+        with opener(path, 'wb') as f:
+            f.write(text.encode('utf-8'))
+        return path
+
+    def valid_file_test(self):
+        path = self._write('a.csv', '"mon",10,0.5,true\n'
+                                    '"tue, wed",,1e3,FALSE\n\n')
+        validate_input(path, self.hq)
+
+    def wrong_field_count_test(self):
+        path = self._write('a.csv', 'mon,10,0.5,true\nmon,10\n')
+        try:
+            validate_input(path, self.hq)
+        except InvalidInputDataError as e:
+            self.assertTrue('a.csv line 2: expected 4 fields, found 2'
+                            in str(e))
+        else:
+            self.fail('expected InvalidInputDataError')
+
+    def unparsable_value_test(self):
+        path = self._write('a.csv', 'mon,ten,0.5,true\n')
+        try:
+            validate_input(path, self.hq)
+        except InvalidInputDataError as e:
+            self.assertTrue("'ten' is not a valid INT for column `sent`"
+                            in str(e))
+        else:
+            self.fail('expected InvalidInputDataError')
+
+    def int_range_test(self):
+        path = self._write('a.csv', 'mon,2147483648,0.5,true\n')
+        self.assertRaises(InvalidInputDataError, validate_input, path,
+                          self.hq)
+
+    def quoted_delimiter_and_escape_test(self):
+        path = self._write('a.csv', '"a \\" quote, and comma",1,2,true\n')
+        validate_input(path, self.hq)
+
+    def directory_test(self):
+        self._write('a.csv', 'mon,1,2,true\n')
+        self._write('b.csv.gz', 'mon,1,2\n', opener=gzip.open)
+        try:
+            validate_input(self.dir, self.hq)
+        except InvalidInputDataError as e:
+            self.assertTrue('b.csv.gz line 1' in str(e))
+            self.assertFalse('a.csv line' in str(e))
+        else:
+            self.fail('expected InvalidInputDataError')
+
+    def missing_input_test(self):
+        self.assertRaises(InvalidInputDataError, validate_input,
+                          os.path.join(self.dir, 'nothing'), self.hq)
+
+    def max_errors_test(self):
+        v = InputValidator(self.hq, max_errors=2)
+        rows = [(i, ['x']) for i in range(5)]
+        self.assertEqual(len(v.validate_rows(rows, 'f')), 2)
+
+
+class S3InputValidatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.hq = HiveQuery(DummyJob('SELECT * FROM emails', 'emails',
+                                     COLUMNS, COLUMNS))
+        self.bucket = FakeBucket()
+        self._get_conn = apiarist.s3.get_conn
+        apiarist.s3.get_conn = lambda *args: FakeS3Connection(self.bucket)
+
+    def tearDown(self):
+        apiarist.s3.get_conn = self._get_conn
+
+    def _put(self, name, data):
+        self.bucket.objects[name] = data
+
+    def sample_drops_partial_line_test(self):
+        self._put('in/a.csv', b'mon,1,2,true\ntue,1,2,false\nwed,1')
+        v = InputValidator(self.hq, sample_bytes=30)
+        v.validate('s3://b/in/a.csv')
+        self.assertEqual(self.bucket.ranges['in/a.csv'],
+                         ['bytes=0-29'])
+
+    def directory_test(self):
+        self._put('in/a.csv', b'mon,1,2,true\n')
+        self._put('in/b.csv', b'mon,1,2,maybe\n')
+        try:
+            InputValidator(self.hq).validate('s3://b/in/')
+        except InvalidInputDataError as e:
+            self.assertTrue("s3://b/in/b.csv line 1: 'maybe'" in str(e))
+        else:
+            self.fail('expected InvalidInputDataError')